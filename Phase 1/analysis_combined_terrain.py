@@ -49,23 +49,15 @@ import subfunctions as sf
 import dictionary_357 as cfg
 import scipy.optimize as opt
 from scipy.special import erf
-import analysis_rolling_resistance as arr
 
 Crr_array = np.linspace(0.01,0.4,25)
 slope_array_deg = np.linspace(-10,35,25)
 
 
 CRR, SLOPE = np.meshgrid(Crr_array, slope_array_deg)
-VMAX = np.zeros(np.shape(CRR), dtype = float)
 
-N = np.shape(CRR)[0]
-for i in range(N):
-#    for j in range(N):
-#        print('a',i)
-#        print(CRR[1], SLOPE[i])
-        Crr_sample = arr.ARR(CRR[1], SLOPE[i], cfg.rover, cfg.planet)
-        #slope_sample = float(SLOPES[i,j])
-        VMAX[i] = Crr_sample  # here you put code to find the max speed at Crr_sample and slope_sample
+# terminal speed over the whole meshgrid at once (NaN where no terminal speed is reached)
+VMAX = sf.terminal_speed(cfg.rover, cfg.planet, SLOPE, CRR)
 
 
 #print(VMAX)
@@ -16,33 +16,8 @@ import scipy.optimize as opt
 from scipy.special import erf
 
 def ARR(Crr_array, theta_0, rover1, planet):
-    Ng = sf.get_gear_ratio(rover1['wheel_assembly']['speed_reducer'])
-    r_wheel = cfg.rover['wheel_assembly']['wheel']['radius']
-    F_normal = sf.get_mass(cfg.rover) * cfg.planet['g'] * np.cos(np.radians(theta_0))
-
-    V_max = np.zeros(Crr_array.shape)
-
-    for n, Crr in enumerate(Crr_array):
-        F_norm_n = float(F_normal[n])
-        r = r_wheel
-
-        def f(Vv):
-            # Vv: rover linear speed (m/s)
-            omega = Vv / r * Ng          # motor shaft speed
-            
-            Fnet = sf.F_net(np.array([omega]), np.array([theta_0[n]]), rover1, planet, Crr)
-            return (Fnet)
-            
-
-        try:
-            V_min = 0 # minimum speed to search
-            V_maximum = 1000
-            V_max[n] = sf.basic_bisection(f, V_min , V_maximum, err_max =1e-6, iter_max = 1000)
-            if V_max[n] == 1000:
-                V_max[n] = np.nan
-
-        except Exception:
-            Vroot = np.nan
+    # terminal speed for every (Crr, theta) pair from the linear motor model; NaN where no root exists
+    V_max = sf.terminal_speed(rover1, planet, theta_0, Crr_array)
     return V_max
 
 if __name__ == "__main__":
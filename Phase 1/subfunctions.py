@@ -1,5 +1,6 @@
 import numpy as np
 import math as m
+import root_finding as rf
 
 
 def get_mass(rover): # Computes the total mass of the rover. Uses information in the rover dict.
@@ -202,50 +203,166 @@ def F_net(omega, terrain_angle, rover, planet, Crr):
 
 ############################################################################################################
 def basic_bisection(fun, x1=0 , xu=2, err_max =1e-6, iter_max = 1000):
-    # INitializaiton
+    # Bisection on [x1, xu]; stops once the bracket is narrower than err_max.
+    # Returns NaN when fun(x1) and fun(xu) have the same sign.
+    # See root_finding.py for the vectorized methods and iteration/evaluation counts.
+    root, info = rf.bisection(fun, x1, xu, err_abs=err_max, iter_max=iter_max)
+    return root
+############################################################################################################
+def _F_net_batch(v, F_g, F_N, rover):
+    """
+    Net force [N] on the rover at linear speed v for arrays of terrain angles and Crr.
+    Same physics as F_net, but without the 1-D/scalar restrictions so whole meshgrids
+    can be evaluated in one call. F_g is the gravity component along the slope and
+    F_N = Crr * normal force, both precomputed per point.
+    """
+    try:
+        from scipy.special import erf as erf_vec
+    except Exception:
+        erf_vec = np.vectorize(m.erf, otypes=[float])
+
+    motor = rover['wheel_assembly']['motor']
+    Ng = get_gear_ratio(rover['wheel_assembly']['speed_reducer'])
+    r_wheel = rover['wheel_assembly']['wheel']['radius']
+
+    # tau_dcmotor is linear between stall and no-load, so clipping omega gives the same torque
+    omega = np.clip(v / r_wheel * Ng, 0, motor['speed_noload'])
+    tau = motor['torque_stall'] - (motor['torque_stall'] - motor['torque_noload'])/(motor['speed_noload'])*omega
+    F_d = tau * Ng / r_wheel * 6
+
+    # erf(40v) is exactly +/-1 in double precision once |40v| >= 6; only evaluate it below that
+    z = 40 * np.asarray(v, dtype=float)
+    erf_z = np.array(np.sign(z), dtype=float)
+    small = np.abs(z) < 6
+    erf_z[small] = erf_vec(z[small])
+    return F_d + F_g - erf_z * F_N
 
-    # actual number of iterations
-    numIter = 0
+############################################################################################################
+def terminal_speed_grid(rover, planet, slope, Crr, method='illinois', err_max=1e-6, iter_max=100):
+    """
+    Terminal (maximum) speed of the rover for whole arrays of terrain slopes and
+    rolling resistance coefficients, e.g. the SLOPE/CRR matrices from numpy.meshgrid.
+    Solves F_net(v) = 0 for every point at once with a bracketed method from
+    root_finding.py on [0, v_noload], where v_noload is the rover speed at the
+    motor no-load speed. Points with no terminal speed (rover cannot move, or
+    keeps accelerating downhill) are returned as NaN.
+    Inputs:
+      - rover: dict
+      - planet: dict with gravity in m/s^2 (key 'g')
+      - slope: terrain angle(s) in degrees, scalar or array
+      - Crr: rolling resistance coefficient(s), scalar or array broadcastable with slope
+      - method: 'illinois' (default), 'brent' or 'bisection'
+      - err_max: absolute tolerance on the speed [m/s]
+      - iter_max: maximum number of iterations
+    Outputs:
+      - VMAX: terminal speed [m/s], array with the broadcast shape of slope and Crr
+    """
+    methods = {'illinois': rf.illinois, 'brent': rf.brent, 'bisection': rf.bisection}
 
-    done = False
+    if not isinstance(rover, dict):
+        raise Exception("Error: rover must be a dictionary.")
+    if not isinstance(planet, dict):
+        raise Exception("Error: planet must be a dictionary.")
+    if method not in methods:
+        raise Exception("Error: method must be 'illinois', 'brent' or 'bisection'.")
 
-    err_est = np.nan
-    root = np.nan
-    range = xu - x1
+    th, Crr = np.broadcast_arrays(np.asarray(slope, dtype=float), np.asarray(Crr, dtype=float))
+    if not np.all((-75.0 <= th) & (th <= 75.0)):
+        raise Exception("Error: terrain_angle values must be between -75 and 75 degrees.")
+    if np.any(Crr <= 0):
+        raise Exception("Error: Crr must be positive.")
 
+    mg = get_mass(rover) * planet['g']
+    F_g = -mg * np.sin(np.radians(th))
+    F_N = Crr * mg * np.cos(np.radians(th))
+
+    # bracket: drive force is zero at and above the no-load speed
+    Ng = get_gear_ratio(rover['wheel_assembly']['speed_reducer'])
+    r_wheel = rover['wheel_assembly']['wheel']['radius']
+    v_nl = rover['wheel_assembly']['motor']['speed_noload'] / Ng * r_wheel
+
+    VMAX, info = methods[method](lambda v, F_g, F_N: _F_net_batch(v, F_g, F_N, rover),
+                                 0.0, v_nl, args=(F_g, F_N), err_abs=err_max, iter_max=iter_max)
+    return VMAX
+
+############################################################################################################
+def terminal_speed(rover, planet, slope, Crr, err_max=1e-12, iter_max=20):
+    """
+    Terminal (maximum) speed of the rover from the linear motor model.
+    Below the no-load speed the drive force is affine in v, F_d = A - B*v, gravity
+    is constant for a given slope and rolling resistance is -F_N*erf(40v), so
+        F_net(v) = A - B*v + F_g - F_N*erf(40v)
+    is decreasing and convex for v >= 0. Since 0 <= erf <= 1 the root lies in
+        [(A + F_g - F_N)/B, (A + F_g)/B]
+    and Newton's method started from the lower bound climbs monotonically onto
+    it; it usually lands in one step because erf(40v) is already 1 there.
+    Points with no terminal speed are returned as NaN, as in terminal_speed_grid.
+    Inputs:
+      - rover: dict
+      - planet: dict with gravity in m/s^2 (key 'g')
+      - slope: terrain angle(s) in degrees, scalar or array
+      - Crr: rolling resistance coefficient(s), scalar or array broadcastable with slope
+      - err_max: absolute tolerance on the Newton step [m/s]
+      - iter_max: maximum number of Newton steps
+    Outputs:
+      - v_max: terminal speed [m/s], float for scalar inputs, otherwise an array
+               with the broadcast shape of slope and Crr
+    """
+    try:
+        from scipy.special import erf as erf_vec
+    except Exception:
+        erf_vec = np.vectorize(m.erf, otypes=[float])
+
+    if not isinstance(rover, dict):
+        raise Exception("Error: rover must be a dictionary.")
+    if not isinstance(planet, dict):
+        raise Exception("Error: planet must be a dictionary.")
+
+    th, Crr = np.broadcast_arrays(np.asarray(slope, dtype=float), np.asarray(Crr, dtype=float))
+    if not np.all((-75.0 <= th) & (th <= 75.0)):
+        raise Exception("Error: terrain_angle values must be between -75 and 75 degrees.")
+    if np.any(Crr <= 0):
+        raise Exception("Error: Crr must be positive.")
+
+    # F_d = A - B*v between stall (v = 0) and no-load (v = v_nl); zero above v_nl
+    motor = rover['wheel_assembly']['motor']
+    Ng = get_gear_ratio(rover['wheel_assembly']['speed_reducer'])
+    r_wheel = rover['wheel_assembly']['wheel']['radius']
+    v_nl = motor['speed_noload'] / Ng * r_wheel
+    A = 6 * motor['torque_stall'] * Ng / r_wheel
+    B = 6 * (motor['torque_stall'] - motor['torque_noload']) * Ng / r_wheel / v_nl
+
+    mg = get_mass(rover) * planet['g']
+    F_g = -mg * np.sin(np.radians(th))
+    F_N = Crr * mg * np.cos(np.radians(th))
+
+    F_stall = A + F_g                                        # F_net(0)
+    F_top = A - B * v_nl + F_g - F_N * erf_vec(40 * v_nl)    # F_net(v_nl) on the motor curve
+    F_free = F_g - F_N * erf_vec(40 * v_nl)                  # F_net just above v_nl
+
+    # analytic bracket; Newton starts from the lower bound
+    v = np.clip((F_stall - F_N) / B, 0.0, v_nl)
+    v_hi = np.clip(F_stall / B, 0.0, v_nl)
+
+    solve = (F_stall > 0) & (F_top < 0)
+    v = np.where(solve, v, 0.0)
+    for _ in range(iter_max):
+        F = A - B * v + F_g - F_N * erf_vec(40 * v)
+        dF = -B - F_N * 80 / np.sqrt(np.pi) * np.exp(-1600 * v**2)
+        dv = np.where(solve, -F / dF, 0.0)
+        v = np.minimum(v + dv, v_hi)
+        if np.all(np.abs(dv) <= err_max):
+            break
+
+    v_max = np.where(solve, v, np.nan)
+    v_max = np.where(F_stall == 0, 0.0, v_max)
+    v_max = np.where((F_top >= 0) & (F_free < 0), v_nl, v_max)
+
+    # scalar in -> scalar out
+    if v_max.ndim == 0:
+        return float(v_max)
+    return v_max
 
-    if fun(xu) == 0:
-            root = xu
-            done = True
-            err_est = 0
-    
-    elif fun(x1) == 0:
-            root = x1
-            done = True
-            err_est = 0
-
-    # create a bisector
-    while not done:
-        numIter += 1
-
-        # find the bisector
-        average = (x1 + xu) / 2
-
-        # evaluate the function at the bisector
-        if fun(average) * fun(x1) < 0:
-            xu = average
-            if err_est < err_max or numIter == iter_max:
-                done = True
-                err_est = range / (2 ** numIter)
-                root = average
-
-        else:
-            x1 = average
-            if err_est < err_max or numIter == iter_max:
-                done = True
-                err_est = range / (2 ** numIter)
-                root = average
-    return root
 ############################################################################################################
 
 def motorW(v,rover): # v is 1D array translational velocity, rover is dictionary, calling will be w = motorW(v,rover) and returns motor speed [rad/s]
@@ -0,0 +1,336 @@
+"""
+Root finding for one or many independent scalar problems at once.
+
+Every method takes a function fun(x, *args) that is evaluated elementwise: x is
+an array holding one trial point per problem and each entry of args is a
+per-problem array (or scalar) that is broadcast against the starting points.
+Problems drop out of the working set as soon as they converge, so fun is only
+ever called on the open ones, and endpoint values are cached so each iteration
+costs exactly one function evaluation per open problem.
+
+Convergence is declared when the error estimate is <= err_abs + err_rel*|x|
+(or when fun hits exactly zero).
+
+Every method returns (root, info) where info is a dict with
+  - 'iterations': iterations used by each problem
+  - 'converged':  True where the tolerance was met
+  - 'err_est':    final error estimate of each root
+  - 'fevals':     total number of scalar function evaluations
+  - 'calls':      number of (vectorized) calls to fun
+Scalar inputs give a float root and scalar entries in info; otherwise the
+outputs have the broadcast shape of the inputs. Brackets without a sign
+change (and non-finite secant steps) return NaN with converged = False.
+"""
+import numpy as np
+
+EPS = np.finfo(float).eps
+
+
+def _prepare(points, args):
+    # broadcast starting points and per-problem args to one flat problem axis
+    arrays = np.broadcast_arrays(*[np.asarray(p, dtype=float) for p in points],
+                                 *[np.asarray(a) for a in args])
+    shape = arrays[0].shape
+    flat = [np.array(a).reshape(-1) for a in arrays]
+    return flat[:len(points)], flat[len(points):], shape
+
+
+def _evaluate(fun, x, args, scalar, info):
+    info['calls'] += 1
+    info['fevals'] += x.size
+    if scalar:
+        return np.array([float(fun(float(x[0]), *[a[0] for a in args]))])
+    return np.asarray(fun(x, *args), dtype=float).reshape(x.shape)
+
+
+def _tolerance(x, err_abs, err_rel):
+    return err_abs + err_rel * np.abs(x)
+
+
+def _start(n):
+    out = {'root': np.full(n, np.nan),
+           'iterations': np.zeros(n, dtype=int),
+           'converged': np.zeros(n, dtype=bool),
+           'err_est': np.full(n, np.nan)}
+    info = {'fevals': 0, 'calls': 0}
+    return out, info
+
+
+def _bracket(out, xl, xu, fl, fu):
+    # resolve endpoint roots and brackets without a sign change; returns the open problems
+    out['root'] = np.where(fl == 0, xl, np.where(fu == 0, xu, np.nan))
+    hit = (fl == 0) | (fu == 0)
+    out['converged'][hit] = True
+    out['err_est'][hit] = 0.0
+    return np.flatnonzero(~hit & (np.sign(fl) != np.sign(fu)))
+
+
+def _finish(out, info, shape):
+    if len(shape) == 0:
+        info['iterations'] = int(out['iterations'][0])
+        info['converged'] = bool(out['converged'][0])
+        info['err_est'] = float(out['err_est'][0])
+        return float(out['root'][0]), info
+    for key in ('iterations', 'converged', 'err_est'):
+        info[key] = out[key].reshape(shape)
+    return out['root'].reshape(shape), info
+
+
+def bisection(fun, xl, xu, args=(), err_abs=1e-6, err_rel=0.0, iter_max=100):
+    """
+    Bisection on the brackets [xl, xu].
+    Inputs:
+      - fun: function fun(x, *args), elementwise in x
+      - xl, xu: bracket end points (scalars or arrays)
+      - args: tuple of per-problem arrays passed on to fun
+      - err_abs, err_rel: absolute and relative tolerance on the root
+      - iter_max: maximum number of iterations
+    Outputs:
+      - root, info (see module docstring); err_est is the final bracket width
+    """
+    (xl, xu), args, shape = _prepare((xl, xu), args)
+    scalar = len(shape) == 0
+    out, info = _start(xl.size)
+
+    fl = _evaluate(fun, xl, args, scalar, info)
+    fu = _evaluate(fun, xu, args, scalar, info)
+    idx = _bracket(out, xl, xu, fl, fu)
+    xl, xu, fl = xl[idx], xu[idx], fl[idx]
+    args = [a[idx] for a in args]
+
+    for k in range(1, iter_max + 1):
+        if idx.size == 0:
+            break
+        xm = 0.5 * (xl + xu)
+        fm = _evaluate(fun, xm, args, scalar, info)
+
+        up = np.sign(fm) == np.sign(fl)    # root lies in [xm, xu]
+        xl = np.where(up, xm, xl)
+        fl = np.where(up, fm, fl)
+        xu = np.where(up, xu, xm)
+
+        err = np.where(fm == 0, 0.0, np.abs(xu - xl))
+        out['root'][idx] = xm
+        out['err_est'][idx] = err
+        out['iterations'][idx] = k
+
+        done = err <= _tolerance(xm, err_abs, err_rel)
+        out['converged'][idx[done]] = True
+        keep = ~done
+        idx, xl, xu, fl = idx[keep], xl[keep], xu[keep], fl[keep]
+        args = [a[keep] for a in args]
+
+    return _finish(out, info, shape)
+
+
+def illinois(fun, xl, xu, args=(), err_abs=1e-6, err_rel=0.0, iter_max=100):
+    """
+    Illinois (modified false position) on the brackets [xl, xu]. The function
+    value at an end point that is kept twice in a row is halved, which avoids
+    the one-sided convergence of plain false position.
+    Inputs:
+      - fun: function fun(x, *args), elementwise in x
+      - xl, xu: bracket end points (scalars or arrays)
+      - args: tuple of per-problem arrays passed on to fun
+      - err_abs, err_rel: absolute and relative tolerance on the root
+      - iter_max: maximum number of iterations
+    Outputs:
+      - root, info (see module docstring); err_est is the change between
+        successive iterates (or the bracket width if smaller)
+    """
+    (xl, xu), args, shape = _prepare((xl, xu), args)
+    scalar = len(shape) == 0
+    out, info = _start(xl.size)
+
+    fl = _evaluate(fun, xl, args, scalar, info)
+    fu = _evaluate(fun, xu, args, scalar, info)
+    idx = _bracket(out, xl, xu, fl, fu)
+    xl, xu, fl, fu = xl[idx], xu[idx], fl[idx], fu[idx]
+    args = [a[idx] for a in args]
+    side = np.zeros(idx.size, dtype=int)    # +1: xu kept last time, -1: xl kept last time
+    x_old = np.full(idx.size, np.inf)
+
+    for k in range(1, iter_max + 1):
+        if idx.size == 0:
+            break
+        xr = xu - fu * (xu - xl) / (fu - fl)
+        fr = _evaluate(fun, xr, args, scalar, info)
+
+        up = np.sign(fr) == np.sign(fl)    # root lies in [xr, xu]
+        fu = np.where(up & (side == 1), 0.5 * fu, fu)
+        fl = np.where(~up & (side == -1), 0.5 * fl, fl)
+        side = np.where(up, 1, -1)
+        xl = np.where(up, xr, xl)
+        fl = np.where(up, fr, fl)
+        xu = np.where(up, xu, xr)
+        fu = np.where(up, fu, fr)
+
+        err = np.where(fr == 0, 0.0, np.minimum(np.abs(xr - x_old), np.abs(xu - xl)))
+        x_old = xr
+        out['root'][idx] = xr
+        out['err_est'][idx] = err
+        out['iterations'][idx] = k
+
+        done = err <= _tolerance(xr, err_abs, err_rel)
+        out['converged'][idx[done]] = True
+        keep = ~done
+        idx, xl, xu, fl, fu = idx[keep], xl[keep], xu[keep], fl[keep], fu[keep]
+        side, x_old = side[keep], x_old[keep]
+        args = [a[keep] for a in args]
+
+    return _finish(out, info, shape)
+
+
+def secant(fun, x0, x1, args=(), err_abs=1e-6, err_rel=0.0, iter_max=100):
+    """
+    Secant method from the two starting points x0 and x1 (no bracket needed,
+    so convergence is not guaranteed). A problem stops without converging if
+    the secant becomes flat or the iterate is no longer finite.
+    Inputs:
+      - fun: function fun(x, *args), elementwise in x
+      - x0, x1: starting points (scalars or arrays)
+      - args: tuple of per-problem arrays passed on to fun
+      - err_abs, err_rel: absolute and relative tolerance on the root
+      - iter_max: maximum number of iterations
+    Outputs:
+      - root, info (see module docstring); err_est is the last step length
+    """
+    (x0, x1), args, shape = _prepare((x0, x1), args)
+    scalar = len(shape) == 0
+    out, info = _start(x0.size)
+
+    f0 = _evaluate(fun, x0, args, scalar, info)
+    f1 = _evaluate(fun, x1, args, scalar, info)
+    out['root'] = x1.copy()
+    hit = f1 == 0
+    out['converged'][hit] = True
+    out['err_est'][hit] = 0.0
+    idx = np.flatnonzero(~hit)
+    x0, x1, f0, f1 = x0[idx], x1[idx], f0[idx], f1[idx]
+    args = [a[idx] for a in args]
+
+    for k in range(1, iter_max + 1):
+        if idx.size == 0:
+            break
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x2 = x1 - f1 * (x1 - x0) / (f1 - f0)
+        failed = ~np.isfinite(x2)
+        x2 = np.where(failed, x1, x2)
+        f2 = _evaluate(fun, x2, args, scalar, info)
+
+        err = np.where(f2 == 0, 0.0, np.abs(x2 - x1))
+        out['root'][idx] = x2
+        out['err_est'][idx] = err
+        out['iterations'][idx] = k
+
+        done = ~failed & (err <= _tolerance(x2, err_abs, err_rel))
+        out['converged'][idx[done]] = True
+        keep = ~done & ~failed
+        x0, f0, x1, f1 = x1, f1, x2, f2
+        idx, x0, x1, f0, f1 = idx[keep], x0[keep], x1[keep], f0[keep], f1[keep]
+        args = [a[keep] for a in args]
+
+    return _finish(out, info, shape)
+
+
+def brent(fun, xl, xu, args=(), err_abs=1e-6, err_rel=0.0, iter_max=100):
+    """
+    Brent's method (Brent-Dekker zeroin) on the brackets [xl, xu]: inverse
+    quadratic interpolation or secant steps where they behave, bisection
+    where they do not, so it never does worse than bisection.
+    Inputs:
+      - fun: function fun(x, *args), elementwise in x
+      - xl, xu: bracket end points (scalars or arrays)
+      - args: tuple of per-problem arrays passed on to fun
+      - err_abs, err_rel: absolute and relative tolerance on the root
+      - iter_max: maximum number of iterations
+    Outputs:
+      - root, info (see module docstring); err_est is the final bracket width
+    """
+    (a, b), args, shape = _prepare((xl, xu), args)
+    scalar = len(shape) == 0
+    out, info = _start(a.size)
+
+    fa = _evaluate(fun, a, args, scalar, info)
+    fb = _evaluate(fun, b, args, scalar, info)
+    idx = _bracket(out, a, b, fa, fb)
+    a, b, fa, fb = a[idx], b[idx], fa[idx], fb[idx]
+    args = [v[idx] for v in args]
+    c, fc = a.copy(), fa.copy()
+    d = b - a
+    e = d.copy()
+
+    for k in range(1, iter_max + 1):
+        if idx.size == 0:
+            break
+        # keep the root between b and c, with b the best estimate
+        new_c = np.sign(fb) == np.sign(fc)
+        c = np.where(new_c, a, c)
+        fc = np.where(new_c, fa, fc)
+        d = np.where(new_c, b - a, d)
+        e = np.where(new_c, b - a, e)
+        swap = np.abs(fc) < np.abs(fb)
+        a, fa = np.where(swap, b, a), np.where(swap, fb, fa)
+        b, fb = np.where(swap, c, b), np.where(swap, fc, fb)
+        c, fc = np.where(swap, a, c), np.where(swap, fa, fc)
+
+        tol = 2 * EPS * np.abs(b) + 0.5 * _tolerance(b, err_abs, err_rel)
+        xm = 0.5 * (c - b)
+
+        out['root'][idx] = b
+        out['err_est'][idx] = np.where(fb == 0, 0.0, np.abs(c - b))
+        out['iterations'][idx] = k - 1
+        done = (np.abs(xm) <= tol) | (fb == 0)
+        out['converged'][idx[done]] = True
+        keep = ~done
+        idx, a, b, c, fa, fb, fc = idx[keep], a[keep], b[keep], c[keep], fa[keep], fb[keep], fc[keep]
+        d, e, tol, xm = d[keep], e[keep], tol[keep], xm[keep]
+        args = [v[keep] for v in args]
+        if idx.size == 0:
+            break
+
+        # interpolation step (secant if a == c, inverse quadratic otherwise)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = fb / fa
+            q_ = fa / fc
+            r = fb / fc
+            linear = a == c
+            p = np.where(linear, 2 * xm * s, s * (2 * xm * q_ * (q_ - r) - (b - a) * (r - 1)))
+            q = np.where(linear, 1 - s, (q_ - 1) * (r - 1) * (s - 1))
+        q = np.where(p > 0, -q, q)
+        p = np.abs(p)
+        interp = (np.abs(e) >= tol) & (np.abs(fa) > np.abs(fb)) \
+            & (2 * p < np.minimum(3 * xm * q - np.abs(tol * q), np.abs(e * q)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d_new = np.where(interp, p / q, xm)
+        e = np.where(interp, d, xm)
+        d = d_new
+
+        a, fa = b, fb
+        b = b + np.where(np.abs(d) > tol, d, np.where(xm > 0, tol, -tol))
+        fb = _evaluate(fun, b, args, scalar, info)
+
+    # problems that ran out of iterations report the last iterate
+    out['root'][idx] = b
+    out['err_est'][idx] = np.abs(c - b)
+    out['iterations'][idx] = iter_max
+
+    return _finish(out, info, shape)
+
+
+if __name__ == '__main__':
+    # compare the methods on 10000 problems x**3 = c
+    c = np.linspace(1, 100, 10000)
+    f = lambda x, c: x**3 - c
+    for name, method in (('bisection', bisection), ('illinois', illinois), ('brent', brent)):
+        root, info = method(f, 0.0, 5.0, args=(c,), err_abs=1e-10)
+        print('%-10s max err %.1e  max iter %3d  fevals %7d  calls %3d' % (
+            name, np.max(np.abs(root - np.cbrt(c))), info['iterations'].max(), info['fevals'], info['calls']))
+    root, info = secant(f, 4.0, 5.0, args=(c,), err_abs=1e-10)
+    print('%-10s max err %.1e  max iter %3d  fevals %7d  calls %3d' % (
+        'secant', np.max(np.abs(root - np.cbrt(c))), info['iterations'].max(), info['fevals'], info['calls']))
+
+    # the bracket may be given in either order
+    for name, method in (('bisection', bisection), ('illinois', illinois), ('brent', brent)):
+        root, info = method(np.cos, 3.0, 0.0, err_abs=1e-10)
+        print('%-10s reversed bracket: root %.10f  converged %s' % (name, root, info['converged']))
@@ -2,6 +2,9 @@
 from asyncio import events
 import numpy as np
 import math as m
+import bisect
+import root_finding as rf
+import hashlib
 import scipy.interpolate as sp
 # PART 1 SUBFUNCTIONS BELOW 
 ############################################################################################################
@@ -205,49 +208,10 @@ def F_net(omega, terrain_angle, rover, planet, Crr):
 
 ############################################################################################################
 def basic_bisection(fun, x1=0 , xu=2, err_max =1e-6, iter_max = 1000):
-    # INitializaiton
-
-    # actual number of iterations
-    numIter = 0
-
-    done = False
-
-    err_est = np.nan
-    root = np.nan
-    range = xu - x1
-
-
-    if fun(xu) == 0:
-            root = xu
-            done = True
-            err_est = 0
-    
-    elif fun(x1) == 0:
-            root = x1
-            done = True
-            err_est = 0
-
-    # create a bisector
-    while not done:
-        numIter += 1
-
-        # find the bisector
-        average = (x1 + xu) / 2
-
-        # evaluate the function at the bisector
-        if fun(average) * fun(x1) < 0:
-            xu = average
-            if err_est < err_max or numIter == iter_max:
-                done = True
-                err_est = range / (2 ** numIter)
-                root = average
-
-        else:
-            x1 = average
-            if err_est < err_max or numIter == iter_max:
-                done = True
-                err_est = range / (2 ** numIter)
-                root = average
+    # Bisection on [x1, xu]; stops once the bracket is narrower than err_max.
+    # Returns NaN when fun(x1) and fun(xu) have the same sign.
+    # See root_finding.py for the vectorized methods and iteration/evaluation counts.
+    root, info = rf.bisection(fun, x1, xu, err_abs=err_max, iter_max=iter_max)
     return root
 ############################################################################################################
 
@@ -278,16 +242,70 @@ def motorW(v,rover): # v is 1D array translational velocity, rover is dictionary
 
 ############################################################################################################
 
-def rover_dynamics(t, y, rover, planet, experiment): 
+def define_terrain_profile(experiment): #builds the terrain angle spline once for an experiment
+    """
+    Builds the terrain angle profile for an experiment.
+    Same not-a-knot cubic spline as interp1d(alpha_dist, alpha_deg, kind='cubic',
+    fill_value='extrapolate'), stored as breakpoints and per-segment cubic
+    coefficients so it can be evaluated many times without being rebuilt.
+    Returns a terrain dictionary for terrain_angle.
+    """
+    if not isinstance(experiment, dict):
+        raise Exception("Error: 'experiment' must be a dictionary.")
+
+    # get experiment data
+    try:
+        alpha_dist = np.asarray(experiment['alpha_dist'], dtype=float)
+        alpha_deg  = np.asarray(experiment['alpha_deg'],  dtype=float)
+    except KeyError as e:
+        raise Exception(f"Error: experiment missing key {e!s} ('alpha_dist' and 'alpha_deg' required).")
+
+    if alpha_dist.ndim != 1 or alpha_deg.ndim != 1 or alpha_dist.size != alpha_deg.size:
+        raise Exception("Error: alpha_dist and alpha_deg must be 1D arrays of equal length.")
+    if alpha_dist.size < 4:
+        raise Exception("Error: at least 4 terrain points are needed for a cubic terrain profile.")
+
+    spline = sp.CubicSpline(alpha_dist, alpha_deg, bc_type='not-a-knot', extrapolate=True)
+    c = spline.c # c[k,i] multiplies (x - x_i)**(3-k) on segment i
+
+    return {'breaks': alpha_dist,
+            'coeffs': c,
+            'breaks_list': alpha_dist.tolist(), # plain lists are faster for scalar lookups
+            'coeffs_list': list(zip(c[0].tolist(), c[1].tolist(), c[2].tolist(), c[3].tolist()))}
+
+def terrain_angle(terrain, x): #returns the terrain angle [deg] at position x [m] from a terrain profile
+    """
+    Evaluates a terrain profile from define_terrain_profile at position x [m].
+    Scalar x uses a binary search over the breakpoints; arrays are evaluated in one pass.
+    Returns the terrain angle [deg].
+    """
+    if isinstance(x, np.ndarray) and x.ndim > 0:
+        breaks = terrain['breaks']
+        c = terrain['coeffs']
+        i = np.clip(np.searchsorted(breaks, x, side='right') - 1, 0, len(breaks) - 2)
+        dx = x - breaks[i]
+        return ((c[0, i]*dx + c[1, i])*dx + c[2, i])*dx + c[3, i]
+
+    x = float(x)
+    breaks = terrain['breaks_list']
+    i = min(max(bisect.bisect_right(breaks, x) - 1, 0), len(breaks) - 2)
+    c0, c1, c2, c3 = terrain['coeffs_list'][i]
+    dx = x - breaks[i]
+    return ((c0*dx + c1)*dx + c2)*dx + c3
+
+############################################################################################################
+
+def rover_dynamics(t, y, rover, planet, experiment, terrain=None): 
     """
     Compute state derivative for the rover.
       y[0] = velocity [m/s]
       y[1] = position [m]
+    terrain is an optional profile from define_terrain_profile; it is built
+    from experiment when not given.
     Returns:
       dydt[0] = acceleration [m/s^2]
       dydt[1] = velocity [m/s]
     """
-    from scipy.interpolate import interp1d
 
     # validate y
     y_arr = np.asarray(y, dtype=float).reshape(-1)
@@ -303,15 +321,9 @@ def rover_dynamics(t, y, rover, planet, experiment):
     if not isinstance(experiment, dict):
         raise Exception("Error: 'experiment' must be a dictionary.")
 
-    # get experiment data
-    try:
-        alpha_dist = np.asarray(experiment['alpha_dist'], dtype=float)
-        alpha_deg  = np.asarray(experiment['alpha_deg'],  dtype=float)
-    except KeyError as e:
-        raise Exception(f"Error: experiment missing key {e!s} ('alpha_dist' and 'alpha_deg' required).")
-
-    if alpha_dist.ndim != 1 or alpha_deg.ndim != 1 or alpha_dist.size != alpha_deg.size:
-        raise Exception("Error: alpha_dist and alpha_deg must be 1D arrays of equal length.")
+    # terrain profile (built here only if the caller did not precompute it)
+    if terrain is None:
+        terrain = define_terrain_profile(experiment)
 
     # Rolling resistance coefficient
     if 'Crr' not in experiment:
@@ -321,8 +333,7 @@ def rover_dynamics(t, y, rover, planet, experiment):
         raise Exception("Error: 'Crr' must be a positive scalar.")
 
     # terrain angle at current position (degrees)
-    alpha_fun = interp1d(alpha_dist, alpha_deg, kind='cubic', fill_value='extrapolate')
-    terrain_angle_deg = float(alpha_fun(x))
+    terrain_angle_deg = terrain_angle(terrain, x)
 
     # dynamics: compute motor speed, forces, acceleration
     omega = motorW(v, rover)  # [rad/s], uses your get_gear_ratio & wheel radius
@@ -335,6 +346,90 @@ def rover_dynamics(t, y, rover, planet, experiment):
 
 ############################################################################################################
 
+def compile_rover(rover, planet, experiment): #validates the inputs once and flattens them for rover_dynamics_fast
+    """
+    Validates rover, planet and experiment once and flattens the values the
+    rover dynamics need into one dictionary of scalars:
+      m, Ng, r, tau_s, tau_nl, omega_nl, g, Crr
+    Returns the parameter dictionary used by rover_dynamics_fast.
+    """
+    # validate dicts
+    if not isinstance(rover, dict):
+        raise Exception("Error: 'rover' must be a dictionary.")
+    if not isinstance(planet, dict):
+        raise Exception("Error: 'planet' must be a dictionary.")
+    if not isinstance(experiment, dict):
+        raise Exception("Error: 'experiment' must be a dictionary.")
+
+    # Rolling resistance coefficient
+    if 'Crr' not in experiment:
+        raise Exception("Error: experiment must include 'Crr' (rolling resistance coefficient).")
+    Crr = float(experiment['Crr'])
+    if Crr <= 0:
+        raise Exception("Error: 'Crr' must be a positive scalar.")
+
+    # terrain angle range (checked per call in F_net otherwise)
+    if not np.all(np.abs(np.asarray(experiment['alpha_deg'], dtype=float)) <= 75.0):
+        raise Exception("Error: terrain_angle values must be between -75 and 75 degrees.")
+
+    # gravity, same lookup as F_gravity
+    if 'gravity' in planet:
+        g = planet['gravity']
+    elif 'g' in planet:
+        g = planet['g']
+    else:
+        raise Exception("Error: planet dictionary must include 'gravity' (m/s^2).")
+
+    motor = rover['wheel_assembly']['motor']
+    r = rover['wheel_assembly']['wheel']['radius']
+    if r <= 0:
+        raise Exception("Error: wheel radius must be positive.")
+    if motor['speed_noload'] <= 0:
+        raise Exception("Error: motor 'speed_noload' must be positive.")
+
+    return {'m': get_mass(rover),
+            'Ng': get_gear_ratio(rover['wheel_assembly']['speed_reducer']),
+            'r': r,
+            'tau_s': motor['torque_stall'],
+            'tau_nl': motor['torque_noload'],
+            'omega_nl': motor['speed_noload'],
+            'g': g,
+            'Crr': Crr}
+
+def rover_dynamics_fast(t, y, params, terrain): #rover_dynamics on a compiled parameter dictionary, without per-call checks
+    """
+    Same model as rover_dynamics (F_drive + F_gravity + F_rolling) evaluated on
+    scalars from compile_rover and a terrain profile from define_terrain_profile.
+    Inputs are not checked here; compile_rover has already validated them.
+    Returns:
+      dydt[0] = acceleration [m/s^2]
+      dydt[1] = velocity [m/s]
+    """
+    v = y[0]
+    m_rover = params['m']
+    g = params['g']
+    Ng = params['Ng']
+    r = params['r']
+
+    # motor torque from the speed-torque curve
+    omega = v / r * Ng
+    if omega > params['omega_nl']:
+        tau = 0.0
+    elif omega < 0:
+        tau = params['tau_s']
+    else:
+        tau = params['tau_s'] - (params['tau_s'] - params['tau_nl'])/params['omega_nl']*omega
+
+    theta = m.radians(terrain_angle(terrain, y[1]))
+
+    F_d = tau * Ng / r * 6
+    F_g = -m_rover * g * m.sin(theta)
+    F_r = -m.erf(40 * v) * params['Crr'] * m_rover * g * m.cos(theta)
+
+    return np.array([(F_d + F_g + F_r) / m_rover, v])
+
+############################################################################################################
+
 def mechpower(v, rover): #computes the mechanical power output of the rover's drive system given velocity v [m/s] and rover dictionary
     """
     Computes the mechanical power output of the rover's drive system given velocity v [m/s] and rover dictionary.
@@ -352,6 +447,37 @@ def mechpower(v, rover): #computes the mechanical power output of the rover's dr
     P_mech = torque_motor * motorw 
     return P_mech # [W] for one wheel
 
+# motor efficiency maps built so far, keyed by motor type and a fingerprint of their data
+_EFFICIENCY_MAPS = {}
+
+def get_efficiency_map(motor): #returns the (cached) efficiency map of a motor
+    """
+    Returns the efficiency map of a motor, building it only the first time a
+    motor type/data combination is seen. The map holds:
+      'effcy'       efficiency vs. torque cubic spline (same fit battenergy used to
+                    build with interp1d on every call)
+    The registry key includes the efficiency data, so edited motors get their
+    own map.
+    """
+    if not isinstance(motor, dict):
+        raise Exception("Error: 'motor' must be a dictionary.")
+
+    effcy_tau = np.asarray(motor['effcy_tau'], dtype=float).ravel()
+    effcy = np.asarray(motor['effcy'], dtype=float).ravel()
+
+    data = hashlib.sha1(effcy_tau.tobytes() + effcy.tobytes()).hexdigest()
+    key = (motor.get('type', 'custom'), data)
+    if key in _EFFICIENCY_MAPS:
+        return _EFFICIENCY_MAPS[key]
+
+    if effcy_tau.size != effcy.size:
+        raise Exception("Error: 'effcy_tau' and 'effcy' must be the same length.")
+
+    effcy_map = {'type': key[0],
+                 'effcy': sp.CubicSpline(effcy_tau, effcy, bc_type='not-a-knot', extrapolate=True)}
+    _EFFICIENCY_MAPS[key] = effcy_map
+    return effcy_map
+
 def battenergy(t,v,rover): #computes the total battery energy consumed over time t [s] given velocity v [m/s] and rover dictionary
     """
     Computes the total battery energy consumed over time t [s] 
@@ -379,10 +505,8 @@ def battenergy(t,v,rover): #computes the total battery energy consumed over time
     omega = motorW(v, rover)
     tau = tau_dcmotor(omega, rover['wheel_assembly']['motor'])
 
-    #efficiency interpolation function for torque
-    effcy_tau = rover['wheel_assembly']['motor']['effcy_tau']
-    effcy_vals = rover['wheel_assembly']['motor']['effcy']
-    effcy_fun = sp.interp1d(effcy_tau, effcy_vals, kind='cubic', fill_value="extrapolate")
+    #efficiency interpolation function for torque (built once per motor)
+    effcy_fun = get_efficiency_map(rover['wheel_assembly']['motor'])['effcy']
     eta = effcy_fun(tau)
 
     # Integrate electrical power over time to get battery energy consumed
@@ -453,8 +577,12 @@ def simulate_rover(rover, planet, experiment, end_event):
         raise Exception("Error: initial_conditions must be a 1D array of length 2.")
     # define end of mission events
     events = end_of_mission_event(end_event)
+    # terrain spline is built once per mission, not on every derivative evaluation
+    terrain = define_terrain_profile(experiment)
+    # validate and flatten the rover once; the RHS below does no dict lookups or checks
+    params = compile_rover(rover, planet, experiment)
     # integrate equations of motion
-    sol = solve_ivp(fun=lambda t,y: rover_dynamics(t,y,rover,planet,experiment),
+    sol = solve_ivp(fun=lambda t,y: rover_dynamics_fast(t,y,params,terrain),
                     t_span=(time_range[0], time_range[1]),
                     y0=initial_conditions,
                     method='BDF',
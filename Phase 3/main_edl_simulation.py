@@ -66,8 +66,8 @@ axs[6].grid()
 plot2 = plt.figure(1)
 fig2, axs2 = plt.subplots(2)
 plt.tight_layout()
-sky_crane_hover_pos = Y[1, :]
-sky_crane_speed = Y[0, :]
+sky_crane_hover_pos = Y[1, :].copy()   # Y is read-only, and masking should
+sky_crane_speed = Y[0, :].copy()       # not overwrite the trajectory anyway
 ignore_indices = sky_crane_hover_pos>2*20
 sky_crane_hover_pos[ignore_indices] = np.NaN 
 sky_crane_speed[ignore_indices] = np.NaN  
@@ -10,6 +10,7 @@ from scipy.interpolate import interp1d
 import matplotlib.pyplot as plt
 from scipy.interpolate import PchipInterpolator as pchip
 from scipy.integrate import solve_ivp
+import bisect
 
 
 def get_mass_rover(edl_system):
@@ -85,17 +86,122 @@ def F_buoyancy_descent(edl_system,planet,altitude):
     
     return F
 
+# *************************************
+# Aerodynamic tables
+#
+# The speed of sound and Mach efficiency tables are built once, here, rather
+# than on every drag evaluation. A planet can supply its own speed of sound
+# table as planet['speed_of_sound'] and a parachute its own Mach efficiency 
+# table as parachute['mach_efficiency'] (built with the define_* functions 
+# below); otherwise the Mars tables are used.
+
+# Speed of sound on Mars [m/s] vs. altitude [m]
+SPD_data = np.array([[0, 244.4], 
+                     [1000, 243.7], 
+                     [2000, 243.2],
+                     [3000, 242.7], 
+                     [4000, 242.2], 
+                     [5000, 241.7],
+                     [6000, 241.2], 
+                     [7000, 240.7], 
+                     [8000, 239.6],
+                     [9000, 238.4], 
+                     [10000, 237.3], 
+                     [11000, 236.1],
+                     [12000, 235.0], 
+                     [13000, 233.8], 
+                     [14000, 232.6]])
+
+# Parachute Mach efficiency factor (multiplies Cd) vs. Mach number
+MEF_data = np.array([[0.25, 1.0], [0.5, 1.0], [0.65, 1.0], [0.7, 0.97],
+                     [0.8, 0.91], [0.9, 0.72], [0.95, 0.66], [1.0, 0.75],
+                     [1.1, 0.90], [1.2, 0.96], [1.3, 0.99], [1.4, 0.999],
+                     [1.5, 0.992], [1.6, 0.98], [1.8, 0.91], [1.9, 0.85],
+                     [2.0, 0.82], [2.2, 0.75], [2.5, 0.64], [2.6, 0.62]])
+
+def define_speed_of_sound_table(altitude, v_sound):
+    
+    # Builds a speed of sound table from altitude [m] and speed of sound [m/s]
+    # samples. The pchip fit is built once and stored as per-segment cubic 
+    # coefficients, so lookups are a binary search and a polynomial 
+    # evaluation (values identical to evaluating the pchip, including its 
+    # extrapolation outside the table).
+    
+    altitude = np.asarray(altitude, dtype=float).ravel()
+    v_sound = np.asarray(v_sound, dtype=float).ravel()
+    
+    if len(altitude) != len(v_sound) or len(altitude) < 2:
+        raise Exception('define_speed_of_sound_table: altitude and v_sound must be the same size (at least 2 points)')
+    
+    c = pchip(altitude, v_sound).c # c[k,i] multiplies (a - a_i)**(3-k) on segment i
+    
+    table = {'altitude' : altitude,
+             'v_sound' : v_sound,
+             'breaks' : altitude,
+             'coeffs' : c,
+             'breaks_list' : altitude.tolist(),
+             'coeffs_list' : list(zip(c[0].tolist(), c[1].tolist(), c[2].tolist(), c[3].tolist()))}
+    
+    return table
+
+def define_mach_efficiency_table(mach, mef):
+    
+    # Builds a Mach efficiency table from Mach number and efficiency factor
+    # samples. Lookups interpolate linearly and hold the end values outside 
+    # the table (np.interp).
+    
+    mach = np.asarray(mach, dtype=float).ravel()
+    mef = np.asarray(mef, dtype=float).ravel()
+    
+    if len(mach) != len(mef) or len(mach) < 2:
+        raise Exception('define_mach_efficiency_table: mach and mef must be the same size (at least 2 points)')
+    
+    table = {'mach' : mach,
+             'mef' : mef}
+    
+    return table
+
+def speed_of_sound(table, altitude):
+    
+    # Speed of sound [m/s] at altitude [m] from a speed of sound table. 
+    # Accepts a scalar or a numpy array of altitudes.
+    
+    if isinstance(altitude, np.ndarray) and altitude.ndim > 0:
+        breaks = table['breaks']
+        c = table['coeffs']
+        i = np.clip(np.searchsorted(breaks, altitude, side='right') - 1, 0, len(breaks) - 2)
+        da = altitude - breaks[i]
+        return ((c[0, i]*da + c[1, i])*da + c[2, i])*da + c[3, i]
+    
+    altitude = float(altitude)
+    breaks = table['breaks_list']
+    i = min(max(bisect.bisect_right(breaks, altitude) - 1, 0), len(breaks) - 2)
+    c0, c1, c2, c3 = table['coeffs_list'][i]
+    da = altitude - breaks[i]
+    
+    return ((c0*da + c1)*da + c2)*da + c3
+
+def mach_efficiency(table, M):
+    
+    # Mach efficiency factor at Mach number M from a Mach efficiency table.
+    # Accepts a scalar or a numpy array of Mach numbers.
+    
+    return np.interp(M, table['mach'], table['mef'])
+
+MARS_SPEED_OF_SOUND = define_speed_of_sound_table(SPD_data[:, 0], SPD_data[:, 1])
+PARACHUTE_MACH_EFFICIENCY = define_mach_efficiency_table(MEF_data[:, 0], MEF_data[:, 1])
+
 # *************************************
 # New function using mach efficiency
-# New function using mach efficiency
-def MEF_from_Mach(M):
-    Mach_numbers = np.array([0.25, 0.5, 0.65, 0.7, 0.8, 0.9, 0.95,
-                          1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 1.6,
-                          1.8, 1.9, 2.0, 2.2, 2.5, 2.6])
-    MEF_data = np.array([1.0, 1.0, 1.0, 0.97, 0.91, 0.72, 0.66,
-                          0.75, 0.90, 0.96, 0.99, 0.999, 0.992,
-                          0.98,  0.91, 0.85, 0.82, 0.75, 0.64, 0.62])
-    MEF = np.interp(M, Mach_numbers, MEF_data)
+def MEF_from_Mach(M, table=None):
+    
+    # Parachute Mach efficiency factor at Mach number M. Uses the default 
+    # parachute table unless another Mach efficiency table is given.
+    
+    if table is None:
+        table = PARACHUTE_MACH_EFFICIENCY
+    
+    MEF = mach_efficiency(table, M)
     return MEF
 
 def F_drag_descent(edl_system,planet,altitude,velocity):
@@ -108,9 +214,11 @@ def F_drag_descent(edl_system,planet,altitude,velocity):
     # bit is area*Cd, which we'll figure out below.
     rhov2=0.5*density*velocity**2
 
-    # We will consider the mach number, and modify CD
-    M = v2M_Mars(abs(velocity),altitude)
-    MEF = MEF_from_Mach(M)
+    # We will consider the mach number, and modify CD (planet and parachute
+    # may carry their own tables, see define_speed_of_sound_table and 
+    # define_mach_efficiency_table)
+    M = v2M_Mars(abs(velocity),altitude,planet.get('speed_of_sound'))
+    MEF = MEF_from_Mach(M,edl_system['parachute'].get('mach_efficiency'))
     Cd_mod = edl_system['parachute']['Cd']*MEF
     # *************************************
     # Determine which part(s) of the EDL system are contributing to drag
@@ -144,48 +252,109 @@ def F_gravity_descent(edl_system,planet):
 
     return F
 
-def v2M_Mars(v, a):
+def v2M_Mars(v, a, table=None):
     # Converts descent speed, v [m/s], to Mach number on Mars as a function of 
     # altitude, a [m].
     
     # Returns only the absolute value Mach number (i.e., uses model
     # M = abs(v)/v_sound))).
     
-    # This table defines the speed of sound vs. altitude on Mars
-    SPD_data = np.array([[0, 244.4], 
-                         [1000, 243.7], 
-                         [2000, 243.2],
-                         [3000, 242.7], 
-                         [4000, 242.2], 
-                         [5000, 241.7],
-                         [6000, 241.2], 
-                         [7000, 240.7], 
-                         [8000, 239.6],
-                         [9000, 238.4], 
-                         [10000, 237.3], 
-                         [11000, 236.1],
-                         [12000, 235.0], 
-                         [13000, 233.8], 
-                         [14000, 232.6]])
-    
-    v_sound_fit = pchip(SPD_data[:, 0], SPD_data[:, 1])
-    v_sound = v_sound_fit(a)
+    # The speed of sound comes from the Mars table (SPD_data) unless another
+    # speed of sound table is given.
+    
+    if table is None:
+        table = MARS_SPEED_OF_SOUND
+    
+    v_sound = speed_of_sound(table, a)
     
     M = abs(v) / v_sound
     
     return M
 
 
-def thrust_controller(edl_system, planet):
+def init_thrust_controller(edl_system, keep_history=False):
+    # init_thrust_controller
+    #
+    # Resets the running state of the discrete PID thrust controller
+    # (thrust_controller) and, optionally, turns on its telemetry history.
+    #
+    # The controller state lives in edl_system['speed_control']['state']: 
+    # the last two (time, error) samples, for the derivative term, and the 
+    # running trapezoid integral of the error. Each controller update is 
+    # therefore O(1) no matter how long the descent has been running.
+    #
+    # With keep_history=True every update also appends time, error and 
+    # thrust to edl_system['telemetry'] (for plotting / debugging). It is
+    # off by default so long descents and optimizer runs do not grow lists.
+    #
+    # Calling sequence: edl_system = init_thrust_controller(edl_system, keep_history)
+    # Inputs:  edl_system   - struct
+    #          keep_history - bool (optional, default False)
+    # Outputs: edl_system
+    
+    if type(edl_system) != dict:
+        raise Exception('INIT THRUST CONTROLLER: first input must be a dict')
+    
+    edl_system['speed_control']['state'] = {'t' : None,         # time of last update [s]
+                                            't_prev' : None,    # time of the update before that [s]
+                                            'e' : 0.0,          # last velocity error [m/s]
+                                            'e_prev' : 0.0,     # velocity error before that [m/s]
+                                            'integral' : 0.0,   # running integral of error [m]
+                                            'keep_history' : keep_history}
+    
+    if keep_history:
+        edl_system['telemetry'] = {'time' : [], 'error' : [], 'thrust' : []}
+    
+    return edl_system
+
+
+def _advance_thrust_controller(state, t, e):
+    
+    # Adds the sample (t, e) to the controller state and returns the error
+    # derivative. The derivative is the three-point backward difference (the
+    # non-uniform step form of (3*e_i - 4*e_i-1 + e_i-2)/(2*dt)), dropping to
+    # a two-point difference after the second sample and zero on the first. 
+    # The integral is advanced with one trapezoid.
+    
+    if state['t'] is None:
+        dedt = 0.0
+    else:
+        h1 = t - state['t']
+        if h1 <= 0:
+            raise Exception('THRUST CONTROLLER: time must increase between controller updates')
+        
+        state['integral'] += 0.5*(e + state['e'])*h1
+        
+        if state['t_prev'] is None:
+            dedt = (e - state['e'])/h1
+        else:
+            h2 = state['t'] - state['t_prev']
+            dedt = e*(2*h1 + h2)/(h1*(h1 + h2)) - state['e']*(h1 + h2)/(h1*h2) + state['e_prev']*h1/(h2*(h1 + h2))
+    
+    state['t_prev'] = state['t']
+    state['e_prev'] = state['e']
+    state['t'] = t
+    state['e'] = e
+    
+    return dedt
+
+
+def thrust_controller(edl_system, planet, t):
     # thrust_controller
     #
     # This function implements a PID Controller for the EDL system. Uses
     # edl_system and planet structs to create a modified edl_system struct.
-    # Modifies fields in rocket and telemetry substructs.
+    # Modifies fields in rocket, speed_control and (if history is kept)
+    # telemetry substructs.
+    #
+    # The error integral and derivative come from the running controller 
+    # state set up by init_thrust_controller (created on first use if 
+    # needed), so each call costs the same regardless of elapsed time.
     #
-    # Calling sequence: edl_system = thrust_controller(edl_system,planet)
+    # Calling sequence: edl_system = thrust_controller(edl_system,planet,t)
     # Inputs:  edl_system - struct
     #          planet     - struct
+    #          t          - current time [s]
     # Outputs: edl_system
 
     
@@ -195,46 +364,43 @@ def thrust_controller(edl_system, planet):
     if type(planet) != dict:
         raise Exception('THRUST CONTROLLER: second input must be a dict')
     
+    control = edl_system['speed_control']
+    if 'state' not in control:
+        edl_system = init_thrust_controller(edl_system)
+    state = control['state']
+    
     
     # First, check if the rocket is on and that the control is activated:
-    if (edl_system['rocket']['control']['on']) and (edl_system['rocket']['on']):
+    if control['on'] and edl_system['rocket']['on']:
     
         # If edl_system is within altitude, set the target velocity to zero  
-        if edl_system['altitude'] < edl_system['sky_crane']['max_rope'] + 10:
-             edl_system['rocket']['control']['target_velocity'] = 0.0
+        if edl_system['altitude'] < edl_system['sky_crane']['max_cable'] + 10:
+             control['target_velocity'] = 0.0
       
       
         # Calculate the error (difference between actual and target velocity)
-        e = edl_system['control']['target_velocity'] - edl_system['velocity']
+        e = control['target_velocity'] - edl_system['velocity']
       
-        # Update the error in telemetry array:
-        edl_system['telemetry']['error'].append(e)  # = [edl_system['telemetry']['error'], e]  # check this
-           
         # Set the parameters of the PID controller (Kp: proportional, 
         # Kd: derivative, Ki: integral terms)
-        Kp = edl_system['control']['Kp']
-        Kd = edl_system['control']['Kd']
-        Ki = edl_system['control']['Ki']    
+        Kp = control['Kp']
+        Kd = control['Kd']
+        Ki = control['Ki']    
        
-        #e     = edl_system.telemetry.error(end);
-        dt    = edl_system['telemetry']['time'][-1] - edl_system['telemetry']['time'][-2]
-        ei    = edl_system['telemetry']['error'][-1]
-        eim1  = edl_system['telemetry']['error'][-2]
-        eim2  = edl_system['telemetry']['error'][-3]
-        # Calculate the derivative of the error wrt time
-        dedt  = (3*ei-4*eim1+eim2)/2/dt
-      
-        # Integrate the error:
-        ie    = np.trapz(edl_system['telemetry']['time'], edl_system['telemetry']['error'])
+        # Update the controller state: derivative of the error wrt time and 
+        # the integral of the error
+        dedt  = _advance_thrust_controller(state, t, e)
+        ie    = state['integral']
       
         # *****************
         # Compute Needed Thrust
         # Two-step process: (1) compute thrust using model, (2) apply corrections
         # as needed due to saturating rocket capabilities.
       
-        # Calculate the required thrust from model
-        edl_system['rocket']['thrust'] = Kp*e + Kd*dedt + Ki*ie + \
-            edl_system['total_mass']*np.sign(planet['gravity'])*planet['gravity']/edl_system['rocket']['number_of_rockets']
+        # Calculate the required thrust from model (per rocket). planet['g']
+        # is <0 due to sign convention, so negating gives a positive thrust.
+        edl_system['rocket']['thrust'] = Kp*e + Kd*dedt + Ki*ie - \
+            get_mass_edl(edl_system)*planet['g']/edl_system['num_rockets']
        
         # check to see if we're over or under the limits of the rocket motors
         if abs(edl_system['rocket']['thrust']) > abs(edl_system['rocket']['max_thrust']):
@@ -247,26 +413,27 @@ def thrust_controller(edl_system, planet):
             # got to here? Asking for less thrust than we can deliver (e.g.,
             # cannot thrust in both directions; can't turn rockets on then off
             # then back on. So knock it down to min thrust.
-            edl_system.rocket.thrust = \
+            edl_system['rocket']['thrust'] = \
                 np.sign(edl_system['rocket']['thrust'])*edl_system['rocket']['min_thrust']
 
         
-    elif edl_system['rocket']['on'] and (edl_system['rocket']['control']['on'] == False):
+    elif edl_system['rocket']['on'] and (control['on'] == False):
         # if we get to this clause, it means the rockets are on but the
-        # controller is not. In this case, we go with a     
+        # controller is not. In this case, we go with a fixed thrust.
         edl_system['rocket']['thrust'] = edl_system['rocket']['fixed_thrust']
-        edl_system['telemetry']['error'].append(0) # = [edl_system.telemetry.error 0];
-        #edl_system.telemetry.thrust =[edl_system.telemetry.thrust edl_system.rocket.thrust];
+        e = 0.0
+        _advance_thrust_controller(state, t, e)
     else:
-        edl_system['telemetry']['error'].append(0) # = [edl_system.telemetry.error 0];
-        #edl_system.rocket.thrust = 0.0;
-        #edl_system.telemetry.thrust =[edl_system.telemetry.thrust edl_system.rocket.thrust];  
-    
-    if edl_system['rocket']['on']:
-        edl_system['telemetry']['thrust'].append(edl_system['rocket']['thrust']) # =[edl_system.telemetry.thrust edl_system.rocket.thrust];
-    
-    else:
-        edl_system['telemetry']['thrust'].append(0) # =[edl_system.telemetry.thrust 0];
+        e = 0.0
+        _advance_thrust_controller(state, t, e)
+    
+    if state['keep_history']:
+        edl_system['telemetry']['time'].append(t)
+        edl_system['telemetry']['error'].append(e)
+        if edl_system['rocket']['on']:
+            edl_system['telemetry']['thrust'].append(edl_system['rocket']['thrust'])
+        else:
+            edl_system['telemetry']['thrust'].append(0)
        
     return edl_system 
 
@@ -758,12 +925,91 @@ def update_edl_state(edl_system, TE, YE, Y, ITER_INFO):
 
     return edl_system, y0, TERMINATE_SIM
 
-def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
+def define_trajectory_buffer(n_states, keep_every=1, events_only=False):
+    # define_trajectory_buffer
+    #
+    # Collects the trajectory of a multi-segment simulation (one solve_ivp
+    # call per phase, as in simulate_edl). Segments are stored as they come
+    # and joined once by trajectory_arrays, instead of re-copying the whole
+    # history with np.append/np.hstack after every phase.
+    #
+    # keep_every = k keeps every k-th sample (counted over the whole run)
+    # plus the last sample of each segment, so the event states are always
+    # there. events_only = True keeps only the initial state and the state
+    # at the end of each segment. Both are meant for sweeps and optimizer
+    # runs that do not need the dense trajectory.
+    
+    if int(keep_every) != keep_every or keep_every < 1:
+        raise Exception('define_trajectory_buffer: keep_every must be a positive integer')
+    
+    buffer = {'n_states' : n_states,
+              'keep_every' : int(keep_every),
+              'events_only' : events_only,
+              't_chunks' : [],
+              'y_chunks' : [],
+              'n_seen' : 0}   # number of samples offered so far
+    
+    return buffer
+
+def trajectory_append(buffer, t_part, Y_part):
+    # trajectory_append
+    #
+    # Adds one simulation segment (times t_part, states Y_part with one 
+    # column per time) to a trajectory buffer, keeping only the samples the
+    # buffer was asked for.
+    
+    n = len(t_part)
+    if n == 0:
+        return buffer
+    
+    if buffer['events_only']:
+        if buffer['n_seen'] == 0 and n > 1:
+            idx = [0, n-1]
+        else:
+            idx = [n-1]
+    elif buffer['keep_every'] > 1:
+        k = buffer['keep_every']
+        idx = np.arange((-buffer['n_seen']) % k, n, k)
+        if len(idx) == 0 or idx[-1] != n-1:
+            idx = np.append(idx, n-1)
+    else:
+        idx = slice(None)
+    
+    buffer['t_chunks'].append(np.array(t_part[idx]))
+    buffer['y_chunks'].append(np.array(Y_part[:, idx]))
+    buffer['n_seen'] += n
+    
+    return buffer
+
+def trajectory_arrays(buffer):
+    # trajectory_arrays
+    #
+    # Joins the buffered segments (one concatenation) and returns the time
+    # vector T and the state history Y (n_states x N). Both are returned
+    # read-only; copy them if they need to be modified.
+    
+    if buffer['t_chunks']:
+        T = np.concatenate(buffer['t_chunks'])
+        Y = np.concatenate(buffer['y_chunks'], axis=1)
+    else:
+        T = np.array([])
+        Y = np.zeros((buffer['n_states'], 0))
+    
+    T.setflags(write=False)
+    Y.setflags(write=False)
+    
+    return T, Y
+
+def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO, keep_every=1, events_only=False):
     # simulate_edl
     #
     # This simulates the EDL system. It requires a definition of the
     # edl_system, the planet, the mission events, a maximum simulation time and
     # has an optional flag to display detailed iteration information.
+    #
+    # The returned T and Y are read-only. keep_every and events_only thin
+    # out the stored trajectory (see define_trajectory_buffer); by default 
+    # every solver sample is kept.
     
     # handle to events function for edl simulation
     #h_edl_events = lambda t, y: edl_events(t, y, edl_system, mission_events)
@@ -788,9 +1034,8 @@ def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
         print('Commencing simulation run...\n')
     
     
-    # declare our variables (just empty arrays)
-    T = np.array([])
-    Y = np.array([[], [], [], [], [], [], []])
+    # trajectory of all the phases, joined once at the end
+    trajectory = define_trajectory_buffer(len(y0), keep_every, events_only)
     TERMINATE_SIM = False
     while not(TERMINATE_SIM):
         
@@ -811,21 +1056,16 @@ def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
         # update the simulation time span for the next stage
         tspan = (t_part[-1], tmax)
         
-        # appending to grow a list is inefficient, but there is no way to
-        # know in advance how many elements we'll need due to the adaptive step
-        # size in ode45
-        
-        T = np.append(T, t_part)
-        Y = np.hstack((Y, Y_part))
-        #T.append(t_part)
-        #Y.append(Y_part)
-
+        # store this phase of the trajectory
+        trajectory = trajectory_append(trajectory, t_part, Y_part)
         
         # This looks for whether we're out of time. other termination
         # conditions checked in update_edl_state
         if tspan[0] >= tspan[1]:
             TERMINATE_SIM = True
     
+    T, Y = trajectory_arrays(trajectory)
+    
     return T, Y, edl_system
     
     
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks for the Phase 4 simulation kernels.
+
+Run from this folder:  python benchmarks.py
+
+@author: Marvin Engineering Design Team
+"""
+
+import time
+import copy
+import numpy as np
+from subfunctions_Phase4 import *
+from define_experiment import experiment1
+from scipy.integrate import solve_ivp
+
+
+def _best_time(fun, repeat=5):
+
+    # Best wall time of repeat calls to fun() [s]
+
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fun()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _report(name, n, seconds):
+    print('  {:<28s} {:10.2f} ms   {:10.1f} ns/element'.format(name, 1e3*seconds, 1e9*seconds/n))
+
+
+def benchmark_physics_kernels(n=1000000):
+
+    # Throughput of the vectorized force/torque kernels on n-element omega
+    # and terrain angle arrays, the sizes battenergy/mechpower see when
+    # post-processing long rover missions. The per-element figure is the
+    # cost of calling the kernels one sample at a time, for comparison.
+
+    edl_system = define_edl_system()
+    edl_system = define_motor(edl_system, 'base_he')
+    edl_system = define_batt_pack(edl_system, 'LiFePO4', 10)
+    rover = edl_system['rover']
+    planet = define_planet()
+    motor = rover['wheel_assembly']['motor']
+    Crr = 0.1
+
+    rng = np.random.default_rng(0)
+    omega = rng.uniform(-0.1*motor['speed_noload'], 1.1*motor['speed_noload'], n)
+    angle = rng.uniform(-30, 30, n)
+    t = np.linspace(0, 1000, n)
+    v = omega*rover['wheel_assembly']['wheel']['radius']/get_gear_ratio(rover['wheel_assembly']['speed_reducer'])
+
+    print('Physics kernels, {:d} elements'.format(n))
+    _report('tau_dcmotor', n, _best_time(lambda: tau_dcmotor(omega, motor)))
+    _report('F_gravity', n, _best_time(lambda: F_gravity(angle, rover, planet)))
+    _report('F_rollingCorr', n, _best_time(lambda: F_rollingCorr(omega, angle, rover, planet, Crr)))
+    _report('F_net', n, _best_time(lambda: F_net(omega, angle, rover, planet, Crr)))
+    _report('mechpower', n, _best_time(lambda: mechpower(v, rover)))
+    _report('battenergy', n, _best_time(lambda: battenergy(t, v, rover)))
+
+    n_scalar = 10000
+    def scalar_loop():
+        for ii in range(n_scalar):
+            F_net(float(omega[ii]), float(angle[ii]), rover, planet, Crr)
+    _report('F_net (per element)', n_scalar, _best_time(scalar_loop, repeat=1))
+
+
+def _baseline_rover():
+
+    # Rover of the baseline design in opt_edl_sys.py
+
+    edl_system = define_edl_system()
+    edl_system = define_chassis(edl_system, 'carbon')
+    edl_system = define_motor(edl_system, 'base_he')
+    edl_system = define_batt_pack(edl_system, 'LiFePO4', 10)
+    return edl_system['rover'], define_planet()
+
+
+def benchmark_rover_ensemble(n=1000, n_serial=5):
+
+    # Rover parameter study: n random (wheel radius, chassis mass, gear 
+    # diameter) variants through simulate_rover_ensemble, against 
+    # simulate_rover one design at a time (timed on n_serial designs and 
+    # scaled up). Also reports the largest relative differences.
+
+    rover, planet = _baseline_rover()
+    experiment, end_event = experiment1()
+
+    rng = np.random.default_rng(0)
+    radius = rng.uniform(0.2, 0.7, n)
+    chassis_mass = rng.uniform(250, 800, n)
+    diam_gear = rng.uniform(0.05, 0.12, n)
+
+    t0 = time.perf_counter()
+    batch = stack_rover_params(compile_rover_variants(rover, planet, experiment, radius, chassis_mass, diam_gear))
+    telemetry = simulate_rover_ensemble(batch, experiment, end_event)
+    t_ensemble = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    err_time = 0.0
+    err_energy = 0.0
+    for ii in range(n_serial):
+        variant = copy.deepcopy(rover)
+        variant['wheel_assembly']['wheel']['radius'] = radius[ii]
+        variant['chassis']['mass'] = chassis_mass[ii]
+        variant['wheel_assembly']['speed_reducer']['diam_gear'] = diam_gear[ii]
+        ref = simulate_rover(variant, planet, experiment, end_event, summary=True)['telemetry']
+        err_time = max(err_time, abs(telemetry['completion_time'][ii]/ref['completion_time'] - 1))
+        err_energy = max(err_energy, abs(telemetry['battery_energy'][ii]/ref['battery_energy'] - 1))
+    t_serial = (time.perf_counter() - t0)/n_serial*n
+
+    print('Rover ensemble, {:d} variants'.format(n))
+    print('  simulate_rover_ensemble      {:10.2f} s'.format(t_ensemble))
+    print('  simulate_rover (estimated)   {:10.2f} s'.format(t_serial))
+    print('  max rel. difference: completion time {:.1e}, battery energy {:.1e}'.format(err_time, err_energy))
+
+
+def _baseline_edl_system():
+
+    # EDL system of opt_edl_sys.py at the baseline design x0, ready for
+    # simulate_edl (and its planet and mission events)
+
+    edl_system = define_edl_system()
+    edl_system = define_chassis(edl_system, 'carbon')
+    edl_system = define_motor(edl_system, 'base_he')
+    edl_system = define_batt_pack(edl_system, 'LiFePO4', 10)
+    edl_system = redefine_edl_system(edl_system)
+    edl_system['parachute']['diameter'] = 19.0
+    edl_system['rocket']['fuel_mass'] = 170.0
+    edl_system['rocket']['initial_fuel_mass'] = 170.0
+    edl_system['rover']['chassis']['mass'] = 550.0
+    return edl_system, define_planet(), define_mission_events()
+
+
+def benchmark_edl_ensemble(n=1000, n_serial=3, tmax=5000):
+
+    # EDL parameter study: n random (parachute diameter, fuel mass, chassis
+    # mass) variants through simulate_edl_ensemble, against simulate_edl 
+    # one design at a time (timed on n_serial designs and scaled up). Also
+    # reports the largest differences in landing time and touchdown speed.
+
+    edl_system, planet, mission_events = _baseline_edl_system()
+
+    rng = np.random.default_rng(0)
+    diameter = rng.uniform(14, 19, n)
+    fuel_mass = rng.uniform(100, 290, n)
+    chassis_mass = rng.uniform(250, 800, n)
+
+    t0 = time.perf_counter()
+    batch = stack_edl_params(compile_edl_variants(edl_system, diameter, fuel_mass, chassis_mass))
+    outcome = simulate_edl_ensemble(batch, planet, mission_events, tmax)
+    t_ensemble = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    err_time = 0.0
+    err_speed = 0.0
+    for ii in range(n_serial):
+        variant = copy.deepcopy(edl_system)
+        variant['parachute']['diameter'] = diameter[ii]
+        variant['rocket']['fuel_mass'] = fuel_mass[ii]
+        variant['rocket']['initial_fuel_mass'] = fuel_mass[ii]
+        variant['rover']['chassis']['mass'] = chassis_mass[ii]
+        T, Y, variant = simulate_edl(variant, planet, mission_events, tmax, False, summary=True)
+        err_time = max(err_time, abs(outcome['time_edl'][ii] - T[-1]))
+        err_speed = max(err_speed, abs(outcome['velocity'][ii] - Y[0, -1]))
+    t_serial = (time.perf_counter() - t0)/n_serial*n
+
+    print('EDL ensemble, {:d} variants ({:d} landed)'.format(n, int(np.sum(outcome['on_ground']))))
+    print('  simulate_edl_ensemble        {:10.2f} s   {:8.1f} descents/s'.format(t_ensemble, n/t_ensemble))
+    print('  simulate_edl (estimated)     {:10.2f} s   {:8.1f} descents/s'.format(t_serial, n/t_serial))
+    print('  max difference: landing time {:.1e} s, final velocity {:.1e} m/s'.format(err_time, err_speed))
+
+
+def _count_calls(module, name):
+
+    # Replaces module.name by a wrapper counting its calls. Returns the 
+    # counter (a one-element list) and a function restoring the original.
+
+    fun = getattr(module, name)
+    count = [0]
+    def counted(*args):
+        count[0] += 1
+        return fun(*args)
+    setattr(module, name, counted)
+    return count, lambda: setattr(module, name, fun)
+
+
+def benchmark_step_policies(n=6):
+
+    # Right-hand side evaluations, wall time and accuracy of simulate_edl 
+    # and simulate_rover with the default step policies, against the 
+    # former fixed settings (EDL: DOP853, max_step=0.1, rtol=1e-3; rover:
+    # BDF, max_step=1.0, rtol=1e-3), on the baseline design and n-1 random
+    # variants. Errors are against a tight-tolerance run (absolute for the
+    # EDL, relative for the rover).
+
+    import subfunctions_Phase4
+
+    edl_system, planet, mission_events = _baseline_edl_system()
+    experiment, end_event = experiment1()
+    tmax = 5000
+
+    rng = np.random.default_rng(5)
+    diameter = np.append(19.0, rng.uniform(14, 19, n-1))
+    fuel_mass = np.append(170.0, rng.uniform(100, 290, n-1))
+    chassis_mass = np.append(550.0, rng.uniform(250, 800, n-1))
+    radius = np.append(0.45, rng.uniform(0.2, 0.7, n-1))
+    diam_gear = np.append(0.09, rng.uniform(0.05, 0.12, n-1))
+
+    def uniform_edl_policy(settings):
+        return {phase : dict(settings) for phase in define_edl_step_policy()}
+
+    def run_edl(policy):
+        count, restore = _count_calls(subfunctions_Phase4, 'edl_dynamics_fast')
+        out = []
+        t0 = time.perf_counter()
+        try:
+            for ii in range(n):
+                variant = copy.deepcopy(edl_system)
+                variant['parachute']['diameter'] = diameter[ii]
+                variant['rocket']['fuel_mass'] = fuel_mass[ii]
+                variant['rocket']['initial_fuel_mass'] = fuel_mass[ii]
+                variant['rover']['chassis']['mass'] = chassis_mass[ii]
+                if policy is not None:
+                    variant['step_policy'] = policy
+                T, Y, variant = simulate_edl(variant, planet, mission_events, tmax, False, summary=True)
+                out.append([T[-1], Y[2, -1]])
+        finally:
+            restore()
+        return np.array(out), count[0]/n, (time.perf_counter() - t0)/n
+
+    def run_rover(policy):
+        count, restore = _count_calls(subfunctions_Phase4, 'rover_dynamics_fast')
+        out = []
+        t0 = time.perf_counter()
+        try:
+            for ii in range(n):
+                variant = copy.deepcopy(edl_system['rover'])
+                variant['wheel_assembly']['wheel']['radius'] = radius[ii]
+                variant['chassis']['mass'] = chassis_mass[ii]
+                variant['wheel_assembly']['speed_reducer']['diam_gear'] = diam_gear[ii]
+                if policy is not None:
+                    variant['step_policy'] = policy
+                telemetry = simulate_rover(variant, planet, experiment, end_event, summary=True)['telemetry']
+                out.append([telemetry['completion_time'], telemetry['battery_energy']])
+        finally:
+            restore()
+        return np.array(out), count[0]/n, (time.perf_counter() - t0)/n
+
+    print('Step policies, {:d} designs (per design)'.format(n))
+    print('  {:<24s} {:>10s} {:>10s} {:>14s} {:>14s}'.format('', 'RHS evals', 'time [ms]', 'time error', 'energy/fuel err'))
+
+    reference, _, _ = run_edl(uniform_edl_policy({'method' : 'DOP853', 'max_step' : 0.05, 'rtol' : 1e-11, 'atol' : 1e-11}))
+    for label, policy in [('EDL, max_step=0.1', uniform_edl_policy({'method' : 'DOP853', 'max_step' : 0.1, 'rtol' : 1e-3, 'atol' : 1e-6})),
+                          ('EDL, default policy', None)]:
+        out, nfev, seconds = run_edl(policy)
+        err = np.max(np.abs(out - reference), axis=0)
+        print('  {:<24s} {:10.0f} {:10.1f} {:12.1e} s {:12.1e} kg'.format(label, nfev, 1e3*seconds, err[0], err[1]))
+
+    reference, _, _ = run_rover({'method' : 'Radau', 'max_step' : 0.5, 'rtol' : 1e-10, 'atol' : 1e-10})
+    for label, policy in [('rover, max_step=1.0', {'method' : 'BDF', 'max_step' : 1.0, 'rtol' : 1e-3, 'atol' : 1e-6}),
+                          ('rover, default policy', None)]:
+        out, nfev, seconds = run_rover(policy)
+        err = np.max(np.abs(out/reference - 1), axis=0)
+        print('  {:<24s} {:10.0f} {:10.1f} {:14.1e} {:14.1e}'.format(label, nfev, 1e3*seconds, err[0], err[1]))
+
+
+def benchmark_rover_jacobian(n=6):
+
+    # Stiff rover integration with the solver's finite-difference Jacobian
+    # against the analytic rover_jacobian_fast, on the baseline rover and 
+    # n-1 random variants, for the default step policy and for the former
+    # fixed BDF settings (max_step=1.0, rtol=1e-3). Reports all calls of
+    # the right-hand side (the solver's nfev leaves out the ones made for
+    # finite differences), the solver's njev and nlu, and the wall time
+    # per design.
+
+    rover, planet = _baseline_rover()
+    experiment, end_event = experiment1()
+    terrain = define_terrain_profile(experiment)
+    t_span = experiment['time_range']
+    y0 = np.append(experiment['initial_conditions'].ravel()[:2], 0.0)
+
+    rng = np.random.default_rng(5)
+    radius = np.append(0.45, rng.uniform(0.2, 0.7, n-1))
+    chassis_mass = np.append(550.0, rng.uniform(250, 800, n-1))
+    diam_gear = np.append(0.09, rng.uniform(0.05, 0.12, n-1))
+
+    designs = []
+    for ii in range(n):
+        variant = copy.deepcopy(rover)
+        variant['wheel_assembly']['wheel']['radius'] = radius[ii]
+        variant['chassis']['mass'] = chassis_mass[ii]
+        variant['wheel_assembly']['speed_reducer']['diam_gear'] = diam_gear[ii]
+        params = compile_rover(variant, planet, experiment)
+        designs.append((params, end_of_mission_event(end_event, rover_energy_budget(variant, end_event))))
+
+    print('Rover Jacobian, {:d} designs (per design)'.format(n))
+    print('  {:<34s} {:>8s} {:>8s} {:>8s} {:>10s} {:>12s}'.format('', 'RHS', 'njev', 'nlu', 'time [ms]', 'final time'))
+    default = define_rover_step_policy()
+    former = {'method' : 'BDF', 'max_step' : 1.0, 'rtol' : 1e-3, 'atol' : 1e-6}
+    for policy_label, policy in [('default policy', default), ('max_step=1.0', former)]:
+        for jac_label in ['finite difference', 'analytic']:
+            counts = np.zeros(3)
+            t_final = 0.0
+            t0 = time.perf_counter()
+            calls = [0]
+            for params, events in designs:
+                def fun(t, y):
+                    calls[0] += 1
+                    return rover_dynamics_fast(t, y, params, terrain)
+                options = {}
+                if jac_label == 'analytic':
+                    options['jac'] = lambda t, y: rover_jacobian_fast(t, y, params, terrain)
+                sol = solve_ivp(fun, t_span, y0, method=policy['method'], max_step=policy['max_step'],
+                                rtol=policy['rtol'], atol=policy['atol'], events=events, **options)
+                counts += [0, sol.njev, sol.nlu]
+                t_final = sol.t[-1]
+            seconds = (time.perf_counter() - t0)/n
+            counts[0] = calls[0]
+            print('  {:<34s} {:8.0f} {:8.0f} {:8.0f} {:10.1f} {:12.4f}'.format(policy_label + ', ' + jac_label, *(counts/n), 1e3*seconds, t_final))
+
+
+def benchmark_quasi_steady(n=40):
+
+    # simulate_rover_quasi_steady against simulate_rover(summary=True) on
+    # the baseline rover and n-1 random variants. Reports the wall time, 
+    # the number of designs that fell back to simulate_rover and the 
+    # largest error relative to the reported bound, with simulate_rover at
+    # rtol=atol=1e-11 as the reference.
+
+    rover, planet = _baseline_rover()
+    experiment, end_event = experiment1()
+
+    rng = np.random.default_rng(7)
+    radius = np.append(0.45, rng.uniform(0.2, 0.7, n-1))
+    chassis_mass = np.append(550.0, rng.uniform(250, 800, n-1))
+    diam_gear = np.append(0.09, rng.uniform(0.05, 0.12, n-1))
+
+    variants = []
+    for ii in range(n):
+        variant = copy.deepcopy(rover)
+        variant['wheel_assembly']['wheel']['radius'] = radius[ii]
+        variant['chassis']['mass'] = chassis_mass[ii]
+        variant['wheel_assembly']['speed_reducer']['diam_gear'] = diam_gear[ii]
+        variants.append(variant)
+
+    t0 = time.perf_counter()
+    quasi_steady = [simulate_rover_quasi_steady(variant, planet, experiment, end_event)['telemetry'] for variant in variants]
+    t_quasi_steady = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for variant in variants:
+        simulate_rover(variant, planet, experiment, end_event, summary=True)
+    t_ode = time.perf_counter() - t0
+
+    fallbacks = 0
+    ratio = np.zeros(3)
+    for variant, qs in zip(variants, quasi_steady):
+        if not qs['quasi_steady']:
+            fallbacks += 1
+            continue
+        tight = copy.deepcopy(variant)
+        tight['step_policy'] = {'rtol' : 1e-11, 'atol' : 1e-11, 'max_step' : 1.0}
+        ref = simulate_rover(tight, planet, experiment, end_event, summary=True)['telemetry']
+        for jj, key in enumerate(['completion_time', 'battery_energy', 'distance_traveled']):
+            # a zero bound marks the quantity that ended the mission (exact)
+            if qs[key + '_bound'] > 0:
+                ratio[jj] = max(ratio[jj], abs(qs[key] - ref[key])/qs[key + '_bound'])
+
+    print('Quasi-steady rover, {:d} designs'.format(n))
+    print('  simulate_rover_quasi_steady  {:10.2f} s'.format(t_quasi_steady))
+    print('  simulate_rover               {:10.2f} s'.format(t_ode))
+    print('  fallbacks to simulate_rover  {:10d}'.format(fallbacks))
+    print('  max error/bound: completion time {:.2f}, battery energy {:.2f}, distance {:.2f}'.format(*ratio))
+
+
+def benchmark_rover_distance(n=20):
+
+    # simulate_rover_distance (integrated over position) against 
+    # simulate_rover (over time, ended by the distance event) on 
+    # experiment1, for the baseline rover and n-1 random variants. Reports
+    # the wall time and the largest relative error in completion time, 
+    # battery energy and distance traveled against simulate_rover at 
+    # rtol=atol=1e-11.
+
+    rover, planet = _baseline_rover()
+    experiment, end_event = experiment1()
+
+    rng = np.random.default_rng(11)
+    radius = np.append(0.45, rng.uniform(0.2, 0.7, n-1))
+    chassis_mass = np.append(550.0, rng.uniform(250, 800, n-1))
+    diam_gear = np.append(0.09, rng.uniform(0.05, 0.12, n-1))
+
+    variants = []
+    refs = []
+    for ii in range(n):
+        variant = copy.deepcopy(rover)
+        variant['wheel_assembly']['wheel']['radius'] = radius[ii]
+        variant['chassis']['mass'] = chassis_mass[ii]
+        variant['wheel_assembly']['speed_reducer']['diam_gear'] = diam_gear[ii]
+        variants.append(variant)
+        tight = copy.deepcopy(variant)
+        tight['step_policy'] = {'rtol' : 1e-11, 'atol' : 1e-11, 'max_step' : 1.0}
+        refs.append(simulate_rover(tight, planet, experiment, end_event, summary=True)['telemetry'])
+
+    print('Rover distance domain, {:d} designs'.format(n))
+    print('  {:<28s} {:>10s} {:>16s} {:>16s} {:>16s}'.format('', 'time [s]', 'completion time', 'battery energy', 'distance'))
+    for label, simulate in [('simulate_rover', simulate_rover), ('simulate_rover_distance', simulate_rover_distance)]:
+        t0 = time.perf_counter()
+        results = [simulate(variant, planet, experiment, end_event, summary=True)['telemetry'] for variant in variants]
+        seconds = time.perf_counter() - t0
+        err = np.zeros(3)
+        for res, ref in zip(results, refs):
+            for jj, key in enumerate(['completion_time', 'battery_energy', 'distance_traveled']):
+                err[jj] = max(err[jj], abs(res[key]/ref[key] - 1))
+        print('  {:<28s} {:10.2f} {:16.1e} {:16.1e} {:16.1e}'.format(label, seconds, *err))
+
+
+if __name__ == '__main__':
+    benchmark_physics_kernels()
+    benchmark_rover_ensemble()
+    benchmark_edl_ensemble()
+    benchmark_step_policies()
+    benchmark_rover_jacobian()
+    benchmark_quasi_steady()
+    benchmark_rover_distance()
@@ -14,6 +14,7 @@ from scipy.optimize import Bounds
 from scipy.optimize import NonlinearConstraint
 import pickle
 import sys
+import os
 
 # the following calls instantiate the needed structs and also make some of
 # our design selections (battery type, etc.)
@@ -61,23 +62,60 @@ bounds = Bounds([14, 0.2, 250, 0.05, 100], [19, 0.7, 800, 0.12, 290])
 # initial guess
 x0 = np.array([19, .45, 550.0, 0.09, 170.0]) 
 
+# evaluation cache shared by the objective and the constraints so that each
+# distinct design is simulated only once. The on-disk store keeps every
+# evaluated design between runs, so re-running (or switching optimizers over
+# the same bounds) reuses earlier simulations. Delete the file to start cold.
+eval_cache = define_eval_cache(maxsize=256, store_path='edl_design_store.sqlite')
+
 # lambda for the objective function
 obj_f = lambda x: obj_fun_time(x,edl_system,planet,mission_events,tmax,
-                               experiment,end_event)
+                               experiment,end_event,eval_cache)
 
 # lambda for the constraint functions
 #   ineq_cons is for SLSQP
 #   nonlinear_constraint is for trust-constr
 cons_f = lambda x: constraints_edl_system(x,edl_system,planet,mission_events,
                                           tmax,experiment,end_event,min_strength,
-                                          max_rover_velocity,max_cost,max_batt_energy_per_meter)
-
-nonlinear_constraint = NonlinearConstraint(cons_f, -np.inf, 0)  # for trust-constr
+                                          max_rover_velocity,max_cost,max_batt_energy_per_meter,
+                                          eval_cache)
+
+# finite-difference gradient of the objective and Jacobian of the
+# constraints. The perturbed designs are simulated concurrently on a process
+# pool (executor is None -- i.e., serial -- on single core machines and on
+# platforms that cannot fork). Both share the evaluation cache, so the
+# constraint Jacobian at x reuses the missions run for the gradient.
+n_workers = os.cpu_count()
+executor = define_eval_executor(n_workers)
+
+obj_jac = lambda x: obj_fun_time_grad(x,edl_system,planet,mission_events,tmax,
+                                      experiment,end_event,eval_cache,executor,bounds)
+
+cons_jac = lambda x: constraints_edl_system_jac(x,edl_system,planet,mission_events,
+                                                tmax,experiment,end_event,min_strength,
+                                                max_rover_velocity,max_cost,max_batt_energy_per_meter,
+                                                eval_cache,executor,bounds)
+
+nonlinear_constraint = NonlinearConstraint(cons_f, -np.inf, 0, jac=cons_jac)  # for trust-constr
 ineq_cons = {'type' : 'ineq',
              'fun' : lambda x: -1*constraints_edl_system(x,edl_system,planet,
                                                          mission_events,tmax,experiment,
                                                          end_event,min_strength,max_rover_velocity,
-                                                         max_cost,max_batt_energy_per_meter)}
+                                                         max_cost,max_batt_energy_per_meter,
+                                                         eval_cache),
+             'jac' : lambda x: -1*cons_jac(x)}
+
+# population versions of the objective and the constraints for
+# differential_evolution(..., vectorized=True). Each generation is simulated
+# across the process pool, and the constraint and objective evaluations of a
+# member share one simulation through the evaluation cache.
+obj_pop = lambda X: obj_fun_time_population(X,edl_system,planet,mission_events,tmax,
+                                            experiment,end_event,eval_cache,executor)
+cons_pop = lambda X: constraints_edl_system_population(X,edl_system,planet,mission_events,
+                                                       tmax,experiment,end_event,min_strength,
+                                                       max_rover_velocity,max_cost,max_batt_energy_per_meter,
+                                                       eval_cache,executor)
+population_constraint = NonlinearConstraint(cons_pop, -np.inf, 0)  # for differential_evolution
 
 Nfeval = 1
 def callbackF(Xi):  # this is for SLSQP reporting during optimization
@@ -105,7 +143,7 @@ options = {'maxiter': 5,
             # 'initial_barrier_parameter' : 1.0,
             'verbose' : 3,
             'disp' : True}
-res = minimize(obj_f, x0, method='trust-constr', constraints=nonlinear_constraint, 
+res = minimize(obj_f, x0, method='trust-constr', jac=obj_jac, constraints=nonlinear_constraint, 
                 options=options, bounds=bounds)
 # end call to the trust-constr optimizer -------------------------------------#
 ###############################################################################
@@ -114,16 +152,17 @@ res = minimize(obj_f, x0, method='trust-constr', constraints=nonlinear_constrain
 # call the SLSQP optimizer ---------------------------------------------------#
 # options = {'maxiter': 5,
 #             'disp' : True}
-# res = minimize(obj_f, x0, method='SLSQP', constraints=ineq_cons, bounds=bounds, 
+# res = minimize(obj_f, x0, method='SLSQP', jac=obj_jac, constraints=ineq_cons, bounds=bounds, 
 #                 options=options, callback=callbackF)
 # end call to the SLSQP optimizer --------------------------------------------#
 ###############################################################################
 
 ###############################################################################
 # call the differential evolution optimizer ----------------------------------#
-# popsize=2 # define the population size
-# maxiter=1 # define the maximum number of iterations
-# res = differential_evolution(obj_f, bounds=bounds, constraints=nonlinear_constraint, popsize=popsize, maxiter=maxiter, disp=True, polish = False) 
+# popsize=15 # define the population size (popsize*5 members)
+# maxiter=5 # define the maximum number of iterations
+# res = differential_evolution(obj_pop, bounds=bounds, constraints=population_constraint, popsize=popsize, maxiter=maxiter, 
+#                              vectorized=True, updating='deferred', disp=True, polish = False) 
 # end call the differential evolution optimizer ------------------------------#
 ###############################################################################
 
@@ -148,10 +187,20 @@ res = minimize(obj_f, x0, method='trust-constr', constraints=nonlinear_constrain
 ###############################################################################
 
 
+if executor is not None:
+    executor.shutdown()
+
+# report how much simulation the evaluation cache avoided
+stats = get_eval_cache_stats(eval_cache)
+print('Evaluation cache: {:d} hits, {:d} from disk, {:d} misses ({:.1f}% hit rate), {:.1f} [s] simulated, {:.1f} [s] saved'.format(
+      stats['hits'], stats['store_hits'], stats['misses'], 100*stats['hit_rate'], stats['sim_time'], stats['saved_time']))
+print('Rover sub-cache:  {:d} hits, {:d} misses, {:.1f} [s] saved'.format(
+      stats['rover_hits'], stats['rover_misses'], stats['rover_saved_time']))
+
 # check if we have a feasible solution 
 c = constraints_edl_system(res.x,edl_system,planet,mission_events,tmax,experiment,
                            end_event,min_strength,max_rover_velocity,max_cost,
-                           max_batt_energy_per_meter)
+                           max_batt_energy_per_meter,eval_cache)
 
 feasible = np.max(c - np.zeros(len(c))) <= 0
 print(feasible)
@@ -9,8 +9,18 @@ Last Modified: 30 March 2022
 
 import numpy as np
 import math
-from scipy.interpolate import interp1d
-from scipy.integrate import solve_ivp
+import os
+import time
+import bisect
+import hashlib
+import sqlite3
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from scipy.interpolate import interp1d, CubicSpline
+from scipy.integrate import solve_ivp, RK23, RK45, DOP853, Radau, BDF, LSODA
+from scipy.optimize import brentq
+from scipy.special import erf
 from statistics import mean
 
 def get_mass_rover(rover):
@@ -155,16 +165,31 @@ def get_cost_edl(edl_system):
     
     return total_cost
 
+# Mars atmosphere model used by define_planet. These are module-level
+# functions rather than lambdas so that the planet dict can be pickled and
+# sent to worker processes (see evaluate_designs).
+def mars_high_altitude_temperature(altitude):
+    return -23.4 - 0.00222*altitude # [C]
+
+def mars_low_altitude_temperature(altitude):
+    return -31 - 0.000998*altitude # [C]
+
+def mars_pressure(altitude):
+    return 0.699*np.exp(-0.00009*altitude) # [KPa]
+
+def mars_density(temperature, pressure):
+    return pressure/(0.1921*(temperature+273.15)) # [kg/m^3]
+
 def define_planet():
     
 
-    high_altitude = {'temperature' : lambda altitude: -23.4 - 0.00222*altitude, # [C]
-                     'pressure' : lambda altitude: 0.699*np.exp(-0.00009*altitude)} # [KPa]
+    high_altitude = {'temperature' : mars_high_altitude_temperature, # [C]
+                     'pressure' : mars_pressure} # [KPa]
                                                                 
-    low_altitude = {'temperature' : lambda altitude: -31 - 0.000998*altitude, # [C]
-                    'pressure' : lambda altitude: 0.699*np.exp(-0.00009*altitude)} # [KPa]
+    low_altitude = {'temperature' : mars_low_altitude_temperature, # [C]
+                    'pressure' : mars_pressure} # [KPa]
     
-    density = lambda temperature, pressure: pressure/(0.1921*(temperature+273.15)) # [kg/m^3]
+    density = mars_density # [kg/m^3]
     
     mars = {'g' : -3.72,   # m/s^2]
             'altitude_threshold' : 7000, # [m]
@@ -497,6 +522,9 @@ def define_motor(edl_system, motor_type):
     else:
        raise Exception('input not recognized')
 
+    # build (or look up) this motor's efficiency map now rather than on the
+    # first energy calculation
+    get_efficiency_map(motor)
      
     edl_system['rover']['wheel_assembly']['motor'] = motor
     
@@ -530,15 +558,12 @@ def tau_dcmotor(omega, motor):
     tau_nl   = motor['torque_noload']
     omega_nl = motor['speed_noload']
     
-    # initialize
-    tau = np.zeros(len(omega),dtype = float)
-    for ii in range(len(omega)):
-        if omega[ii] >= 0 and omega[ii] <= omega_nl:
-            tau[ii] = tau_s - (tau_s-tau_nl)/omega_nl *omega[ii]
-        elif omega[ii] < 0:
-            tau[ii] = tau_s
-        elif omega[ii] > omega_nl:
-            tau[ii] = 0
+    # linear between stall and no-load, stall torque when back-driven and 
+    # zero above no-load speed (anything else, e.g. NaN, is zero)
+    omega = omega.astype(float, copy=False)
+    tau = np.select([(omega >= 0) & (omega <= omega_nl), omega < 0],
+                    [tau_s - (tau_s-tau_nl)/omega_nl*omega, tau_s],
+                    default=0.0)
         
     return tau
 
@@ -617,7 +642,7 @@ def F_gravity(terrain_angle, rover, planet):
         raise Exception('First input must be a scalar or a vector. Matrices are not allowed.')
         
     # Check that values of the first input are within the feasible range  
-    if max([abs(x) for x in terrain_angle]) > 75:    
+    if np.max(np.abs(terrain_angle)) > 75:
         raise Exception('All elements of the first input must be between -75 degrees and +75 degrees')
 
     # Check that the second input is a dict
@@ -632,7 +657,7 @@ def F_gravity(terrain_angle, rover, planet):
     m = get_mass_rover(rover)
     g = planet['g']
     
-    Fgt = np.array([-m*g*math.sin(math.radians(x)) for x in terrain_angle], dtype = float)
+    Fgt = -m*g*np.sin(np.radians(terrain_angle, dtype=float))
         
     return Fgt
 
@@ -707,7 +732,7 @@ def F_rollingCorr(omega, terrain_angle, rover, planet, Crr):
         raise Exception('First two inputs must be the same size')
     
     # Check that values of the second input are within the feasible range  
-    if max([abs(x) for x in terrain_angle]) > 75:    
+    if np.max(np.abs(terrain_angle)) > 75:
         raise Exception('All elements of the second input must be between -75 degrees and +75 degrees')
         
     # Check that the third input is a dict
@@ -735,11 +760,11 @@ def F_rollingCorr(omega, terrain_angle, rover, planet, Crr):
     # compute rolling resistance
     Crr = np.sqrt(0.0005/r) + 0.05
     
-    Fn = np.array([m*g*math.cos(math.radians(x)) for x in terrain_angle],dtype=float) # normal force
+    Fn = m*g*np.cos(np.radians(terrain_angle, dtype=float)) # normal force
     
     Frr_simple = -Crr*Fn # simple rolling resistance
     
-    Frr = np.array([math.erf(40*v_rover[ii]) * Frr_simple[ii] for ii in range(len(v_rover))], dtype = float)
+    Frr = erf(40*v_rover)*Frr_simple
     
     return Frr
 
@@ -779,7 +804,7 @@ def F_net(omega, terrain_angle, rover, planet, Crr):
         raise Exception('First two inputs must be the same size')
     
     # Check that values of the second input are within the feasible range  
-    if max([abs(x) for x in terrain_angle]) > 75:    
+    if np.max(np.abs(terrain_angle)) > 75:
         raise Exception('All elements of the second input must be between -75 degrees and +75 degrees')
         
     # Check that the third input is a dict
@@ -899,11 +924,9 @@ def battenergy(t,v,rover):
     omega = motorW(v, rover) # calculate motor speed (used in next line)
     tau = tau_dcmotor(omega, rover['wheel_assembly']['motor']) # calculate torque (used for efficiency info)
     
-    # Determine efficiency for each time/velocity
-    effcy_tau = rover['wheel_assembly']['motor']['effcy_tau'].ravel() # change to 1D array
-    effcy = rover['wheel_assembly']['motor']['effcy'].ravel()
-    effcy_fun = interp1d(effcy_tau, effcy, kind = 'cubic', fill_value = 'extrapolate') # fit the cubic spline
-    effcy_dat = effcy_fun(tau)
+    # Determine efficiency for each time/velocity (cubic fit of the motor's
+    # efficiency data, built once per motor by get_efficiency_map)
+    effcy_dat = motor_efficiency(get_efficiency_map(rover['wheel_assembly']['motor']), tau)
     
     
     validIndices = np.where(effcy_dat > 0)
@@ -922,7 +945,258 @@ def battenergy(t,v,rover):
     
     return E
 
-def rover_dynamics(t, y, rover, planet, experiment):
+def _spline_table(x, y):
+
+    # Not-a-knot cubic spline through (x, y) -- the spline interp1d(..., 
+    # kind='cubic', fill_value='extrapolate') builds -- stored as breakpoints
+    # and per-segment coefficients so it can be evaluated many times without
+    # being rebuilt. c[k,i] multiplies (x - x_i)**(3-k) on segment i.
+
+    c = CubicSpline(x, y, bc_type='not-a-knot', extrapolate=True).c
+    
+    table = {'breaks' : x,
+             'coeffs' : c,
+             'breaks_list' : x.tolist(), # for fast scalar lookups
+             'coeffs_list' : list(zip(c[0].tolist(), c[1].tolist(), c[2].tolist(), c[3].tolist()))}
+    
+    return table
+
+def _spline_eval(table, x):
+
+    # Evaluates a _spline_table at x (scalar: binary search plus a Horner 
+    # step; numpy array: searchsorted), extrapolating with the end segments.
+
+    if isinstance(x, np.ndarray) and x.ndim > 0:
+        breaks = table['breaks']
+        c = table['coeffs']
+        i = np.clip(np.searchsorted(breaks, x, side='right') - 1, 0, len(breaks) - 2)
+        dx = x - breaks[i]
+        return ((c[0, i]*dx + c[1, i])*dx + c[2, i])*dx + c[3, i]
+    
+    x = float(x)
+    breaks = table['breaks_list']
+    i = bisect.bisect_right(breaks, x) - 1
+    if i < 0:
+        i = 0
+    elif i > len(breaks) - 2:
+        i = len(breaks) - 2
+    c0, c1, c2, c3 = table['coeffs_list'][i]
+    dx = x - breaks[i]
+    
+    return ((c0*dx + c1)*dx + c2)*dx + c3
+
+# Motor efficiency maps built so far, keyed by motor type and a fingerprint
+# of the data they are built from (see get_efficiency_map)
+_EFFICIENCY_MAPS = {}
+
+def get_efficiency_map(motor, n_speed=4097):
+    """
+    Inputs:    motor:  dict               Data dictionary specifying motor 
+                                          parameters (with effcy_tau/effcy)
+             n_speed:  int                (optional) Number of points in the
+                                          battery power vs. speed table
+    
+    Outputs: effcy_map:  dict             Efficiency map of the motor
+    
+    Returns the motor's efficiency map from the registry, building it the 
+    first time a motor type/data combination is seen. The map holds
+    
+      effcy       the efficiency vs. torque spline (the same cubic fit
+                  battenergy always used), see motor_efficiency
+      omega, P    battery power of one motor [W] tabulated on a uniform 
+                  grid of motor speeds from 0 to the no-load speed, see 
+                  battery_power
+    
+    The key includes the efficiency data and speed-torque constants, so
+    the rescaled curves define_motor makes for the *_he/speed variants (or
+    any edited motor) get their own map.
+    """
+    
+    effcy_tau = np.asarray(motor['effcy_tau'], dtype=float).ravel()
+    effcy = np.asarray(motor['effcy'], dtype=float).ravel()
+    tau_s = float(motor['torque_stall'])
+    tau_nl = float(motor['torque_noload'])
+    omega_nl = float(motor['speed_noload'])
+    
+    data = hashlib.sha1(effcy_tau.tobytes() + effcy.tobytes() + 
+                        repr((tau_s, tau_nl, omega_nl, n_speed)).encode('utf-8')).hexdigest()
+    key = (motor.get('type', 'custom'), data)
+    if key in _EFFICIENCY_MAPS:
+        return _EFFICIENCY_MAPS[key]
+    
+    if len(effcy_tau) != len(effcy):
+        raise Exception('effcy_tau and effcy must be the same size')
+    if omega_nl <= 0:
+        raise Exception('motor no-load speed must be a positive number')
+    
+    effcy_table = _spline_table(effcy_tau, effcy)
+    
+    # battery power of one motor over [0, omega_nl]; zero where the 
+    # efficiency fit is not positive, as in battenergy
+    omega = np.linspace(0, omega_nl, n_speed)
+    tau = tau_s - (tau_s - tau_nl)/omega_nl*omega
+    eta = _spline_eval(effcy_table, tau)
+    P = np.where(eta > 0, tau*omega/np.where(eta > 0, eta, 1.0), 0.0)
+    
+    # At exactly omega_nl the torque (and the power) drops to zero; store the
+    # limit from below so interpolation just under omega_nl is right
+    P[-1] = 2*P[-2] - P[-3]
+    
+    # Back-driven (omega < 0): torque is the stall torque, so the power is
+    # linear in omega
+    eta_s = _spline_eval(effcy_table, tau_s)
+    
+    effcy_map = {'type' : key[0],
+                 'effcy' : effcy_table,
+                 'omega' : omega,
+                 'P' : P,
+                 'dP' : np.diff(P)/(omega[1] - omega[0]), # dP/domega of each table cell, for Jacobians
+                 'omega_nl' : omega_nl,
+                 'domega' : omega[1] - omega[0],
+                 'P_list' : P.tolist(),
+                 'dP_list' : (np.diff(P)/(omega[1] - omega[0])).tolist(),
+                 'P_back_slope' : tau_s/eta_s if eta_s > 0 else 0.0}
+    
+    _EFFICIENCY_MAPS[key] = effcy_map
+    
+    return effcy_map
+
+def motor_efficiency(effcy_map, tau):
+    """
+    Inputs: effcy_map:  dict              Efficiency map (get_efficiency_map)
+                  tau:  scalar or         Motor torque [Nm]
+                        numpy array
+    
+    Outputs:      eta:  scalar or         Motor efficiency [-]
+                        numpy array
+    """
+    
+    return _spline_eval(effcy_map['effcy'], tau)
+
+def battery_power(effcy_map, omega):
+    """
+    Inputs: effcy_map:  dict              Efficiency map (get_efficiency_map)
+                omega:  scalar or         Motor speed [rad/s]
+                        numpy array
+    
+    Outputs:        P:  scalar or         Battery power drawn by ONE motor 
+                        numpy array       [W] (linear interpolation in the 
+                                          precomputed table)
+    """
+    
+    omega_nl = effcy_map['omega_nl']
+    
+    if isinstance(omega, np.ndarray) and omega.ndim > 0:
+        P = np.interp(omega, effcy_map['omega'], effcy_map['P'])
+        P = np.where(omega < 0, effcy_map['P_back_slope']*omega, P)
+        return np.where(omega >= omega_nl, 0.0, P)
+    
+    if omega >= omega_nl:
+        return 0.0
+    if omega < 0:
+        return effcy_map['P_back_slope']*omega
+    
+    u = omega/effcy_map['domega']
+    i = int(u)
+    P = effcy_map['P_list']
+    
+    return P[i] + (u - i)*(P[i+1] - P[i])
+
+def battery_power_slope(effcy_map, omega):
+    """
+    Inputs: effcy_map:  dict              Efficiency map (get_efficiency_map)
+                omega:  scalar or         Motor speed [rad/s]
+                        numpy array
+    
+    Outputs:     dPdw:  scalar or         Derivative of battery_power with 
+                        numpy array       respect to omega [W s/rad] (the 
+                                          slope of the table cell omega is 
+                                          in)
+    """
+    
+    omega_nl = effcy_map['omega_nl']
+    
+    if isinstance(omega, np.ndarray) and omega.ndim > 0:
+        i = np.clip((omega/effcy_map['domega']).astype(int), 0, len(effcy_map['dP']) - 1)
+        dPdw = np.where(omega < 0, effcy_map['P_back_slope'], effcy_map['dP'][i])
+        return np.where(omega >= omega_nl, 0.0, dPdw)
+    
+    if omega >= omega_nl:
+        return 0.0
+    if omega < 0:
+        return effcy_map['P_back_slope']
+    
+    return effcy_map['dP_list'][int(omega/effcy_map['domega'])]
+
+def _spline_eval_slope(table, x):
+
+    # Value and first derivative of a _spline_table at x, a scalar or a 
+    # numpy array (end segments extrapolated, as in _spline_eval).
+
+    if not (isinstance(x, np.ndarray) and x.ndim > 0):
+        x = float(x)
+        breaks = table['breaks_list']
+        i = min(max(bisect.bisect_right(breaks, x) - 1, 0), len(breaks) - 2)
+        c0, c1, c2, c3 = table['coeffs_list'][i]
+        dx = x - breaks[i]
+        return ((c0*dx + c1)*dx + c2)*dx + c3, (3*c0*dx + 2*c1)*dx + c2
+    
+    breaks = table['breaks']
+    c = table['coeffs']
+    i = np.clip(np.searchsorted(breaks, x, side='right') - 1, 0, len(breaks) - 2)
+    dx = x - breaks[i]
+    value = ((c[0, i]*dx + c[1, i])*dx + c[2, i])*dx + c[3, i]
+    slope = (3*c[0, i]*dx + 2*c[1, i])*dx + c[2, i]
+    
+    return value, slope
+
+def define_terrain_profile(experiment):
+    """
+    Inputs:   experiment:  dict           Data dictionary specifying experiment 
+                                          definition (uses alpha_dist and 
+                                          alpha_deg)
+    
+    Outputs:     terrain:  dict           Terrain profile: breakpoints and the
+                                          cubic coefficients of every segment
+                                          of the terrain angle spline
+    
+    Builds the terrain angle spline once per experiment. It is the same
+    not-a-knot cubic spline interp1d(..., kind='cubic') produces (with
+    extrapolation past the ends), stored as per-segment polynomial
+    coefficients so terrain_angle can evaluate it with a binary search and
+    a Horner step instead of rebuilding an interpolant on every call.
+    """
+    
+    # Check that the experiment input is a dict
+    if type(experiment) != dict:
+        raise Exception('experiment input must be a dict')
+    
+    alpha_dist = np.asarray(experiment['alpha_dist'], dtype=float).ravel()
+    alpha_deg = np.asarray(experiment['alpha_deg'], dtype=float).ravel()
+    
+    if len(alpha_dist) != len(alpha_deg):
+        raise Exception('alpha_dist and alpha_deg must be the same size')
+    if len(alpha_dist) < 4:
+        raise Exception('at least 4 terrain points are needed for a cubic terrain profile')
+    
+    terrain = _spline_table(alpha_dist, alpha_deg)
+    
+    return terrain
+
+def terrain_angle(terrain, position):
+    """
+    Inputs:      terrain:  dict           Terrain profile from 
+                                          define_terrain_profile
+                position:  scalar or      Rover position(s) [m]
+                           numpy array
+    
+    Outputs:       alpha:  scalar or      Terrain angle [deg] at position(s)
+                           numpy array
+    """
+    
+    return _spline_eval(terrain, position)
+
+def rover_dynamics(t, y, rover, planet, experiment, terrain=None):
     """
     Inputs:         t:  scalar            Time sample [s]
                     y:  numpy array       Two element array of dependent variables 
@@ -935,6 +1209,9 @@ def rover_dynamics(t, y, rover, planet, experiment):
                                           parameters
            experiment:  dict              Data dictionary specifying experiment 
                                           definition
+              terrain:  dict              (optional) Terrain profile from 
+                                          define_terrain_profile. Built from
+                                          experiment if not given.
     
     Outputs:     dydt:  numpy array       First derivatives of state vector. 
                                           First element is rover acceleration 
@@ -973,10 +1250,12 @@ def rover_dynamics(t, y, rover, planet, experiment):
     v = float(y[0]) # velocity
     pos = float(y[1]) # position
     
+    if terrain is None:
+        terrain = define_terrain_profile(experiment)
+    
     omega = motorW(v, rover)   
-    alpha_fun = interp1d(experiment['alpha_dist'].ravel(), experiment['alpha_deg'].ravel(), kind = 'cubic', fill_value="extrapolate")
-    terrain_angle = float(alpha_fun(pos))
-    F = F_net(omega, terrain_angle, rover, planet, experiment['Crr'])
+    alpha = terrain_angle(terrain, pos)
+    F = F_net(omega, alpha, rover, planet, experiment['Crr'])
     
     m = get_mass_rover(rover)
     accel = float(F/m)
@@ -984,11 +1263,184 @@ def rover_dynamics(t, y, rover, planet, experiment):
     
     return dydt
 
-def end_of_mission_event(end_event):
+def compile_rover(rover, planet, experiment):
+    """
+    Inputs:     rover:  dict              Data structure specifying rover 
+                                          parameters
+               planet:  dict              Data dictionary specifying planetary 
+                                          parameters
+           experiment:  dict              Data dictionary specifying experiment 
+                                          definition
+    
+    Outputs:   params:  dict              Flat record of the rover parameters 
+                                          used by rover_dynamics_fast (plus 
+                                          the motor efficiency map)
+    
+    Does all the validation rover_dynamics/F_net repeat on every call once,
+    up front, and flattens the nested rover dict into scalars. Rolling 
+    resistance uses the same wheel-radius correlation as F_rollingCorr (the
+    experiment Crr is only checked, as it is there).
+    """
+    
+    # Check that the rover input is a dict
+    if type(rover) != dict:
+        raise Exception('rover input must be a dict')
+    
+    # Check that the planet input is a dict
+    if type(planet) != dict:
+        raise Exception('planet input must be a dict')
+    
+    # Check that the experiment input is a dict
+    if type(experiment) != dict:
+        raise Exception('experiment input must be a dict')
+    
+    # Check that Crr is a positive scalar (same check as F_net)
+    Crr = experiment['Crr']
+    if (type(Crr) != int) and (type(Crr) != float):
+        raise Exception('Crr must be a scalar')
+    if Crr <= 0:
+        raise Exception('Crr must be a positive number')
+    
+    # Check that the terrain stays within the feasible range
+    if np.max(np.abs(experiment['alpha_deg'])) > 75:
+        raise Exception('All terrain angles must be between -75 degrees and +75 degrees')
+    
+    motor = rover['wheel_assembly']['motor']
+    r = rover['wheel_assembly']['wheel']['radius']
+    if r <= 0:
+        raise Exception('wheel radius must be a positive number')
+    if motor['speed_noload'] <= 0:
+        raise Exception('motor no-load speed must be a positive number')
+    
+    Ng = get_gear_ratio(rover['wheel_assembly']['speed_reducer'])
+    
+    params = {'m' : get_mass_rover(rover),
+              'Ng' : Ng,
+              'r' : r,
+              'tau_s' : motor['torque_stall'],
+              'tau_nl' : motor['torque_noload'],
+              'omega_nl' : motor['speed_noload'],
+              'g' : planet['g'],
+              'Crr' : np.sqrt(0.0005/r) + 0.05,
+              'effcy_map' : get_efficiency_map(motor),
+              'battery_capacity' : rover['power_subsys']['battery']['capacity']}
+    
+    return params
+
+def rover_dynamics_fast(t, y, params, terrain):
+    """
+    Inputs:         t:  scalar            Time sample [s]
+                    y:  numpy array       Rover state [velocity, position]
+                                          or [velocity, position, battery 
+                                          energy used]
+               params:  dict              Compiled rover record from 
+                                          compile_rover
+              terrain:  dict              Terrain profile from 
+                                          define_terrain_profile
+    
+    Outputs:     dydt:  numpy array       [acceleration, velocity] or
+                                          [acceleration, velocity, battery
+                                          power]
+    
+    Same model as rover_dynamics (F_drive - F_rollingCorr - F_gravity) on 
+    scalars, with no dict traversal or input checking. Inputs are assumed to
+    have been validated by compile_rover. With a three element state the 
+    battery power of all six motors (the integrand of battenergy) is 
+    returned as the third derivative, so the energy is integrated along
+    with the motion.
+    """
+    
+    v = y[0]
+    m = params['m']
+    g = params['g']
+    Ng = params['Ng']
+    r = params['r']
+    
+    # motor torque from the speed-torque curve
+    omega = v*Ng/r
+    omega_nl = params['omega_nl']
+    if omega < 0:
+        tau = params['tau_s']
+    elif omega > omega_nl:
+        tau = 0.0
+    else:
+        tau = params['tau_s'] - (params['tau_s'] - params['tau_nl'])/omega_nl*omega
+    
+    alpha = math.radians(terrain_angle(terrain, y[1]))
+    
+    Fd = 6*tau*Ng/r
+    Frr = -math.erf(40*v)*params['Crr']*m*g*math.cos(alpha)
+    Fg = -m*g*math.sin(alpha)
+    
+    if len(y) == 2:
+        return np.array([(Fd - Frr - Fg)/m, v])
+    
+    # battery power of the six motors, from the motor's precomputed table
+    P_batt = 6*battery_power(params['effcy_map'], omega)
+    
+    return np.array([(Fd - Frr - Fg)/m, v, P_batt])
+
+def rover_jacobian_fast(t, y, params, terrain):
+    """
+    Inputs:         t:  scalar            Time sample [s]
+                    y:  numpy array       Rover state [velocity, position]
+                                          or [velocity, position, battery 
+                                          energy used]
+               params:  dict              Compiled rover record from 
+                                          compile_rover
+              terrain:  dict              Terrain profile from 
+                                          define_terrain_profile
+    
+    Outputs:        J:  numpy array       Jacobian of rover_dynamics_fast 
+                                          with respect to y (2x2 or 3x3)
+    
+    Closed form: the slope of the linear motor curve (zero above the 
+    no-load speed and when back-driven), the derivative of the erf(40 v)
+    rolling resistance term, the terrain angle slope from the terrain 
+    spline and the slope of the battery power table. Used as the jac of
+    the stiff solvers in simulate_rover in place of finite differences.
+    """
+    
+    v = y[0]
+    m = params['m']
+    g = params['g']
+    Crr = params['Crr']
+    omega_to_v = params['Ng']/params['r']
+    
+    omega = v*omega_to_v
+    omega_nl = params['omega_nl']
+    if 0 <= omega <= omega_nl:
+        dtau = -(params['tau_s'] - params['tau_nl'])/omega_nl
+    else:
+        dtau = 0.0
+    
+    alpha_deg, dalpha_deg = _spline_eval_slope(terrain, y[1])
+    alpha = math.radians(alpha_deg)
+    sin_a = math.sin(alpha)
+    cos_a = math.cos(alpha)
+    
+    dadv = 6*dtau*omega_to_v**2/m + (80/math.sqrt(math.pi))*math.exp(-1600*v*v)*Crr*g*cos_a
+    dadx = (g*cos_a - math.erf(40*v)*Crr*g*sin_a)*math.radians(dalpha_deg)
+    
+    if len(y) == 2:
+        return np.array([[dadv, dadx], 
+                         [1.0, 0.0]])
+    
+    dPdv = 6*battery_power_slope(params['effcy_map'], omega)*omega_to_v
+    
+    return np.array([[dadv, dadx, 0.0],
+                     [1.0, 0.0, 0.0],
+                     [dPdv, 0.0, 0.0]])
+
+def end_of_mission_event(end_event, max_energy=None):
     """
     Defines an event that terminates the mission simulation. Mission is over
     when rover reaches a certain distance, has moved for a maximum simulation 
     time or has reached a minimum velocity.            
+    
+    If max_energy [J] is given, the state is assumed to be [v, x, E] and a
+    fourth event ends the mission when the battery energy used, y[2], 
+    reaches max_energy (battery depleted).
     """
     
     mission_distance = end_event['max_distance']
@@ -1017,9 +1469,83 @@ def end_of_mission_event(end_event):
     
     events = [distance_left, time_left, velocity_threshold]
     
+    if max_energy is not None:
+        energy_left = lambda t,y: max_energy - y[2]
+        energy_left.terminal = True
+        energy_left.direction = -1
+        events.append(energy_left)
+    
     return events
 
-def simulate_rover(rover,planet,experiment,end_event):
+def rover_energy_budget(rover, end_event):
+    """
+    Inputs:     rover:  dict              Data structure specifying rover 
+                                          parameters
+            end_event:  dict              Data dictionary of mission end 
+                                          conditions
+    
+    Outputs: max_energy:  scalar          Battery energy [J] at which the 
+                                          rover mission is stopped
+    
+    The battery capacity, or, if end_event has a 'max_energy_per_distance' 
+    budget [J/m], the budget for the full mission distance when that is
+    smaller. Past that point the design is infeasible whatever the rest of
+    the mission does (the energy used only grows and the distance cannot 
+    exceed max_distance), so there is no point integrating further.
+    """
+    
+    max_energy = rover['power_subsys']['battery']['capacity']
+    
+    if end_event.get('max_energy_per_distance') is not None:
+        max_energy = min(max_energy, end_event['max_energy_per_distance']*end_event['max_distance'])
+    
+    return max_energy
+
+def _final_state(sol):
+
+    # Final time and state of a solve_ivp run made with t_eval=[t_final].
+    # If a terminal event stopped the run early, t_eval holds nothing, and
+    # the final state is the last event state recorded (the one that 
+    # terminated the integration).
+
+    if sol.status == 1:
+        t_end = -np.inf
+        y_end = None
+        for te, ye in zip(sol.t_events, sol.y_events):
+            if len(te) > 0 and te[-1] >= t_end:
+                t_end = te[-1]
+                y_end = ye[-1]
+        return float(t_end), np.array(y_end)
+    
+    return float(sol.t[-1]), sol.y[:, -1].copy()
+
+def define_rover_step_policy():
+    """
+    Outputs:   policy:  dict              Integrator settings of 
+                                          simulate_rover: method (a 
+                                          scipy.integrate OdeSolver name), 
+                                          max_step [s], rtol, atol and 
+                                          jacobian ('analytic' for 
+                                          rover_jacobian_fast, 
+                                          'finite_difference' for the 
+                                          solver's own estimate)
+    
+    simulate_rover uses rover['step_policy'] if the rover has one (only 
+    the settings it changes are needed) and this default otherwise. The
+    rolling resistance makes the rover stiff near v = 0, hence BDF. The
+    traverse is smooth, so the step is only limited (20 s) to keep a 
+    velocity dip from hiding inside one step of the min_velocity event; 
+    rtol=1e-6 keeps completion time and energy within a few 1e-6 of a 
+    tight reference, better than the former max_step=1.0 at rtol=1e-3 with
+    a tenth of the right-hand side evaluations (see 
+    benchmarks.benchmark_step_policies).
+    """
+    
+    policy = {'method' : 'BDF', 'max_step' : 20.0, 'rtol' : 1e-6, 'atol' : 1e-6, 'jacobian' : 'analytic'}
+    
+    return policy
+
+def simulate_rover(rover,planet,experiment,end_event,summary=False):
     """
     Inputs:     rover:  dict              Data structure specifying rover 
                                           parameters
@@ -1031,9 +1557,25 @@ def simulate_rover(rover,planet,experiment,end_event):
                                           conditions necessary and sufficient 
                                           to terminate simulation of rover 
                                           dynamics                 
+              summary:  bool              (optional) If True, only the mission
+                                          scalars are computed: no telemetry
+                                          arrays are stored
     
     Outputs:    rover:  dict              Updated rover structure including 
-                                          telemetry information
+                                          telemetry information 
+                                          (average_velocity is 
+                                          distance_traveled/completion_time).
+                                          In summary mode telemetry only 
+                                          holds completion_time, 
+                                          distance_traveled, average_velocity,
+                                          battery_energy, energy_per_distance
+                                          and battery_depleted.
+    
+    The state integrated is [velocity, position, battery energy used]; the
+    battery energy is integrated with the motion (rover_dynamics_fast) and
+    the mission also ends when it reaches the battery capacity or the 
+    end_event energy budget (see rover_energy_budget). telemetry
+    ['battery_depleted'] records whether that is what ended it.
     """
     # Check that the rover input is a dict
     if type(rover) != dict:
@@ -1052,17 +1594,38 @@ def simulate_rover(rover,planet,experiment,end_event):
         raise Exception('end_event input must be a dict')
     
     # Main Code
-    fun = lambda t,y: rover_dynamics(t, y, rover, planet, experiment) # differential equation
+    terrain = define_terrain_profile(experiment) # terrain spline, built once per mission
+    params = compile_rover(rover, planet, experiment) # validated, flattened rover parameters
+    fun = lambda t,y: rover_dynamics_fast(t, y, params, terrain) # differential equation
+    jac = lambda t,y: rover_jacobian_fast(t, y, params, terrain) # its analytic Jacobian
     t_span = experiment['time_range'] # time span
-    y0 = experiment['initial_conditions'].ravel() # initial conditions
-    events = end_of_mission_event(end_event) # stopping criteria
-    sol = solve_ivp(fun, t_span, y0, method = 'BDF', events=events, max_step=1.0) #t_eval=(np.linspace(0, 3000, 1000)))  # need a stiff solver like BDF
+    y0 = np.append(experiment['initial_conditions'].ravel()[:2], 0.0) # initial conditions, no energy used yet
+    events = end_of_mission_event(end_event, rover_energy_budget(rover, end_event)) # stopping criteria
+    settings = {**define_rover_step_policy(), **rover.get('step_policy', {})} # integrator settings
+    if settings.pop('jacobian') == 'analytic' and settings['method'] in ('BDF', 'Radau', 'LSODA'):
+        settings['jac'] = jac # implicit solvers only; the others take no Jacobian
+    
+    if summary:
+        # only keep the final state
+        sol = solve_ivp(fun, t_span, y0, events=events, t_eval=[t_span[1]], **settings)
+        t_end, y_end = _final_state(sol)
+        distance = y_end[1]
+        E = y_end[2]
+        rover['telemetry'] = {'completion_time' : t_end,
+                              'distance_traveled' : distance,
+                              'average_velocity' : distance/t_end if t_end > 0 else 0.0,
+                              'battery_energy' : E,
+                              'energy_per_distance' : E/distance,
+                              'battery_depleted' : sol.status == 1 and len(sol.t_events[3]) > 0}
+        return rover
+    
+    sol = solve_ivp(fun, t_span, y0, events=events, **settings) #t_eval=(np.linspace(0, 3000, 1000)))  # need a stiff solver like BDF
     
     # extract necessary data
     v_max = max(sol.y[0,:])
-    v_avg = mean(sol.y[0,:])
+    v_avg = sol.y[1,-1]/sol.t[-1] if sol.t[-1] > 0 else 0.0 # distance over time, as in summary mode
     P = mechpower(sol.y[0,:], rover)
-    E = battenergy(sol.t,sol.y[0,:],rover)
+    E = sol.y[2,-1] # integrated with the motion; battenergy(sol.t,sol.y[0,:],rover) is the trapz estimate
     
     # Add telemetry info to rover dict
     telemetry = {'Time' : sol.t,
@@ -1074,281 +1637,1205 @@ def simulate_rover(rover,planet,experiment,end_event):
                  'average_velocity' : v_avg,
                  'power' : P,
                  'battery_energy' : E,
-                 'energy_per_distance' : E/sol.y[1,-1]}
+                 'energy_per_distance' : E/sol.y[1,-1],
+                 'battery_depleted' : sol.status == 1 and len(sol.t_events[3]) > 0}
     
     rover['telemetry'] = telemetry
     return rover
 
-def edl_events(edl_system, mission_events):
-
-    # Defines events that occur in EDL System simulation.
-    #
-    # y = [ velocity, altitude, fuel_mass] and more
-    #
-    #
-    # 0. Reached altitude to eject heat shield 
-    # 1. Reached altitude to eject parachute 
-    # 2. Reached altitude to turn on rockets 
-    # 3. Reached altitude to turn on crane & altitude control
-    # 4. Out of fuel --> y(3)<=0. Terminal. Direction: -1.
-    # 5. EDL System crashed at zero altitude
-    # 6. Reached speed at which speed-controlled descent is required
-    # 7. Reached position at which altitude control is required
-    # 8. Rover has touched down on surface of Mars
-
-    
-    event0 = lambda t, y: y[1] - mission_events['alt_heatshield_eject'] - int(edl_system["heat_shield"]["ejected"])*999999
-    event0.terminal = True
-    event0.direction = -1
+def rover_dynamics_distance(x, z, params, terrain):
+    """
+    Inputs:         x:  scalar            Rover position [m]
+                    z:  numpy array       Rover state [velocity, time, 
+                                          battery energy used]
+               params:  dict              Compiled rover record from 
+                                          compile_rover
+              terrain:  dict              Terrain profile from 
+                                          define_terrain_profile
+    
+    Outputs:     dzdx:  numpy array       [acceleration/velocity, 
+                                          1/velocity, battery power/velocity]
+    
+    rover_dynamics_fast with position as the independent variable 
+    (dz/dx = dz/dt / v). Only valid while the rover moves forward (v > 0);
+    simulate_rover_distance stops at min_velocity well before v = 0.
+    """
     
-    event1 = lambda t, y: y[1] - mission_events['alt_parachute_eject'] - int(edl_system["parachute"]["ejected"])*999999
-    event1.terminal = True
-    event1.direction = -1
+    v = z[0]
+    a, _, P_batt = rover_dynamics_fast(z[1], np.array([v, x, z[2]]), params, terrain)
     
-    event2 = lambda t, y: y[1] - mission_events['alt_rockets_on'] - int(edl_system["rocket"]["on"])*999999
-    event2.terminal = True
-    event2.direction = -1
+    return np.array([a/v, 1/v, P_batt/v])
 
-    event3 = lambda t, y: y[1] - mission_events['alt_skycrane_on'] - int(edl_system["sky_crane"]["on"])*999999
-    event3.terminal = True
-    event3.direction = -1
+def rover_jacobian_distance(x, z, params, terrain):
+    """
+    Inputs:         x:  scalar            Rover position [m]
+                    z:  numpy array       Rover state [velocity, time, 
+                                          battery energy used]
+               params:  dict              Compiled rover record from 
+                                          compile_rover
+              terrain:  dict              Terrain profile from 
+                                          define_terrain_profile
+    
+    Outputs:        J:  numpy array       Jacobian of rover_dynamics_distance
+                                          with respect to z (3x3)
+    
+    Only the velocity column is nonzero: d(a/v)/dv = (v*da/dv - a)/v^2 and
+    likewise for 1/v and P/v, with da/dv and dP/dv from 
+    rover_jacobian_fast.
+    """
     
-    event4 = lambda t, y: y[2] 
-    event4.terminal = True
-    event4.direction = -1
+    v = z[0]
+    y = np.array([v, x, z[2]])
+    a, _, P_batt = rover_dynamics_fast(z[1], y, params, terrain)
+    J = rover_jacobian_fast(z[1], y, params, terrain)
     
-    event5 = lambda t, y: y[1]
-    event5.terminal = True
-    event5.direction = -1
+    return np.array([[(J[0, 0]*v - a)/v**2, 0.0, 0.0],
+                     [-1/v**2, 0.0, 0.0],
+                     [(J[2, 0]*v - P_batt)/v**2, 0.0, 0.0]])
+
+def end_of_mission_event_distance(end_event, max_energy):
+    """
+    Events of simulate_rover_distance, for the state [v, t, E] integrated 
+    over position. The mission ends when the rover has moved for the 
+    maximum time, has slowed down to the minimum velocity or has used 
+    max_energy [J] of the battery. The distance is the independent 
+    variable, so there is no distance event: the integration simply ends 
+    at max_distance.
+    """
     
-    event6 = lambda t, y: y[0] - 3*edl_system['speed_control']['target_velocity'] + int(edl_system["speed_control"]["on"])*999999
-    event6.terminal = True
-    event6.direction = 1
+    mission_max_time = end_event['max_time']
+    mission_min_velocity = end_event['min_velocity']
     
-    event7 = lambda t, y: y[1] - 1.2*mission_events['alt_skycrane_on'] - int(edl_system["position_control"]["on"])*999999
-    event7.terminal = True
-    event7.direction = -1
+    time_left = lambda x,z: mission_max_time - z[1]
+    time_left.terminal = True
+    time_left.direction = -1
     
-    event8 = lambda t, y: y[1] + y[6]
-    event8.terminal = True
-    event8.direction = -1
-
+    # stall guard: dz/dx grows like 1/v, so the rover must not get near v = 0
+    velocity_threshold = lambda x,z: z[0] - mission_min_velocity
+    velocity_threshold.terminal = True
+    velocity_threshold.direction = -1
     
-    events = [event0, event1, event2, event3, event4, event5, event6, event7, event8]
+    energy_left = lambda x,z: max_energy - z[2]
+    energy_left.terminal = True
+    energy_left.direction = -1
+    
+    events = [time_left, velocity_threshold, energy_left]
     
     return events
 
-def edl_dynamics(t, y, edl_system, planet):
-
-    # Dynamics of EDL as it descends and lowers the rover to the surface. 
-    # State vector: 
-    #   y=[vel_edl;pos_edl;fuel_mass;ei_vel;ei_pos;vel_rov;pos_rov]
-    #   ydot=[accel_edl;vel_edl;dmdt;e_vel;e_pos;accel_rov;vel_rov]
-    # 
-    # edl altitude, velocity and acceleration are absolute
-    # rov is relative to edl
-    # fuel_mass is total over all rockets
-    #
-    # 
-    # Note: this is a VARIABLE MASS SYSTEM, which means Newton's second law
-    # expressed as F=ma cannot be used. The more fundamental relationship is 
-    # F = dp/dt, where p is the momentum of the system. (For a particle, p=mv
-    # and if m is constant you recover the F=ma form easily.) It is important
-    # to consider the momentum contributions of the EDL system and propellant 
-    # being expelled from the rocket. Ultimately you end up with something that
-    # roughly resembles Newton's second law: F_ext + v_rel*(dm/dt) = ma where m
-    # is the mass of the EDL, dm/dt is the rate at which mass is changing (due
-    # to propellant being expelled), v_rel is the speed at which propellant is
-    # being expelled, a is the acceleration of the EDL and F_ext is the sum of
-    # other forces acting on the EDL (drag, bouyancy, gravity). Since
-    # v_rel*(dm/dt) is a force, we can write this as F_ext + F_thrust = ma,
-    # which is very Newton-like.
-    #
-    #
-    #
-
-
-    # ********************************************
-    # unpack the input state vector into variables with more readable names
-    # 
-    vel_edl = y[0]       # [m/s] velocity of EDL system
-    altitude_edl = y[1]  # [m] altitude of EDL system
-    fuel_mass = y[2]     # [kg] total mass of fuel in EDL system 
-    ei_vel = y[3]        # [m/s] error integral for velocity error 
-    ei_pos = y[4]        # [m] error integral for position (altitude) error 
-    vel_rov = y[5]       # [m/s] velocity of rover relative to sky crane
-    pos_rov = y[6]       # [m] position of rover relative to sky crane
-    
-    # ***
-    # Record the current mass of the system. Since the edl_system being passed
-    # is the initial state system, need to update the fuel mass as we go. This
-    # is an artefact of how ode45 and its cousins are implemented.
-    edl_system['rocket']['fuel_mass'] = fuel_mass/edl_system['num_rockets'] 
-    edl_mass = get_mass_edl(edl_system)
-    
-    
-    # Forces EXCEPT THRUST acting on EDL System
-    F_ext = F_gravity_descent(edl_system,planet) + F_buoyancy_descent(edl_system,planet,altitude_edl)+ F_drag_descent(edl_system,planet,altitude_edl,vel_edl)
-
-    # Remove comment if you want some extra debugging display
-    #print('\n')  
-    #print(F_gravity_descent(edl_system,planet))
-    #print(F_buoyancy_descent(edl_system,planet,altitude_edl))
-    #print(F_drag_descent(edl_system,planet,altitude_edl,vel_edl))
-
-
-
-    # ***********************************************************************
-    # Two if statements here for the dynamical state. First one determines the
-    # state of the EDL system. The second determines the state of the sky crane
-    # operation in terms of lowering the rover. Somewhere else, it should be
-    # enforced that the sky crane cannot begin lowering the rover until it is
-    # at an appropriate and stable altitude. Here we just will do the dynamics
-    # of each without regard for whether we should.
-    # ****
+def define_rover_distance_step_policy():
+    """
+    Outputs:   policy:  dict              Integrator settings of 
+                                          simulate_rover_distance: method, 
+                                          max_step [m] (None for the 
+                                          smallest terrain survey spacing), 
+                                          rtol, atol and jacobian (as in 
+                                          define_rover_step_policy)
+    
+    simulate_rover_distance uses rover['distance_step_policy'] if the rover
+    has one (only the settings it changes are needed) and this default 
+    otherwise. Over distance the rover relaxes to its terminal speed 
+    within tau*v (about a centimetre), so the problem is as stiff as in 
+    time at the start and on sharp slope changes, and smooth in between:
+    LSODA switches between the two regimes. rtol=1e-7 keeps completion 
+    time and energy within about 1e-6 of a tight reference, closer than 
+    simulate_rover's default, in about half its time (see 
+    benchmarks.benchmark_rover_distance). Restarting the integration at 
+    every survey point instead of limiting the step to their spacing 
+    doubles the cost for no gain, the terrain spline being C2 there.
+    """
     
-    # ****************
-    # EDL System Dynamics
-    if edl_system['rocket']['on'] and not(edl_system['speed_control']['on']) and not(edl_system['position_control']['on']):
+    policy = {'method' : 'LSODA', 'max_step' : None, 'rtol' : 1e-7, 'atol' : 1e-6, 'jacobian' : 'analytic'}
     
-        # ** Uncontrolled (0.95*max) rocket firing
-        F_thrust = 0.9*edl_system['rocket']['max_thrust']*edl_system['num_rockets']  # Thrust from rockets
-
-        dy1dt = (F_ext+F_thrust)/edl_mass   # acceleration
-        dy2dt = vel_edl                     # velocity
+    return policy
 
-        # Change in total mass of rockets due to propellant being expelled to
-        # produce thrust. Calculate this as F_thrust/v_rel, where v_rel is the
-        # effective exhaust velocity of the propellant
-        dmdt = -(F_thrust/edl_system['rocket']['effective_exhaust_velocity'])
-        
-        # error signals
-        e_vel = 0
-        e_pos = 0
-
-    
-    elif edl_system['rocket']['on'] and edl_system['speed_control']['on']:
+def simulate_rover_distance(rover,planet,experiment,end_event,summary=False):
+    """
+    Inputs:     rover:  dict              Data structure specifying rover 
+                                          parameters
+               planet:  dict              Data dictionary specifying planetary 
+                                          parameters
+           experiment:  dict              Data dictionary specifying experiment 
+                                          definition
+            end_event:  dict              Data dictionary containing the 
+                                          conditions necessary and sufficient 
+                                          to terminate simulation of rover 
+                                          dynamics                 
+              summary:  bool              (optional) If True, only the mission
+                                          scalars are computed: no telemetry
+                                          arrays are stored
     
-        # ** This is the dynamical regime for when the rockets are firing 
-        # ** with a speed controller    
-        
-        # PID gains
-        Kp = edl_system['speed_control']['Kp']
-        Kd = edl_system['speed_control']['Kd']
-        Ki = edl_system['speed_control']['Ki']
-
+    Outputs:    rover:  dict              Updated rover structure including 
+                                          telemetry information, with the 
+                                          same keys as simulate_rover
+    
+    Same mission as simulate_rover, integrated over position instead of 
+    time: the state is [velocity, time, battery energy used] and 
+    rover_dynamics_distance gives its derivatives. The end point is the 
+    known max_distance rather than a distance event found inside the time
+    span, and the step is limited to the spacing of the terrain survey 
+    points (alpha_dist), so no step spans more than one change of the 
+    terrain spline polynomial. The time, velocity and energy events of 
+    simulate_rover remain (end_of_mission_event_distance). Telemetry is 
+    sampled in position. A rover that does not start above min_velocity 
+    cannot be integrated over distance and is handed to simulate_rover.
+    """
+    # Check that the rover input is a dict
+    if type(rover) != dict:
+        raise Exception('rover input must be a dict')
     
-        # error and error integral -- can't compute error derivative explicitly
-        # due to an implicit relationship. Error derivative, dedt, is equal to
-        # dy1dt (acceleration). However, we need dedt to compute F_thrust and
-        # F_thrust to compute dy1dt. So the solution is to rearrange thing
-        # symbolically so that we eliminate the error derivative term.
-        e_vel = edl_system['speed_control']['target_velocity']-vel_edl
+    # Check that the planet input is a dict
+    if type(planet) != dict:
+        raise Exception('planet input must be a dict')
     
+    # Check that the experiment input is a dict
+    if type(experiment) != dict:
+        raise Exception('experiment input must be a dict')
+        
+    # Check that the end_event input is a dict
+    if type(end_event) != dict:
+        raise Exception('end_event input must be a dict')
     
-        num = (Kp*e_vel + Kd*(F_ext/edl_mass) + Ki*ei_vel) - edl_mass*planet['g']
-        den = (1-Kd/edl_mass)
-        F_thrust = num/den
+    v0, x0 = experiment['initial_conditions'].ravel()[:2]
+    x_end = end_event['max_distance']
+    if v0 <= end_event['min_velocity'] or x0 >= x_end:
+        return simulate_rover(rover, planet, experiment, end_event, summary=summary)
     
-        # this ensures we never try to reverse thrust (which is impossible in
-        # this system)
-        F_thrust = max(edl_system['num_rockets']*edl_system['rocket']['min_thrust'], F_thrust)
+    # Main Code
+    terrain = define_terrain_profile(experiment) # terrain spline, built once per mission
+    params = compile_rover(rover, planet, experiment) # validated, flattened rover parameters
+    fun = lambda x,z: rover_dynamics_distance(x, z, params, terrain) # differential equation in position
+    jac = lambda x,z: rover_jacobian_distance(x, z, params, terrain) # its analytic Jacobian
+    events = end_of_mission_event_distance(end_event, rover_energy_budget(rover, end_event)) # stopping criteria
+    settings = {**define_rover_distance_step_policy(), **rover.get('distance_step_policy', {})} # integrator settings
+    if settings.pop('jacobian') == 'analytic' and settings['method'] in ('BDF', 'Radau', 'LSODA'):
+        settings['jac'] = jac # implicit solvers only; the others take no Jacobian
+    if settings['max_step'] is None:
+        settings['max_step'] = np.min(np.diff(terrain['breaks'])) # one survey interval at most
+    x_span = (x0, x_end) # position span
+    z0 = np.array([v0, 0.0, 0.0]) # velocity, no time taken and no energy used yet
+    
+    if summary:
+        # only keep the final state
+        sol = solve_ivp(fun, x_span, z0, events=events, t_eval=[x_end], **settings)
+        x_stop, z = _final_state(sol)
+        rover['telemetry'] = {'completion_time' : z[1],
+                              'distance_traveled' : x_stop,
+                              'average_velocity' : x_stop/z[1] if z[1] > 0 else 0.0,
+                              'battery_energy' : z[2],
+                              'energy_per_distance' : z[2]/x_stop,
+                              'battery_depleted' : sol.status == 1 and len(sol.t_events[2]) > 0}
+        return rover
+    
+    sol = solve_ivp(fun, x_span, z0, events=events, **settings)
+    position = sol.t
+    Z = sol.y
+    
+    telemetry = {'Time' : Z[1,:],
+                 'completion_time' : Z[1,-1],
+                 'velocity' : Z[0,:],
+                 'position' : position,
+                 'distance_traveled' : position[-1],
+                 'max_velocity' : max(Z[0,:]),
+                 'average_velocity' : position[-1]/Z[1,-1] if Z[1,-1] > 0 else 0.0,
+                 'power' : mechpower(Z[0,:], rover),
+                 'battery_energy' : Z[2,-1],
+                 'energy_per_distance' : Z[2,-1]/position[-1],
+                 'battery_depleted' : sol.status == 1 and len(sol.t_events[2]) > 0}
     
-        # this checks for saturation of thrust (more than 100# of what rockets
-        # can deliver)
-        F_thrust = min(F_thrust, edl_system['num_rockets']*edl_system['rocket']['max_thrust'])
-        
-      
-        # acceleration and velocity, respectively 
-        dy1dt = (F_ext + F_thrust)/edl_mass
-        dy2dt = vel_edl
+    rover['telemetry'] = telemetry
+    return rover
+
+def rover_terminal_speed(params, alpha):
+    """
+    Inputs:    params:  dict              Compiled rover record from 
+                                          compile_rover
+                alpha:  scalar or         Terrain angle(s) [deg]
+                        numpy array
+    
+    Outputs:   v_term:  numpy array       Terminal speed [m/s]: the speed at
+                                          which the net force on the rover is
+                                          zero. 0 where the rover stalls on 
+                                          the slope, inf where it keeps 
+                                          accelerating downhill past the 
+                                          motor no-load speed
+            dv_dalpha:  numpy array       d(v_term)/d(alpha) [m/s/deg] 
+                                          (0 where v_term is 0, inf or the
+                                          no-load speed)
+    
+    Below the no-load speed the drive force is A - B*v, so (with g < 0)
+    the net force A - B*v + erf(40 v)*Crr*m*g*cos(alpha) + m*g*sin(alpha)
+    is decreasing and convex in v, and 0 <= erf <= 1 brackets the root 
+    between closed-form bounds. Newton's method from the lower bound 
+    climbs monotonically onto it (usually in one step, since erf(40 v) is 
+    already 1 there). The slope follows from the implicit function 
+    theorem.
+    """
     
+    alpha = np.radians(np.asarray(alpha, dtype=float))
+    m = params['m']
+    mg = m*params['g']
+    Crr = params['Crr']
+    omega_to_v = params['r']/params['Ng']
+    v_nl = params['omega_nl']*omega_to_v
+    A = 6*params['tau_s']/omega_to_v
+    B = 6*(params['tau_s'] - params['tau_nl'])/params['omega_nl']/omega_to_v**2
+    
+    sin_a = np.sin(alpha)
+    cos_a = np.cos(alpha)
+    F_stall = A + mg*sin_a                                   # net force at v = 0
+    F_top = A - B*v_nl + erf(40*v_nl)*Crr*mg*cos_a + mg*sin_a # at v_nl, on the motor curve
+    F_free = erf(40*v_nl)*Crr*mg*cos_a + mg*sin_a             # just above v_nl (no torque)
+    
+    solve = (F_stall > 0) & (F_top < 0)
+    v = np.where(solve, np.clip((F_stall + Crr*mg*cos_a)/B, 0.0, v_nl), 0.0)
+    for _ in range(20):
+        F = A - B*v + erf(40*v)*Crr*mg*cos_a + mg*sin_a
+        dFdv = -B + (80/math.sqrt(math.pi))*np.exp(-1600*v*v)*Crr*mg*cos_a
+        dv = np.where(solve, -F/dFdv, 0.0)
+        v = v + dv
+        if np.all(np.abs(dv) <= 1e-14*v_nl):
+            break
+    
+    dFda = (mg*cos_a - erf(40*v)*Crr*mg*sin_a)*math.pi/180
+    dv_dalpha = np.where(solve, -dFda/dFdv, 0.0)
+    
+    v = np.where(F_stall > 0, v, 0.0)
+    on_nl = (F_top >= 0) & (F_free < 0)
+    v = np.where(on_nl, v_nl, np.where(F_top >= 0, np.inf, v))
+    dv_dalpha = np.where(F_top >= 0, 0.0, dv_dalpha)
+    
+    return v, dv_dalpha
+
+# Most recently used terminal speed tables, keyed by the rover parameters 
+# they depend on (see define_terminal_speed_table). Unlike the efficiency
+# maps the key holds continuous design variables, so the registry is 
+# bounded: a design study would otherwise keep one table per design.
+_TERMINAL_SPEED_TABLES = OrderedDict()
+_TERMINAL_SPEED_TABLES_MAXSIZE = 32
 
-        # Change in total mass of rockets due to propellant being expelled to
-        # produce thrust. Calculate this as F_thrust/v_rel, where v_rel is the
-        # effective exhaust velocity of the propellant
-        dmdt = -(F_thrust/edl_system['rocket']['effective_exhaust_velocity'])
+def define_terminal_speed_table(params, n_alpha=601):
+    """
+    Inputs:    params:  dict              Compiled rover record from 
+                                          compile_rover
+              n_alpha:  int               (optional) Number of terrain 
+                                          angles in the table (uniform on
+                                          [-75, 75] deg)
+    
+    Outputs:    table:  dict              Terminal speed vs. terrain angle:
+                                          a piecewise cubic in the 
+                                          _spline_table format (evaluate it
+                                          with _spline_eval/_spline_eval_slope)
+                                          plus 'err', the interpolation error
+                                          of each segment [m/s]
+    
+    Cubic Hermite interpolation of rover_terminal_speed and its slope, 
+    built once per rover and kept in a small least recently used registry
+    (the last _TERMINAL_SPEED_TABLES_MAXSIZE rovers).
+    err is measured against a direct solve at each segment midpoint; it is
+    inf for segments touching a stall (0) or runaway (inf) point, where 
+    the quasi-steady model does not apply.
+    """
     
-        # position error
-        e_pos = 0
+    key = tuple(float(params[k]) for k in ('m', 'Ng', 'r', 'tau_s', 'tau_nl', 'omega_nl', 'g', 'Crr')) + (n_alpha,)
+    if key in _TERMINAL_SPEED_TABLES:
+        _TERMINAL_SPEED_TABLES.move_to_end(key)
+        return _TERMINAL_SPEED_TABLES[key]
+    
+    alpha = np.linspace(-75, 75, n_alpha)
+    v, dv = rover_terminal_speed(params, alpha)
+    
+    # Hermite segments; c[k,i] multiplies (alpha - alpha_i)**(3-k)
+    h = alpha[1] - alpha[0]
+    valid = np.isfinite(v[:-1]) & np.isfinite(v[1:]) & (v[:-1] > 0) & (v[1:] > 0)
+    y0 = np.where(valid, v[:-1], 0.0)
+    y1 = np.where(valid, v[1:], 0.0)
+    d0 = np.where(valid, dv[:-1], 0.0)
+    d1 = np.where(valid, dv[1:], 0.0)
+    delta = (y1 - y0)/h
+    c = np.array([(d0 + d1 - 2*delta)/h**2, 
+                  (3*delta - 2*d0 - d1)/h, 
+                  d0, 
+                  y0])
+    
+    table = {'breaks' : alpha,
+             'coeffs' : c,
+             'breaks_list' : alpha.tolist(),
+             'coeffs_list' : list(zip(c[0].tolist(), c[1].tolist(), c[2].tolist(), c[3].tolist()))}
+    
+    v_mid, _ = rover_terminal_speed(params, alpha[:-1] + h/2)
+    err = np.abs(_spline_eval(table, alpha[:-1] + h/2) - v_mid)
+    table['err'] = np.where(valid & np.isfinite(v_mid) & (v_mid > 0), err, np.inf)
+    
+    _TERMINAL_SPEED_TABLES[key] = table
+    if len(_TERMINAL_SPEED_TABLES) > _TERMINAL_SPEED_TABLES_MAXSIZE:
+        _TERMINAL_SPEED_TABLES.popitem(last=False)
+    
+    return table
+
+def _quasi_steady_integrands(x, params, terrain, table):
+
+    # Integrands of simulate_rover_quasi_steady at positions x (numpy 
+    # array): the terminal speed v, time per metre 1/v and battery energy
+    # per metre P/v, each with its first order lag correction added (the
+    # rover runs at v = v_term - tau*v_term*dv_term/dx behind slope 
+    # changes), the size of that correction and the effect of the table
+    # interpolation error on both integrands.
+
+    omega_to_v = params['r']/params['Ng']
+    alpha, dalpha_dx = _spline_eval_slope(terrain, x)
+    v, dv_dalpha = _spline_eval_slope(table, alpha)
+    i = np.clip(np.searchsorted(table['breaks'], alpha, side='right') - 1, 0, len(table['err']) - 1)
+    v_err = table['err'][i]
+    
+    omega = v/omega_to_v
+    P = 6*battery_power(params['effcy_map'], omega)
+    dPdv = 6*battery_power_slope(params['effcy_map'], omega)/omega_to_v
+    dPv_dv = (dPdv*v - P)/v**2
+    
+    # v - v_term = -tau*v_term*dv_term/dx shifts 1/v by tau*(dv_term/dx)/v_term
+    lag_t = _rover_relaxation_time(params, v, alpha)*dv_dalpha*dalpha_dx/v
+    lag_E = -dPv_dv*lag_t*v**2
+    
+    ig = {'v' : v,
+          'time' : 1/v + lag_t,
+          'energy' : P/v + lag_E,
+          'time_lag' : np.abs(lag_t),
+          'energy_lag' : np.abs(lag_E),
+          'time_err' : v_err/v**2,
+          'energy_err' : np.abs(dPv_dv)*v_err,
+          'P' : P,
+          'dPdv' : dPdv}
+    
+    return ig
+
+def _rover_relaxation_time(params, v, alpha):
+
+    # tau = -1/(da/dv) at speed v on terrain angle alpha [deg]: the time 
+    # constant with which the rover settles onto its terminal speed.
+
+    omega_to_v = params['r']/params['Ng']
+    B = 6*(params['tau_s'] - params['tau_nl'])/params['omega_nl']/omega_to_v**2
+    dFrr = (80/math.sqrt(math.pi))*np.exp(-1600*v*v)*params['Crr']*params['m']*params['g']*np.cos(alpha*math.pi/180)
     
-    elif edl_system['rocket']['on'] and edl_system['position_control']['on']:
+    return params['m']/(B - dFrr)
+
+def _quasi_steady_deviation(y, params, terrain, table):
+
+    # Relative deviation of the rover speed y[0] at position y[1] from the
+    # quasi-steady speed v_term - tau*v_term*dv_term/dx (scalar version of
+    # _quasi_steady_integrands, for the start transient event).
+
+    alpha, dalpha_dx = _spline_eval_slope(terrain, y[1])
+    v, dv_dalpha = _spline_eval_slope(table, alpha)
+    v_qs = v - _rover_relaxation_time(params, v, alpha)*v*dv_dalpha*dalpha_dx
     
-        # ** This is the dynamical regime for when the rockets are firing 
-        # ** with an altitude controller    
-        
-        Kp = edl_system['position_control']['Kp']
-        Kd = edl_system['position_control']['Kd']
-        Ki = edl_system['position_control']['Ki']
+    return y[0]/v_qs - 1
 
+def simulate_rover_quasi_steady(rover, planet, experiment, end_event, n_nodes=8):
+    """
+    Inputs:     rover:  dict              Data structure specifying rover 
+                                          parameters
+               planet:  dict              Data dictionary specifying planetary 
+                                          parameters
+           experiment:  dict              Data dictionary specifying experiment 
+                                          definition
+            end_event:  dict              Data dictionary containing the 
+                                          conditions necessary and sufficient 
+                                          to terminate simulation of rover 
+                                          dynamics
+              n_nodes:  int               (optional) Gauss-Legendre nodes per
+                                          terrain segment (even)
+    
+    Outputs:    rover:  dict              Updated rover structure with the 
+                                          summary telemetry of simulate_rover
+                                          (completion_time, distance_traveled,
+                                          average_velocity, battery_energy,
+                                          energy_per_distance, 
+                                          battery_depleted), plus 
+                                          quasi_steady and the error bounds
+                                          completion_time_bound [s], 
+                                          distance_traveled_bound [m] and 
+                                          battery_energy_bound [J]
+    
+    Fast alternative to simulate_rover(..., summary=True) for parameter 
+    and route studies. The rover settles onto its terminal speed within a 
+    fraction of a second (tau = -1/(da/dv), about 0.03 s for the baseline
+    design), so along the traverse it runs at v_term(alpha(x)) from 
+    define_terminal_speed_table and
+    
+        t(x) = integral dx/v_term,   E(x) = integral P_batt(v_term)/v_term dx
+    
+    are Gauss-Legendre sums over the terrain segments, with a first order
+    correction for the lag v = v_term - tau*v_term*dv_term/dx behind slope
+    changes. The start from the initial velocity is integrated with the 
+    full dynamics until the rover has settled onto that speed.
+    The mission ends at max_distance, or where E(x) reaches the energy 
+    budget (rover_energy_budget) or t(x) reaches max_time, whichever comes
+    first, as the events of simulate_rover do.
+    
+    The bounds add up the quadrature error estimate (n_nodes against 
+    n_nodes/2), the table interpolation error, the size of the lag 
+    correction (the terms left out are of higher order) and what is left 
+    of the start transient. Where 
+    the quasi-steady picture does not hold -- a stall below min_velocity, 
+    a runaway downhill, or an end condition too close to call within the
+    bounds -- simulate_rover is run instead and quasi_steady is False.
+    """
+    # Check that the rover input is a dict
+    if type(rover) != dict:
+        raise Exception('rover input must be a dict')
+    
+    # Check that the planet input is a dict
+    if type(planet) != dict:
+        raise Exception('planet input must be a dict')
+    
+    # Check that the experiment input is a dict
+    if type(experiment) != dict:
+        raise Exception('experiment input must be a dict')
+        
+    # Check that the end_event input is a dict
+    if type(end_event) != dict:
+        raise Exception('end_event input must be a dict')
     
-        # position error and change in that error. note sign convention. 
-        e_pos = edl_system['position_control']['target_altitude'] - altitude_edl
-        dedt_pos = -vel_edl
+    if n_nodes < 2 or n_nodes % 2:
+        raise Exception('n_nodes must be an even number >= 2')
+    
+    terrain = define_terrain_profile(experiment)
+    params = compile_rover(rover, planet, experiment)
+    table = define_terminal_speed_table(params)
+    max_energy = rover_energy_budget(rover, end_event)
+    max_time = end_event['max_time']
+    
+    v0, x0 = (float(y) for y in experiment['initial_conditions'].ravel()[:2])
+    x_end = float(end_event['max_distance'])
+    breaks = terrain['breaks']
+    edges = np.concatenate(([x0], breaks[(breaks > x0) & (breaks < x_end)], [x_end]))
+    
+    nodes = np.polynomial.legendre.leggauss(n_nodes)
+    nodes_half = np.polynomial.legendre.leggauss(n_nodes//2)
+    
+    def segment_sums(a, b, nodes):
+        # Gauss-Legendre sums of every integrand over the intervals [a, b]
+        u, w = nodes
+        half = (np.atleast_1d(b) - np.atleast_1d(a))[:, None]/2
+        x = np.atleast_1d(a)[:, None] + half*(u + 1)
+        ig = _quasi_steady_integrands(x.ravel(), params, terrain, table)
+        sums = {key : np.sum((half*w)*val.reshape(x.shape), axis=1) for key, val in ig.items() if key != 'v'}
+        sums['v_min'] = np.min(ig['v'].reshape(x.shape), axis=1)
+        return sums
+    
+    S = segment_sums(edges[:-1], edges[1:], nodes)
+    S_half = segment_sums(edges[:-1], edges[1:], nodes_half)
+    
+    quasi_steady = bool(np.all(np.isfinite(S['time_err'])) and np.min(S['v_min']) > end_event['min_velocity'] 
+                        and v0 > end_event['min_velocity'])
+    
+    if quasi_steady:
+        # start transient: integrate the full dynamics until the rover has 
+        # settled onto v_term (less its lag) to within 1e-4; the start can
+        # be far from it, even past the no-load speed. The quasi-steady 
+        # sums over that stretch are then replaced by the result.
+        fun = lambda t,y: rover_dynamics_fast(t, y, params, terrain)
+        settled = lambda t,y: abs(_quasi_steady_deviation(y, params, terrain, table)) - 1e-4
+        settled.terminal = True
+        sol = solve_ivp(fun, (0, 60.0), np.array([v0, x0, 0.0]), method='RK45', 
+                        rtol=1e-6, atol=1e-9, events=settled)
+        t_s, (v_s, x_s, E_s) = _final_state(sol)
+        quasi_steady = sol.status == 1 and x_s < edges[1]
+    
+    if quasi_steady:
+        start = segment_sums(x0, x_s, nodes)
+        start_t = t_s - start['time'][0]
+        start_E = E_s - start['energy'][0]
         
-        # note: planet['g'] is <0 due to sign convention, so negating here gives a
-        # positive valued thrust. 
-        F_thrust = edl_system['num_rockets']*(Kp*e_pos + Kd*dedt_pos + Ki*ei_pos) - planet['g']*edl_mass
+        # what is left of the transient (deviation 1e-4 decaying with tau)
+        # and the integration tolerance
+        ig_s = _quasi_steady_integrands(np.array([x_s]), params, terrain, table)
+        tau_s = _rover_relaxation_time(params, ig_s['v'][0], terrain_angle(terrain, x_s))
+        start_t_bound = 1e-4*tau_s + 1e-6*t_s
+        start_E_bound = 1e-4*tau_s*abs(ig_s['dPdv'][0]*ig_s['v'][0] - ig_s['P'][0]) + 1e-6*E_s
         
-        # enforces a minimum thrust level since we cannot thrust downward
-        F_thrust = max(edl_system['rocket']['min_thrust']*edl_system['num_rockets'], F_thrust)
-           
-        # enforces a maximum thrust level (saturation condition)
-        F_thrust = min(F_thrust, edl_system['num_rockets']*edl_system['rocket']['max_thrust'])
+        # t(x), E(x) and their error bounds at the segment edges
+        t_edge = start_t + np.concatenate(([0.0], np.cumsum(S['time'])))
+        E_edge = start_E + np.concatenate(([0.0], np.cumsum(S['energy'])))
+        t_bound = start_t_bound + np.concatenate(([0.0], np.cumsum(np.abs(S['time'] - S_half['time']) + S['time_err'] + S['time_lag'])))
+        E_bound = start_E_bound + np.concatenate(([0.0], np.cumsum(np.abs(S['energy'] - S_half['energy']) + S['energy_err'] + S['energy_lag'])))
         
-        # velocity and acceleration 
-        dy2dt = vel_edl     
-        dy1dt = (F_ext+F_thrust)/edl_mass
-    
-        # Change in total mass of rockets due to propellant being expelled to
-        # produce thrust. Calculate this as F_thrust/v_rel, where v_rel is the
-        # effective exhaust velocity of the propellant
-        dmdt = -(F_thrust/edl_system['rocket']['effective_exhaust_velocity'])
-    
-         # velocity error 
-        e_vel = 0
+        def crossing(edge_values, key, level):
+            # position where t(x) or E(x) first reaches level (inf if it 
+            # does not): Newton on the running integral, whose derivative
+            # is the integrand
+            k = np.flatnonzero(edge_values[1:] >= level)
+            if len(k) == 0:
+                return np.inf
+            k = k[0]
+            a, b = edges[k], edges[k + 1]
+            x = a + (b - a)*(level - edge_values[k])/(edge_values[k + 1] - edge_values[k])
+            for _ in range(20):
+                residual = edge_values[k] + segment_sums(a, x, nodes)[key][0] - level
+                rate = _quasi_steady_integrands(np.array([x]), params, terrain, table)[key][0]
+                dx = -residual/rate
+                x = min(max(x + dx, a), b)
+                if abs(dx) <= 1e-9*(b - a):
+                    break
+            return x
         
-    else:
+        x_energy = crossing(E_edge, 'energy', max_energy)
+        x_time = crossing(t_edge, 'time', max_time)
+        x_stop = min(x_energy, x_time, x_end)
+        depleted = x_energy == x_stop < x_end
+        timed_out = x_time == x_stop < x_end and not depleted
+        
+        # values and bounds at the end point
+        k = min(np.searchsorted(edges, x_stop, side='right') - 1, len(edges) - 2)
+        last = segment_sums(edges[k], x_stop, nodes)
+        T = t_edge[k] + last['time'][0]
+        E = E_edge[k] + last['energy'][0]
+        T_bound = t_bound[k + 1]
+        E_bound = E_bound[k + 1]
+        
+        # time and energy per metre at the end point turn bounds into distance
+        ig_end = _quasi_steady_integrands(np.array([x_stop]), params, terrain, table)
+        if depleted:
+            x_bound = E_bound/ig_end['energy'][0]
+            T_bound = T_bound + x_bound*ig_end['time'][0]
+            E_bound = 0.0
+        elif timed_out:
+            x_bound = T_bound/ig_end['time'][0]
+            E_bound = E_bound + x_bound*ig_end['energy'][0]
+            T_bound = 0.0
+        else:
+            x_bound = 0.0
         
-        # ** If we get here, we either have not yet fired up the rockets or we
-        # ** have run out of fuel (so thrust and change in mass are zero).
+        # the end condition must be unambiguous within the bounds
+        quasi_steady = x_stop - x_bound > x_s
+        if depleted or timed_out:
+            quasi_steady = quasi_steady and x_stop + x_bound < x_end
+        if not depleted:
+            quasi_steady = quasi_steady and E + E_bound < max_energy
+        if not timed_out:
+            quasi_steady = quasi_steady and T + T_bound < max_time
+    
+    if not quasi_steady:
+        rover = simulate_rover(rover, planet, experiment, end_event, summary=True)
+        rover['telemetry']['quasi_steady'] = False
+        rover['telemetry']['completion_time_bound'] = 0.0
+        rover['telemetry']['distance_traveled_bound'] = 0.0
+        rover['telemetry']['battery_energy_bound'] = 0.0
+        return rover
+    
+    T = max_time if timed_out else float(T)
+    E = max_energy if depleted else float(E)
+    rover['telemetry'] = {'completion_time' : T,
+                          'distance_traveled' : x_stop,
+                          'average_velocity' : x_stop/T if T > 0 else 0.0,
+                          'battery_energy' : E,
+                          'energy_per_distance' : E/x_stop,
+                          'battery_depleted' : depleted,
+                          'quasi_steady' : True,
+                          'completion_time_bound' : float(T_bound),
+                          'distance_traveled_bound' : float(x_bound),
+                          'battery_energy_bound' : float(E_bound)}
+    
+    return rover
+
+def compile_rover_variants(rover, planet, experiment, radius, chassis_mass, diam_gear):
+    """
+    Inputs:        rover:  dict           Base rover definition
+                  planet:  dict           Data dictionary specifying planetary 
+                                          parameters
+              experiment:  dict           Data dictionary specifying experiment 
+                                          definition
+                  radius:  numpy array    Wheel radius of each variant [m]
+            chassis_mass:  numpy array    Chassis mass of each variant [kg]
+               diam_gear:  numpy array    Speed reducer gear diameter of each
+                                          variant [m]
+    
+    Outputs: params_list:  list           compile_rover record of each variant
+    
+    Compiles the rover design variants of a parameter study (the rover 
+    design variables x[1], x[2], x[3] of the optimizer). The three inputs
+    are broadcast against each other. The base rover is not modified.
+    """
+    
+    radius, chassis_mass, diam_gear = np.broadcast_arrays(np.atleast_1d(np.asarray(radius, dtype=float)),
+                                                          np.atleast_1d(np.asarray(chassis_mass, dtype=float)),
+                                                          np.atleast_1d(np.asarray(diam_gear, dtype=float)))
+    
+    variant = {**rover,
+               'wheel_assembly' : {**rover['wheel_assembly'],
+                                   'wheel' : dict(rover['wheel_assembly']['wheel']),
+                                   'speed_reducer' : dict(rover['wheel_assembly']['speed_reducer'])},
+               'chassis' : dict(rover['chassis'])}
+    
+    params_list = []
+    for ii in range(len(radius)):
+        variant['wheel_assembly']['wheel']['radius'] = float(radius[ii])
+        variant['chassis']['mass'] = float(chassis_mass[ii])
+        variant['wheel_assembly']['speed_reducer']['diam_gear'] = float(diam_gear[ii])
+        params_list.append(compile_rover(variant, planet, experiment))
+    
+    return params_list
+
+def stack_rover_params(params_list):
+    """
+    Inputs: params_list:  list            compile_rover records
+    
+    Outputs:      batch:  dict            Same fields as a compile_rover 
+                                          record, each an array with one 
+                                          entry per member (efficiency maps
+                                          are kept as a list)
+    """
+    
+    if len(params_list) == 0:
+        raise Exception('params_list must hold at least one compiled rover')
+    
+    batch = {}
+    for field in ['m', 'Ng', 'r', 'tau_s', 'tau_nl', 'omega_nl', 'g', 'Crr', 'battery_capacity']:
+        batch[field] = np.array([params[field] for params in params_list], dtype=float)
+    batch['effcy_map'] = [params['effcy_map'] for params in params_list]
+    batch['n'] = len(params_list)
+    
+    # members sharing a motor share one efficiency map; group them so the
+    # battery power is one table lookup per distinct motor
+    groups = {}
+    for ii, effcy_map in enumerate(batch['effcy_map']):
+        groups.setdefault(id(effcy_map), (effcy_map, []))[1].append(ii)
+    batch['effcy_groups'] = [(effcy_map, np.array(idx)) for effcy_map, idx in groups.values()]
+    
+    return batch
+
+def _rover_ensemble_members(batch, idx):
+
+    # Parameters of the members idx of an ensemble (compressed once each 
+    # time the set of running members changes, not on every step).
+
+    p = {field : batch[field][idx] for field in ['m', 'Ng', 'r', 'tau_s', 'tau_nl', 'omega_nl', 'g', 'Crr']}
+    p['omega_to_v'] = p['Ng']/p['r']
+    p['slope'] = (p['tau_s'] - p['tau_nl'])/p['omega_nl']
+    p['groups'] = []
+    for effcy_map, gidx in batch['effcy_groups']:
+        sel = np.flatnonzero(np.isin(idx, gidx))
+        if len(sel) == len(idx):
+            sel = slice(None)
+        if len(idx) == 0 or (not isinstance(sel, slice) and len(sel) == 0):
+            continue
+        p['groups'].append((effcy_map, sel))
+    
+    return p
+
+def _rover_ensemble_rhs(y, p, terrain, jac=True):
+
+    # Vectorized rover_dynamics_fast for the running members of an ensemble
+    # (p from _rover_ensemble_members). y is (n,3) with columns [v, x, E].
+    # Returns f (n,3) and, with jac=True, the nonzero entries of each
+    # member's Jacobian: dadv, dadx, dPdv.
+
+    v = y[:, 0]
+    m = p['m']
+    g = p['g']
+    Crr = p['Crr']
+    tau_s = p['tau_s']
+    omega_nl = p['omega_nl']
+    
+    # motor torque from the speed-torque curve
+    omega = v*p['omega_to_v']
+    linear = (omega >= 0) & (omega <= omega_nl)
+    tau = np.where(omega < 0, tau_s, np.where(linear, tau_s - p['slope']*omega, 0.0))
+    
+    alpha_deg, dalpha_dx = _spline_eval_slope(terrain, y[:, 1])
+    alpha = np.radians(alpha_deg)
+    sin_a = np.sin(alpha)
+    cos_a = np.cos(alpha)
+    
+    erf_v = erf(40*v)
+    mg = m*g
+    
+    f = np.empty_like(y)
+    f[:, 0] = 6*tau*p['omega_to_v']/m + erf_v*Crr*g*cos_a + g*sin_a # (Fd - Frr - Fg)/m
+    f[:, 1] = v
+    
+    # battery power of the six motors (one table per distinct motor)
+    if jac:
+        dPdv = np.empty(len(v))
+    for effcy_map, sel in p['groups']:
+        w = omega[sel]
+        f[sel, 2] = 6*battery_power(effcy_map, w)
+        if jac:
+            dPdv[sel] = 6*battery_power_slope(effcy_map, w)*p['omega_to_v'][sel]
+    
+    if not jac:
+        return f
+    
+    dadv = -6*np.where(linear, p['slope'], 0.0)*p['omega_to_v']**2/m + (80/np.sqrt(np.pi))*np.exp(-1600*v*v)*Crr*g*cos_a
+    dadx = (-erf_v*Crr*g*sin_a + g*cos_a)*np.radians(dalpha_dx)
+    
+    return f, dadv, dadx, dPdv
+
+def _rover_ensemble_solve(h, dadv, dadx, dPdv, rhs):
+
+    # Solves (I - h*J) k = rhs for every member, where J is the rover 
+    # Jacobian [[dadv, dadx, 0], [1, 0, 0], [dPdv, 0, 0]] (closed form).
+
+    k = np.empty_like(rhs)
+    k[:, 0] = (rhs[:, 0] + h*dadx*rhs[:, 1])/(1 - h*dadv - h*h*dadx)
+    k[:, 1] = rhs[:, 1] + h*k[:, 0]
+    k[:, 2] = rhs[:, 2] + h*dPdv*k[:, 0]
+    
+    return k
+
+def simulate_rover_ensemble(batch, experiment, end_event, max_step=1.0, rtol=1e-4, atol=1e-6, terrain=None):
+    """
+    Inputs:      batch:  dict             Stacked rover parameters 
+                                          (stack_rover_params)
+            experiment:  dict             Data dictionary specifying experiment 
+                                          definition (shared by all members)
+             end_event:  dict             Data dictionary of mission end 
+                                          conditions
+              max_step:  scalar           (optional) Largest time step [s]
+                  rtol:  scalar           (optional) Relative tolerance
+                  atol:  scalar           (optional) Absolute tolerance
+               terrain:  dict             (optional) Terrain profile; built
+                                          from experiment if not given
+    
+    Outputs: telemetry:  dict             Per-member mission summaries, each 
+                                          an array: completion_time, 
+                                          distance_traveled, max_velocity,
+                                          average_velocity, battery_energy, 
+                                          energy_per_distance, 
+                                          battery_depleted
+    
+    Integrates all members of a rover parameter study at once. The state is
+    an (N,3) array of [velocity, position, battery energy] with the same 
+    dynamics as simulate_rover, advanced with a linearly implicit Rosenbrock
+    method (ROS2, L-stable, 2nd order) using each member's analytic 
+    Jacobian, so the stiff rolling resistance near v = 0 does not limit the
+    step. Every member has its own time and step size, controlled by the 
+    embedded 1st order error estimate; this matters at the kinks of the 
+    motor curve (no-load speed, v = 0) where the linearization is poor.
+    Each member stops at its own end of mission (distance, time, minimum 
+    velocity or battery budget, as in end_of_mission_event and 
+    rover_energy_budget); the stopping state is found by linear 
+    interpolation within the step. Finished members are dropped from the 
+    remaining steps.
+    """
+    
+    if type(batch) != dict:
+        raise Exception('batch input must be a dict')
+    if type(experiment) != dict:
+        raise Exception('experiment input must be a dict')
+    if type(end_event) != dict:
+        raise Exception('end_event input must be a dict')
+    if max_step <= 0:
+        raise Exception('max_step must be a positive number')
+    if rtol <= 0 or atol <= 0:
+        raise Exception('rtol and atol must be positive numbers')
+    
+    if terrain is None:
+        terrain = define_terrain_profile(experiment)
+    
+    n = batch['n']
+    t0, tf = float(experiment['time_range'][0]), float(experiment['time_range'][1])
+    y0 = np.asarray(experiment['initial_conditions'], dtype=float).ravel()[:2]
+    
+    # end of mission thresholds (event functions g >= 0 while running)
+    max_distance = end_event['max_distance']
+    max_time = float(min(end_event['max_time'], tf))
+    min_velocity = end_event['min_velocity']
+    max_energy = batch['battery_capacity'].copy()
+    if end_event.get('max_energy_per_distance') is not None:
+        max_energy = np.minimum(max_energy, end_event['max_energy_per_distance']*max_distance)
+    
+    def event_values(t, y, idx):
+        return np.column_stack([max_distance - y[:, 1],
+                                max_time - t,
+                                y[:, 0] - min_velocity,
+                                max_energy[idx] - y[:, 2]])
+    
+    y = np.tile(np.append(y0, 0.0), (n, 1))
+    t_end = np.full(n, max_time)
+    y_end = np.zeros((n, 3))
+    v_max = y[:, 0].copy()
+    depleted = np.zeros(n, dtype=bool)
+    
+    gamma = 1 + 1/np.sqrt(2)
+    idx = np.arange(n)
+    p = _rover_ensemble_members(batch, idx)
+    t = np.full(n, t0)
+    h = np.full(n, min(max_step, 0.1))
+    ys = y
+    g_prev = event_values(t, ys, idx)
+    
+    while len(idx) > 0:
+        h = np.minimum(h, max_time - t)
         
-        # update state of EDL dynamics
-        dy1dt = F_ext/edl_mass
-        dy2dt = vel_edl
-          
-        # since rockets are off in this dynamical regime, we simply can set dmdt=0
-        dmdt = 0
+        # ROS2 step for the active members
+        f0, dadv, dadx, dPdv = _rover_ensemble_rhs(ys, p, terrain)
+        k1 = _rover_ensemble_solve(gamma*h, dadv, dadx, dPdv, f0)
+        f1 = _rover_ensemble_rhs(ys + h[:, None]*k1, p, terrain, jac=False)
+        k2 = _rover_ensemble_solve(gamma*h, dadv, dadx, dPdv, f1 - 2*k1)
+        y_new = ys + h[:, None]*(1.5*k1 + 0.5*k2)
         
-        # error signals
-        e_vel = 0
-        e_pos = 0
+        # embedded error against the 1st order solution ys + h*k1
+        scale = atol + rtol*np.maximum(np.abs(ys), np.abs(y_new))
+        err = np.sqrt(np.mean((0.5*h[:, None]*(k1 + k2)/scale)**2, axis=1))
+        accepted = err <= 1
+        h_next = np.minimum(max_step, h*np.clip(0.9/np.sqrt(np.maximum(err, 1e-10)), 0.2, 4.0))
         
-    # Sky Crane dynamics (lowering the rover)
-    if edl_system['sky_crane']['on']:
+        # rejected members retry from the same state with a smaller step
+        ok = np.flatnonzero(accepted)
+        t_new = t[ok] + h[ok]
+        y_new = y_new[ok]
+        v_max[idx[ok]] = np.maximum(v_max[idx[ok]], y_new[:, 0])
         
-        # this is a 1st order model. We instantaneously jump to constant
-        # velocity and then stay there (the jump is handled by an initial
-        # condition).
+        # per-member events: first sign change of any event function in the
+        # step, located by linear interpolation
+        g_new = event_values(t_new, y_new, idx[ok])
+        crossed = (g_prev[ok] > 0) & (g_new <= 0)
+        done = np.zeros(len(idx), dtype=bool)
+        if np.any(crossed):
+            theta = np.where(crossed, g_prev[ok]/np.where(crossed, g_prev[ok] - g_new, 1.0), np.inf)
+            first = np.argmin(theta, axis=1)
+            theta_min = theta[np.arange(len(ok)), first]
+            hit = np.isfinite(theta_min)
+            
+            d = idx[ok[hit]]
+            th = theta_min[hit][:, None]
+            y_end[d] = ys[ok[hit]] + th*(y_new[hit] - ys[ok[hit]])
+            t_end[d] = t[ok[hit]] + th[:, 0]*h[ok[hit]]
+            depleted[d] = first[hit] == 3
+            done[ok[hit]] = True
         
-        dy6dt = 0 # model as constant velocity (zero accel) process
-        dy7dt = edl_system['sky_crane']['velocity']
+        ys = ys.copy()
+        ys[ok] = y_new
+        t[ok] = t_new
+        g_prev[ok] = g_new
+        h = h_next
         
-    #     print('sky crane platform: h = #f\tv = #f\ta = #f\n',altitude_edl,vel_edl,dy1dt)
-    #     print('rover status (rel): h = #f\tv = #f\ta = #f\n',pos_rov,vel_rov,dy6dt)
-    #     print('rover status (abs): h = #f\tv = #f\ta = #f\n\n',altitude_edl+pos_rov,vel_edl+vel_rov,dy1dt-dy6dt)
+        if np.any(done):
+            keep = ~done
+            idx = idx[keep]
+            ys = ys[keep]
+            t = t[keep]
+            h = h[keep]
+            g_prev = g_prev[keep]
+            p = _rover_ensemble_members(batch, idx)
         
+        # members that reached max_time without an event
+        finished = t >= max_time
+        if np.any(finished):
+            y_end[idx[finished]] = ys[finished]
+            t_end[idx[finished]] = t[finished]
+            keep = ~finished
+            idx = idx[keep]
+            ys = ys[keep]
+            t = t[keep]
+            h = h[keep]
+            g_prev = g_prev[keep]
+            p = _rover_ensemble_members(batch, idx)
+    
+    distance = y_end[:, 1]
+    E = y_end[:, 2]
+    telemetry = {'completion_time' : t_end,
+                 'distance_traveled' : distance,
+                 'max_velocity' : v_max,
+                 'average_velocity' : np.where(t_end > 0, distance/np.where(t_end > 0, t_end, 1.0), 0.0),
+                 'battery_energy' : E,
+                 'energy_per_distance' : E/distance,
+                 'battery_depleted' : depleted}
+    
+    return telemetry
+
+def edl_events(edl_system, mission_events):
+
+    # Defines events that occur in EDL System simulation.
+    #
+    # y = [ velocity, altitude, fuel_mass] and more
+    #
+    #
+    # 0. Reached altitude to eject heat shield 
+    # 1. Reached altitude to eject parachute 
+    # 2. Reached altitude to turn on rockets 
+    # 3. Reached altitude to turn on crane & altitude control
+    # 4. Out of fuel --> y(3)<=0. Terminal. Direction: -1.
+    # 5. EDL System crashed at zero altitude
+    # 6. Reached speed at which speed-controlled descent is required
+    # 7. Reached position at which altitude control is required
+    # 8. Rover has touched down on surface of Mars
+
+    
+    event0 = lambda t, y: y[1] - mission_events['alt_heatshield_eject'] - int(edl_system["heat_shield"]["ejected"])*999999
+    event0.terminal = True
+    event0.direction = -1
+    
+    event1 = lambda t, y: y[1] - mission_events['alt_parachute_eject'] - int(edl_system["parachute"]["ejected"])*999999
+    event1.terminal = True
+    event1.direction = -1
+    
+    event2 = lambda t, y: y[1] - mission_events['alt_rockets_on'] - int(edl_system["rocket"]["on"])*999999
+    event2.terminal = True
+    event2.direction = -1
+
+    event3 = lambda t, y: y[1] - mission_events['alt_skycrane_on'] - int(edl_system["sky_crane"]["on"])*999999
+    event3.terminal = True
+    event3.direction = -1
+    
+    event4 = lambda t, y: y[2] 
+    event4.terminal = True
+    event4.direction = -1
+    
+    event5 = lambda t, y: y[1]
+    event5.terminal = True
+    event5.direction = -1
+    
+    event6 = lambda t, y: y[0] - 3*edl_system['speed_control']['target_velocity'] + int(edl_system["speed_control"]["on"])*999999
+    event6.terminal = True
+    event6.direction = 1
+    
+    event7 = lambda t, y: y[1] - 1.2*mission_events['alt_skycrane_on'] - int(edl_system["position_control"]["on"])*999999
+    event7.terminal = True
+    event7.direction = -1
+    
+    event8 = lambda t, y: y[1] + y[6]
+    event8.terminal = True
+    event8.direction = -1
+
+    
+    events = [event0, event1, event2, event3, event4, event5, event6, event7, event8]
+    
+    return events
+
+def edl_dynamics(t, y, edl_system, planet):
+
+    # Dynamics of EDL as it descends and lowers the rover to the surface. 
+    # State vector: 
+    #   y=[vel_edl;pos_edl;fuel_mass;ei_vel;ei_pos;vel_rov;pos_rov]
+    #   ydot=[accel_edl;vel_edl;dmdt;e_vel;e_pos;accel_rov;vel_rov]
+    # 
+    # edl altitude, velocity and acceleration are absolute
+    # rov is relative to edl
+    # fuel_mass is total over all rockets
+    #
+    # 
+    # Note: this is a VARIABLE MASS SYSTEM, which means Newton's second law
+    # expressed as F=ma cannot be used. The more fundamental relationship is 
+    # F = dp/dt, where p is the momentum of the system. (For a particle, p=mv
+    # and if m is constant you recover the F=ma form easily.) It is important
+    # to consider the momentum contributions of the EDL system and propellant 
+    # being expelled from the rocket. Ultimately you end up with something that
+    # roughly resembles Newton's second law: F_ext + v_rel*(dm/dt) = ma where m
+    # is the mass of the EDL, dm/dt is the rate at which mass is changing (due
+    # to propellant being expelled), v_rel is the speed at which propellant is
+    # being expelled, a is the acceleration of the EDL and F_ext is the sum of
+    # other forces acting on the EDL (drag, bouyancy, gravity). Since
+    # v_rel*(dm/dt) is a force, we can write this as F_ext + F_thrust = ma,
+    # which is very Newton-like.
+    #
+    #
+    #
+
+
+    # The dynamics themselves are in edl_dynamics_fast, on the compiled 
+    # record of the edl_system and its current mode; edl_system is not 
+    # modified. (simulate_edl compiles once per run instead of once per 
+    # call as done here.)
+    
+    return edl_dynamics_fast(t, y, compile_edl_system(edl_system), edl_mode(edl_system), planet)
+
+def edl_mode(edl_system):
+    # edl_mode
+    #
+    # The discrete state of the EDL system (what has been ejected and which
+    # rocket/control/sky crane regimes are on), read from the flags of the
+    # edl_system dict. This is the mode argument of edl_dynamics_fast and
+    # edl_mode_events; it does not change within a simulation segment.
+    
+    mode = {'heat_shield_ejected' : bool(edl_system['heat_shield']['ejected']),
+            'parachute_ejected' : bool(edl_system['parachute']['ejected']),
+            'rocket_on' : bool(edl_system['rocket']['on']),
+            'speed_control' : bool(edl_system['speed_control']['on']),
+            'position_control' : bool(edl_system['position_control']['on']),
+            'sky_crane' : bool(edl_system['sky_crane']['on'])}
+    
+    return mode
+
+def edl_dynamics_fast(t, y, params, mode, planet):
+    # edl_dynamics_fast
+    #
+    # Same dynamics as edl_dynamics, over the compiled EDL record (see 
+    # compile_edl_system) and an explicit mode (see edl_mode). Nothing is 
+    # written back: the current mass comes from the fuel in the state 
+    # instead of edl_system['rocket']['fuel_mass'], so one params record 
+    # can be shared by any number of concurrent simulations.
+    #
+    # State vector and return value as in edl_dynamics:
+    #   y=[vel_edl;pos_edl;fuel_mass;ei_vel;ei_pos;vel_rov;pos_rov]
+    #   ydot=[accel_edl;vel_edl;dmdt;e_vel;e_pos;accel_rov;vel_rov]
+    
+    vel_edl = y[0]
+    altitude_edl = y[1]
+    g = planet['g']
+    
+    # current mass (get_mass_edl)
+    edl_mass = params['m_fixed'] + y[2]
+    if not mode['parachute_ejected']:
+        edl_mass += params['m_parachute']
+    if not mode['heat_shield_ejected']:
+        edl_mass += params['m_heat_shield']
+    
+    # Forces EXCEPT THRUST acting on EDL System (gravity, buoyancy, drag)
+    density, _, _ = get_local_atm_properties(planet, altitude_edl)
+    if mode['heat_shield_ejected']:
+        ACd = params['ACd_sky_crane']
     else:
-        # rover relative to sky crane
-        dy6dt = 0 # rover acceleration
-        dy7dt = 0 # rover velocity
+        ACd = params['ACd_heat_shield']
+    if not mode['parachute_ejected']:
+        ACd += params['ACd_parachute']
+    F_ext = edl_mass*g + np.sign(g)*g*density*params['volume'] + 0.5*density*vel_edl**2*ACd
+    
+    e_vel = 0
+    e_pos = 0
+    if mode['rocket_on'] and not(mode['speed_control']) and not(mode['position_control']):
+        # uncontrolled rocket firing
+        F_thrust = 0.9*params['max_thrust']
+    elif mode['rocket_on'] and mode['speed_control']:
+        # speed controller. The error derivative is the acceleration, which
+        # itself depends on the thrust, so it is eliminated symbolically.
+        e_vel = params['target_velocity'] - vel_edl
+        num = (params['Kp_speed']*e_vel + params['Kd_speed']*(F_ext/edl_mass) + params['Ki_speed']*y[3]) - edl_mass*g
+        F_thrust = min(max(params['min_thrust'], num/(1 - params['Kd_speed']/edl_mass)), params['max_thrust'])
+    elif mode['rocket_on'] and mode['position_control']:
+        # altitude controller
+        e_pos = params['target_altitude'] - altitude_edl
+        F_thrust = params['num_rockets']*(params['Kp_position']*e_pos - params['Kd_position']*vel_edl + params['Ki_position']*y[4]) - g*edl_mass
+        F_thrust = min(max(params['min_thrust'], F_thrust), params['max_thrust'])
+    else:
+        # rockets off (not fired yet, or out of fuel)
+        F_thrust = 0.0
     
+    # sky crane lowering the rover at constant speed
+    if mode['sky_crane']:
+        dy7dt = params['crane_velocity']
+    else:
+        dy7dt = 0
     
-    # the return vector (note that e is deidt since ei is integral of e)
-    dydt = np.array([dy1dt, dy2dt, dmdt, e_vel, e_pos, dy6dt, dy7dt])
+    dydt = np.array([(F_ext + F_thrust)/edl_mass, vel_edl, -F_thrust/params['exhaust_velocity'], e_vel, e_pos, 0, dy7dt])
     
     return dydt
 
+# scipy.integrate solvers by method name (as solve_ivp's method argument)
+_ODE_SOLVERS = {'RK23' : RK23, 'RK45' : RK45, 'DOP853' : DOP853, 'Radau' : Radau, 'BDF' : BDF, 'LSODA' : LSODA}
+
+def define_edl_step_policy():
+    # define_edl_step_policy
+    #
+    # Integrator settings for each phase of the EDL descent (see 
+    # edl_step_phase): solver method (a scipy.integrate OdeSolver name), 
+    # max_step [s], rtol and atol. simulate_edl uses 
+    # edl_system['step_policy'] if the EDL definition has one, and this 
+    # default otherwise; a policy only needs the phases it changes.
+    #
+    # The defaults come from benchmarks.benchmark_step_policies. The 
+    # parachute descent and the speed-controlled descent are smooth and 
+    # their guards (altitude, fuel) are crossed once, so they take 
+    # unlimited steps. The uncontrolled rocket firing and the position 
+    # control/sky crane phases keep a 1 s limit: there the altitude and 
+    # velocity can turn around, and a longer step could cross a guard and
+    # cross back unseen. The tight tolerance is what keeps the touchdown 
+    # time as accurate as the former fixed max_step=0.1 at rtol=1e-3.
+    
+    smooth = {'method' : 'DOP853', 'max_step' : np.inf, 'rtol' : 1e-8, 'atol' : 1e-8}
+    limited = {'method' : 'DOP853', 'max_step' : 1.0, 'rtol' : 1e-8, 'atol' : 1e-8}
+    policy = {'rockets_off' : dict(smooth),
+              'rockets_on' : dict(limited),
+              'speed_control' : dict(smooth),
+              'position_control' : dict(limited),
+              'sky_crane' : dict(limited)}
+    
+    return policy
+
+def edl_step_phase(mode):
+    # edl_step_phase
+    #
+    # Name of the step policy phase (define_edl_step_policy) for an EDL
+    # mode: the rocket regime of edl_dynamics_fast, with the sky crane 
+    # lowering counted as a phase of its own.
+    
+    if mode['sky_crane']:
+        return 'sky_crane'
+    if not mode['rocket_on']:
+        return 'rockets_off'
+    if mode['speed_control']:
+        return 'speed_control'
+    if mode['position_control']:
+        return 'position_control'
+    return 'rockets_on'
+
+def edl_guards(params, mode, mission_events):
+    # edl_guards
+    #
+    # The guards (event functions) of edl_events that can fire in the given
+    # mode, as a list of (event number, g, direction) with g(y) crossing 
+    # zero in the given direction. Events that edl_events switches off with
+    # its 999999 offset are left out rather than evaluated, and so is the 
+    # out-of-fuel event while the rockets are off (the fuel cannot drop).
+    
+    guards = []
+    
+    def altitude_guard(event, threshold):
+        guards.append((event, lambda y: y[1] - threshold, -1))
+    
+    if not mode['heat_shield_ejected']:
+        altitude_guard(0, mission_events['alt_heatshield_eject'])
+    if not mode['parachute_ejected']:
+        altitude_guard(1, mission_events['alt_parachute_eject'])
+    if not mode['rocket_on']:
+        altitude_guard(2, mission_events['alt_rockets_on'])
+    if not mode['sky_crane']:
+        altitude_guard(3, mission_events['alt_skycrane_on'])
+    if mode['rocket_on']:
+        guards.append((4, lambda y: y[2], -1))
+    guards.append((5, lambda y: y[1], -1))
+    if not mode['speed_control']:
+        speed_threshold = 3*params['target_velocity']
+        guards.append((6, lambda y: y[0] - speed_threshold, 1))
+    if not mode['position_control']:
+        altitude_guard(7, 1.2*mission_events['alt_skycrane_on'])
+    guards.append((8, lambda y: y[1] + y[6], -1))
+    
+    return guards
+
+def _first_guard_crossing(guards, g_old, g_new, solver):
+
+    # Earliest guard crossing within the last step of solver, located on 
+    # the step's dense output like solve_ivp does (same crossing test and
+    # root tolerance; the dense output is only built when a guard crossed).
+    # Returns (event number, t, y), or None if no guard crossed.
+
+    t_old = solver.t_old
+    t_new = solver.t
+    sol = None
+    first = None
+    for (event, g, direction), g0, g1 in zip(guards, g_old, g_new):
+        up = g0 <= 0 and g1 >= 0
+        down = g0 >= 0 and g1 <= 0
+        if not ((up and direction > 0) or (down and direction < 0) or ((up or down) and direction == 0)):
+            continue
+        if sol is None:
+            sol = solver.dense_output()
+        if g0 == g1:
+            t_root = t_old
+        else:
+            t_root = brentq(lambda t: g(sol(t)), t_old, t_new, xtol=4*np.finfo(float).eps, rtol=4*np.finfo(float).eps)
+        if first is None or t_root < first[1]:
+            first = (event, t_root)
+    
+    if first is None:
+        return None
+    
+    return first[0], first[1], sol(first[1])
+
 def update_edl_state(edl_system, TE, YE, Y, ITER_INFO):
     # update_edl
     #
@@ -1584,28 +3071,108 @@ def update_edl_state(edl_system, TE, YE, Y, ITER_INFO):
 
     return edl_system, y0, TERMINATE_SIM
 
-def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
+def define_trajectory_buffer(n_states, keep_every=1, events_only=False):
+    # define_trajectory_buffer
+    #
+    # Collects the trajectory of a multi-segment simulation (one solve_ivp
+    # call per phase, as in simulate_edl). Segments are stored as they come
+    # and joined once by trajectory_arrays, instead of re-copying the whole
+    # history with np.append/np.hstack after every phase.
+    #
+    # keep_every = k keeps every k-th sample (counted over the whole run)
+    # plus the last sample of each segment, so the event states are always
+    # there. events_only = True keeps only the initial state and the state
+    # at the end of each segment. Both are meant for sweeps and optimizer
+    # runs that do not need the dense trajectory.
+    
+    if int(keep_every) != keep_every or keep_every < 1:
+        raise Exception('define_trajectory_buffer: keep_every must be a positive integer')
+    
+    buffer = {'n_states' : n_states,
+              'keep_every' : int(keep_every),
+              'events_only' : events_only,
+              't_chunks' : [],
+              'y_chunks' : [],
+              'n_seen' : 0}   # number of samples offered so far
+    
+    return buffer
+
+def trajectory_append(buffer, t_part, Y_part):
+    # trajectory_append
+    #
+    # Adds one simulation segment (times t_part, states Y_part with one 
+    # column per time) to a trajectory buffer, keeping only the samples the
+    # buffer was asked for.
+    
+    n = len(t_part)
+    if n == 0:
+        return buffer
+    
+    if buffer['events_only']:
+        if buffer['n_seen'] == 0 and n > 1:
+            idx = [0, n-1]
+        else:
+            idx = [n-1]
+    elif buffer['keep_every'] > 1:
+        k = buffer['keep_every']
+        idx = np.arange((-buffer['n_seen']) % k, n, k)
+        if len(idx) == 0 or idx[-1] != n-1:
+            idx = np.append(idx, n-1)
+    else:
+        idx = slice(None)
+    
+    buffer['t_chunks'].append(np.array(t_part[idx]))
+    buffer['y_chunks'].append(np.array(Y_part[:, idx]))
+    buffer['n_seen'] += n
+    
+    return buffer
+
+def trajectory_arrays(buffer):
+    # trajectory_arrays
+    #
+    # Joins the buffered segments (one concatenation) and returns the time
+    # vector T and the state history Y (n_states x N). Both are returned
+    # read-only; copy them if they need to be modified.
+    
+    if buffer['t_chunks']:
+        T = np.concatenate(buffer['t_chunks'])
+        Y = np.concatenate(buffer['y_chunks'], axis=1)
+    else:
+        T = np.array([])
+        Y = np.zeros((buffer['n_states'], 0))
+    
+    T.setflags(write=False)
+    Y.setflags(write=False)
+    
+    return T, Y
+
+def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO, keep_every=1, events_only=False, summary=False):
     # simulate_edl
     #
     # This simulates the EDL system. It requires a definition of the
     # edl_system, the planet, the mission events, a maximum simulation time and
     # has an optional flag to display detailed iteration information.
+    #
+    # The returned T and Y are read-only. keep_every and events_only thin
+    # out the stored trajectory (see define_trajectory_buffer); by default 
+    # every solver sample is kept. With summary=True the solver is not asked
+    # for its dense output at all: only the state at each event (and at 
+    # tmax) is produced, and T, Y hold the initial state plus those.
+    #
+    # The dynamics are the side-effect free edl_dynamics_fast on the 
+    # compiled edl_system (compile_edl_system); this function only drives
+    # the segments between events, and the edl_system dict is updated by 
+    # update_edl_state alone.
     
-    # handle to events function for edl simulation
-    #h_edl_events = lambda t, y: edl_events(t, y, edl_system, mission_events)
-    events = edl_events(edl_system, mission_events)
-        
-    # simulation time span
-    tspan = (0, tmax)
+    # the parameters are compiled once; only the mode changes between 
+    # segments (edl_mode of the edl_system as update_edl_state leaves it)
+    params = compile_edl_system(edl_system)
+    default_policy = define_edl_step_policy()
+    policy = edl_system.get('step_policy', default_policy)
     
     # initial state of system
-    y0 = np.array([edl_system['velocity'], 
-                   edl_system['altitude'], 
-                   edl_system['rocket']['initial_fuel_mass'] * edl_system['num_rockets'],
-                   0,
-                   0,
-                   0,
-                   0])
+    t = 0.0
+    y = params['y0'].copy()
     
     
     # *** NOTE: This does not yet check for whether the fuel runs out...
@@ -1613,173 +3180,1213 @@ def simulate_edl(edl_system, planet, mission_events, tmax, ITER_INFO):
         print('Commencing simulation run...\n')
     
     
-    # declare our variables (just empty arrays)
-    T = np.array([])
-    Y = np.array([[], [], [], [], [], [], []])
-    TERMINATE_SIM = False
+    # trajectory of all the phases, joined once at the end
+    trajectory = define_trajectory_buffer(len(y), keep_every, events_only or summary)
+    if summary:
+        trajectory = trajectory_append(trajectory, np.array([t]), y.reshape(-1, 1))
+    
+    # One integration loop for the whole descent (a hybrid automaton): the
+    # DOP853 stepper is advanced step by step, the guards of the current 
+    # mode are checked after every step, and at a crossing the event state
+    # is passed to update_edl_state, which switches the mode and applies 
+    # the state resets. The stepper is then re-seeded from the reset state
+    # in the new mode, keeping its last step size (no initial step 
+    # selection, no solve_ivp setup per phase).
+    first_step = None
+    TERMINATE_SIM = t >= tmax
     while not(TERMINATE_SIM):
         
-        # run simulation until an event occurs 
-        fun = lambda t, y: edl_dynamics(t, y, edl_system, planet)
-        sol = solve_ivp(fun, tspan, y0, method='DOP853', events=events, max_step=0.1)
-        t_part = sol.t
-        Y_part = sol.y
-        TE = sol.t_events
-        YE = sol.y_events
-
-        # process the event and update the edl_system accordingly. Also sets
-        # the initial conditions for the next stage (in y0) and the
-        # TERMINATE_SIM flag.
-        #print(YE)
-        [edl_system, y0, TERMINATE_SIM] = update_edl_state(edl_system, TE, YE, Y_part, ITER_INFO)
+        mode = edl_mode(edl_system)
+        guards = edl_guards(params, mode, mission_events)
+        fun = lambda t, y: edl_dynamics_fast(t, y, params, mode, planet)
+        settings = {**default_policy[edl_step_phase(mode)], **policy.get(edl_step_phase(mode), {})}
+        if first_step is not None:
+            first_step = min(first_step, settings['max_step'], tmax - t)
+        solver = _ODE_SOLVERS[settings['method']](fun, t, y, tmax, max_step=settings['max_step'],
+                                                  rtol=settings['rtol'], atol=settings['atol'], first_step=first_step)
+        g_old = [g(y) for _, g, _ in guards]
+        t_part = [t]
+        Y_part = [y]
+        crossing = None
         
-        # update the simulation time span for the next stage
-        tspan = (t_part[-1], tmax)
+        # run until a guard fires or tmax is reached
+        while crossing is None and solver.status == 'running':
+            message = solver.step()
+            if solver.status == 'failed':
+                raise Exception('simulate_edl: ' + str(message))
+            g_new = [g(solver.y) for _, g, _ in guards]
+            crossing = _first_guard_crossing(guards, g_old, g_new, solver)
+            if crossing is None:
+                t_part.append(solver.t)
+                Y_part.append(solver.y)
+            g_old = g_new
         
-        # appending to grow a list is inefficient, but there is no way to
-        # know in advance how many elements we'll need due to the adaptive step
-        # size in ode45
+        if crossing is not None:
+            event, t, y = crossing
+            t_part.append(t)
+            Y_part.append(y)
+            first_step = solver.step_size
+        else:
+            t, y = solver.t, solver.y
         
-        T = np.append(T, t_part)
-        Y = np.hstack((Y, Y_part))
-        #T.append(t_part)
-        #Y.append(Y_part)
-
+        if summary:
+            t_part = np.array([t])
+            Y_part = y.reshape(-1, 1)
+        else:
+            t_part = np.array(t_part)
+            Y_part = np.array(Y_part).T
+        
+        # store this phase of the trajectory
+        trajectory = trajectory_append(trajectory, t_part, Y_part)
         
-        # This looks for whether we're out of time. other termination
-        # conditions checked in update_edl_state
-        if tspan[0] >= tspan[1]:
+        if crossing is None:
+            # out of time. other termination conditions are checked in 
+            # update_edl_state
+            edl_system, _, _ = update_edl_state(edl_system, [np.array([])]*9, [np.zeros((0, len(y)))]*9, Y_part, ITER_INFO)
             TERMINATE_SIM = True
+        else:
+            # process the event and update the edl_system accordingly. Also
+            # sets the state to continue from (in y) and the TERMINATE_SIM 
+            # flag.
+            TE = [np.array([t]) if ii == event else np.array([]) for ii in range(9)]
+            YE = [y.reshape(1, -1) if ii == event else np.zeros((0, len(y))) for ii in range(9)]
+            [edl_system, y, TERMINATE_SIM] = update_edl_state(edl_system, TE, YE, Y_part, ITER_INFO)
+            if t >= tmax:
+                TERMINATE_SIM = True
+        if not TERMINATE_SIM:
+            y = np.array(y, dtype=float)
+    
+    T, Y = trajectory_arrays(trajectory)
     
     return T, Y, edl_system
     
-def obj_fun_time(x,edl_system,planet,mission_events,tmax,experiment,end_event):
-    # OBJ_FUN_TIME
-    # 
-    # This function runs both simulations -- edl and rover -- to get a total
-    # time to land and travel the specified terrain. 
+def compile_edl_system(edl_system):
+    # compile_edl_system
+    #
+    # Flattens the edl_system dict into a record of scalars for the batched
+    # EDL simulation (simulate_edl_ensemble). Masses and drag areas are
+    # combined up front; only the parts that change during the descent
+    # (heat shield, parachute, fuel) are kept apart. The current flags of
+    # the edl_system become the initial mode of the descent and its
+    # altitude, velocity and initial fuel the initial state, exactly as
+    # simulate_edl starts from them.
+    
+    if type(edl_system) != dict:
+        raise Exception('edl_system input must be a dict')
+    
+    num_rockets = edl_system['num_rockets']
+    rocket = edl_system['rocket']
+    parachute = edl_system['parachute']
+    heat_shield = edl_system['heat_shield']
+    sky_crane = edl_system['sky_crane']
+    speed_control = edl_system['speed_control']
+    position_control = edl_system['position_control']
+    
+    if rocket['effective_exhaust_velocity'] <= 0:
+        raise Exception('rocket effective exhaust velocity must be a positive number')
+    
+    # the parachute only adds drag while deployed (see F_drag_descent)
+    ACd_parachute = np.pi*(parachute['diameter']/2.0)**2*parachute['Cd']
+    if not parachute['deployed']:
+        ACd_parachute = 0.0
+    
+    params = {'num_rockets' : num_rockets,
+              'volume' : edl_system['volume'],
+              'm_fixed' : num_rockets*rocket['structure_mass'] + sky_crane['mass'] + get_mass_rover(edl_system['rover']),
+              'm_parachute' : parachute['mass'],
+              'm_heat_shield' : heat_shield['mass'],
+              'ACd_parachute' : ACd_parachute,
+              'ACd_heat_shield' : np.pi*(heat_shield['diameter']/2.0)**2*heat_shield['Cd'],
+              'ACd_sky_crane' : sky_crane['area']*sky_crane['Cd'],
+              'max_thrust' : num_rockets*rocket['max_thrust'],
+              'min_thrust' : num_rockets*rocket['min_thrust'],
+              'exhaust_velocity' : rocket['effective_exhaust_velocity'],
+              'Kp_speed' : speed_control['Kp'],
+              'Kd_speed' : speed_control['Kd'],
+              'Ki_speed' : speed_control['Ki'],
+              'target_velocity' : speed_control['target_velocity'],
+              'Kp_position' : position_control['Kp'],
+              'Kd_position' : position_control['Kd'],
+              'Ki_position' : position_control['Ki'],
+              'target_altitude' : position_control['target_altitude'],
+              'crane_velocity' : sky_crane['velocity'],
+              'danger_altitude' : sky_crane['danger_altitude'],
+              'danger_speed' : sky_crane['danger_speed'],
+              'y0' : np.array([edl_system['velocity'],
+                               edl_system['altitude'],
+                               rocket['initial_fuel_mass']*num_rockets,
+                               0, 0, 0, 0], dtype=float),
+              'mode' : edl_mode(edl_system)}
+    
+    return params
+
+def compile_edl_variants(edl_system, parachute_diameter, fuel_mass, chassis_mass):
+    # compile_edl_variants
     #
+    # Compiles the EDL design variants of a parameter study: the design
+    # variables x[0] (parachute diameter), x[4] (fuel mass per rocket) and
+    # x[2] (chassis mass, through the rover mass) of the optimizer. The
+    # three inputs are broadcast against each other. The edl_system itself
+    # is not modified.
+    
+    parachute_diameter, fuel_mass, chassis_mass = np.broadcast_arrays(np.atleast_1d(np.asarray(parachute_diameter, dtype=float)),
+                                                                      np.atleast_1d(np.asarray(fuel_mass, dtype=float)),
+                                                                      np.atleast_1d(np.asarray(chassis_mass, dtype=float)))
+    
+    variant = {**edl_system,
+               'parachute' : dict(edl_system['parachute']),
+               'rocket' : dict(edl_system['rocket']),
+               'rover' : {**edl_system['rover'], 'chassis' : dict(edl_system['rover']['chassis'])}}
+    
+    params_list = []
+    for ii in range(len(parachute_diameter)):
+        variant['parachute']['diameter'] = float(parachute_diameter[ii])
+        variant['rocket']['fuel_mass'] = float(fuel_mass[ii])
+        variant['rocket']['initial_fuel_mass'] = float(fuel_mass[ii])
+        variant['rover']['chassis']['mass'] = float(chassis_mass[ii])
+        params_list.append(compile_edl_system(variant))
+    
+    return params_list
+
+def stack_edl_params(params_list):
+    # stack_edl_params
     #
+    # Stacks compile_edl_system records into one record of arrays (one
+    # entry per member; y0 becomes an N x 7 array and every mode flag a
+    # boolean array).
+    
+    if len(params_list) == 0:
+        raise Exception('params_list must hold at least one compiled edl system')
+    
+    batch = {}
+    for field in params_list[0]:
+        if field == 'y0':
+            batch[field] = np.array([params[field] for params in params_list])
+        elif field == 'mode':
+            batch[field] = {flag : np.array([params['mode'][flag] for params in params_list], dtype=bool)
+                            for flag in params_list[0]['mode']}
+        else:
+            batch[field] = np.array([params[field] for params in params_list], dtype=float)
+    batch['n'] = len(params_list)
     
+    return batch
+
+def _edl_ensemble_members(batch, idx):
     
-    # Note: Although edl_system is modified in this function, the modifications
-    # are lost after the function terminates because the struct is not a
-    # returned argument and is not a global variable. Thus, we only ever are
-    # modifying a local copy.
-    #
+    # Parameters of the members idx of an EDL ensemble (compressed once each
+    # time the set of running members changes).
     
-    edl_system = redefine_edl_system(edl_system)
+    return {field : batch[field][idx] for field in batch if field not in ('y0', 'mode', 'n')}
+
+def _edl_ensemble_rhs(y, p, mode, planet):
     
-    # edl_system=define_chassis(edl_system,'steel');
-    # edl_system=define_motor(edl_system,'speed');
-    # edl_system=define_batt_pack(edl_system,'LiFePO4',10);
+    # Vectorized edl_dynamics for the running members of an ensemble. y is
+    # (n,7) with the simulate_edl state columns, mode a dict of boolean
+    # arrays (one flag per member). Same forces and control laws as
+    # edl_dynamics.
     
-    # ****************
-    # RUNNING THE EDL SIMULATION
-    # **
+    vel_edl = y[:, 0]
+    altitude_edl = y[:, 1]
+    g = planet['g']
+    
+    # atmosphere (get_local_atm_properties for every member at once)
+    high = altitude_edl > planet['altitude_threshold']
+    temperature = np.where(high, planet['high_altitude']['temperature'](altitude_edl), planet['low_altitude']['temperature'](altitude_edl))
+    pressure = np.where(high, planet['high_altitude']['pressure'](altitude_edl), planet['low_altitude']['pressure'](altitude_edl))
+    density = planet['density'](temperature, pressure)
+    
+    # current mass (get_mass_edl)
+    edl_mass = p['m_fixed'] + y[:, 2] + np.where(mode['parachute_ejected'], 0.0, p['m_parachute']) + \
+               np.where(mode['heat_shield_ejected'], 0.0, p['m_heat_shield'])
+    
+    # forces except thrust: gravity, buoyancy, drag
+    ACd = np.where(mode['heat_shield_ejected'], p['ACd_sky_crane'], p['ACd_heat_shield']) + \
+          np.where(mode['parachute_ejected'], 0.0, p['ACd_parachute'])
+    F_ext = edl_mass*g + np.sign(g)*g*density*p['volume'] + 0.5*density*vel_edl**2*ACd
+    
+    # thrust of the three rocket regimes
+    uncontrolled = mode['rocket_on'] & ~mode['speed_control'] & ~mode['position_control']
+    speed = mode['rocket_on'] & mode['speed_control']
+    position = mode['rocket_on'] & ~mode['speed_control'] & mode['position_control']
+    
+    e_vel = p['target_velocity'] - vel_edl
+    F_speed = ((p['Kp_speed']*e_vel + p['Kd_speed']*(F_ext/edl_mass) + p['Ki_speed']*y[:, 3]) - edl_mass*g)/(1 - p['Kd_speed']/edl_mass)
+    
+    e_pos = p['target_altitude'] - altitude_edl
+    F_position = p['num_rockets']*(p['Kp_position']*e_pos - p['Kd_position']*vel_edl + p['Ki_position']*y[:, 4]) - g*edl_mass
+    
+    F_thrust = np.select([uncontrolled, speed, position],
+                         [0.9*p['max_thrust'],
+                          np.clip(F_speed, p['min_thrust'], p['max_thrust']),
+                          np.clip(F_position, p['min_thrust'], p['max_thrust'])],
+                         default=0.0)
+    
+    f = np.zeros_like(y)
+    f[:, 0] = (F_ext + F_thrust)/edl_mass
+    f[:, 1] = vel_edl
+    f[:, 2] = -F_thrust/p['exhaust_velocity']
+    f[:, 3] = np.where(speed, e_vel, 0.0)
+    f[:, 4] = np.where(position, e_pos, 0.0)
+    f[:, 6] = np.where(mode['sky_crane'], p['crane_velocity'], 0.0)
+    
+    return f
+
+def _edl_ensemble_events(y, p, mode, mission_events):
+    
+    # Event functions of edl_events for every member, written so that each
+    # event is a crossing from > 0 to <= 0. Events that edl_events switches
+    # off with its 999999 offset are +inf.
+    
+    vel_edl = y[:, 0]
+    altitude_edl = y[:, 1]
+    
+    def active(g, off):
+        return np.where(off, np.inf, g)
+    
+    return np.column_stack([active(altitude_edl - mission_events['alt_heatshield_eject'], mode['heat_shield_ejected']),
+                            active(altitude_edl - mission_events['alt_parachute_eject'], mode['parachute_ejected']),
+                            active(altitude_edl - mission_events['alt_rockets_on'], mode['rocket_on']),
+                            active(altitude_edl - mission_events['alt_skycrane_on'], mode['sky_crane']),
+                            y[:, 2],
+                            altitude_edl,
+                            active(3*p['target_velocity'] - vel_edl, mode['speed_control']),
+                            active(altitude_edl - 1.2*mission_events['alt_skycrane_on'], mode['position_control']),
+                            altitude_edl + y[:, 6]])
+
+def _edl_ensemble_event_rates(f):
+    
+    # Time derivatives of the event functions (they are linear in the 
+    # state) for state derivatives f.
+    
+    return np.column_stack([f[:, 1], f[:, 1], f[:, 1], f[:, 1], f[:, 2], f[:, 1], -f[:, 0], f[:, 1], f[:, 1] + f[:, 6]])
+
+def _edl_ensemble_locate(y0, f0, y1, f1, g0, g1, t0, h, crossed):
+    
+    # First event of each member within its step. Along the cubic Hermite
+    # interpolant through (y0, f0) and (y1, f1) every event function is 
+    # itself a cubic Hermite polynomial (through g0, g1 and the event 
+    # rates), which is bisected for each crossed event; the earliest one 
+    # wins. Returns the event state (on the far side of the crossing, so 
+    # the event does not fire again on restart), the event time and the
+    # event number.
+    
+    m = len(t0)
+    H = h[:, None]
+    g0 = np.where(crossed, g0, 1.0)
+    g1 = np.where(crossed, g1, 0.0)
+    d0 = H*_edl_ensemble_event_rates(f0)
+    d1 = H*_edl_ensemble_event_rates(f1)
+    
+    lo = np.zeros(crossed.shape)
+    hi = np.ones(crossed.shape)
+    for _ in range(50):
+        s = 0.5*(lo + hi)
+        s2 = s*s
+        s3 = s2*s
+        g = (2*s3 - 3*s2 + 1)*g0 + (s3 - 2*s2 + s)*d0 + (3*s2 - 2*s3)*g1 + (s3 - s2)*d1
+        above = g > 0
+        lo = np.where(above, s, lo)
+        hi = np.where(above, hi, s)
+    
+    theta = np.where(crossed, hi, np.inf)
+    event = np.argmin(theta, axis=1)
+    s = theta[np.arange(m), event][:, None]
+    s2 = s*s
+    s3 = s2*s
+    y_event = (2*s3 - 3*s2 + 1)*y0 + (s3 - 2*s2 + s)*H*f0 + (3*s2 - 2*s3)*y1 + (s3 - s2)*H*f1
+    
+    return y_event, t0 + s[:, 0]*h, event
+
+# Dormand-Prince 5(4) coefficients (the pair used by solve_ivp's RK45)
+_DOPRI_A = [[1/5],
+            [3/40, 9/40],
+            [44/45, -56/15, 32/9],
+            [19372/6561, -25360/2187, 64448/6561, -212/729],
+            [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656]]
+_DOPRI_B = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84])
+_DOPRI_E = np.array([-71/57600, 0, 71/16695, -71/1920, 17253/339200, -22/525, 1/40])
+
+def simulate_edl_ensemble(batch, planet, mission_events, tmax, rtol=1e-8, atol=1e-8, max_step=np.inf):
+    # simulate_edl_ensemble
     #
-    # Unpack the edl-related design variables and update the struct
-    edl_system['parachute']['diameter'] = x[0]
-    edl_system['rocket']['fuel_mass'] = x[4]
-    edl_system['rocket']['initial_fuel_mass'] = x[4]
-    edl_system['rover']['wheel_assembly']['wheel']['radius'] = x[1]
-    edl_system['rover']['chassis']['mass'] = x[2]
-    edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear'] = x[3]
+    # Simulates all members of an EDL parameter study (stack_edl_params) at
+    # once. The state is an N x 7 array with the simulate_edl columns and
+    # the mode flags (heat shield / parachute ejected, rockets, speed and
+    # position control, sky crane) are boolean arrays, so drag, thrust and
+    # the PID laws are evaluated for all members together. The dynamics,
+    # events and event actions are those of edl_dynamics, edl_events and
+    # update_edl_state (without the ITER_INFO printout).
     #
-    [time_edl_run,_,edl_system] = simulate_edl(edl_system,planet,mission_events,tmax,False)
-    time_edl = time_edl_run[-1]
+    # Every member has its own time and step size (Dormand-Prince 5(4) with
+    # error control, like solve_ivp's RK45). Events are located per member
+    # on the cubic Hermite interpolant of the step; the member restarts
+    # from the event state in its new mode, or stops if the event ends the
+    # descent. Finished members are dropped from the remaining steps.
     #
-    # *****************
+    # Returns a dict of per-member arrays: time_edl, state (N x 7 final
+    # state), velocity, altitude, fuel_mass, rover_touchdown_speed (NaN if
+    # the rover never touched down), on_ground, landing_success, crashed,
+    # out_of_fuel and control_failure (altitude control reached without
+    # speed control).
+    
+    if type(batch) != dict:
+        raise Exception('batch input must be a dict')
+    if type(planet) != dict:
+        raise Exception('planet input must be a dict')
+    if type(mission_events) != dict:
+        raise Exception('mission_events input must be a dict')
+    if max_step <= 0:
+        raise Exception('max_step must be a positive number')
+    if rtol <= 0 or atol <= 0:
+        raise Exception('rtol and atol must be positive numbers')
+    
+    n = batch['n']
+    tmax = float(tmax)
+    
+    t_end = np.full(n, tmax)
+    y_end = batch['y0'].copy()
+    touchdown_speed = np.full(n, np.nan)
+    on_ground = np.zeros(n, dtype=bool)
+    success = np.zeros(n, dtype=bool)
+    crashed = np.zeros(n, dtype=bool)
+    out_of_fuel = np.zeros(n, dtype=bool)
+    control_failure = np.zeros(n, dtype=bool)
+    
+    idx = np.arange(n)
+    p = _edl_ensemble_members(batch, idx)
+    mode = {flag : batch['mode'][flag].copy() for flag in batch['mode']}
+    ys = batch['y0'].copy()
+    t = np.zeros(n)
+    h = np.full(n, min(max_step, 0.1))
+    f = _edl_ensemble_rhs(ys, p, mode, planet)
+    g_prev = _edl_ensemble_events(ys, p, mode, mission_events)
+    
+    while len(idx) > 0:
+        h = np.minimum(h, tmax - t)
+        H = h[:, None]
+    
+        # Dormand-Prince step for the running members
+        K = [f]
+        for a in _DOPRI_A:
+            dy = a[0]*K[0]
+            for jj in range(1, len(a)):
+                dy = dy + a[jj]*K[jj]
+            K.append(_edl_ensemble_rhs(ys + H*dy, p, mode, planet))
+        y_new = ys + H*sum(b*k for b, k in zip(_DOPRI_B, K) if b != 0)
+        f_new = _edl_ensemble_rhs(y_new, p, mode, planet)
+        K.append(f_new)
+    
+        scale = atol + rtol*np.maximum(np.abs(ys), np.abs(y_new))
+        err = np.sqrt(np.mean((H*sum(e*k for e, k in zip(_DOPRI_E, K) if e != 0)/scale)**2, axis=1))
+        accepted = err <= 1
+        h_next = np.minimum(max_step, h*np.clip(0.9*np.maximum(err, 1e-10)**-0.2, 0.2, 10.0))
+        if np.any(h_next[~accepted] < 1e-12*np.maximum(1.0, t[~accepted])):
+            raise Exception('simulate_edl_ensemble: step size too small')
+    
+        # events crossed within the accepted steps
+        g_new = _edl_ensemble_events(y_new, p, mode, mission_events)
+        crossed = accepted[:, None] & (g_prev > 0) & (g_new <= 0)
+        hit = np.flatnonzero(np.any(crossed, axis=1))
+        
+        y_old = ys
+        f_old = f
+        g_old = g_prev.copy()
+        t_old = t.copy()
+        
+        ok = np.flatnonzero(accepted)
+        ys = ys.copy()
+        ys[ok] = y_new[ok]
+        f = f.copy()
+        f[ok] = f_new[ok]
+        t[ok] = t[ok] + h[ok]
+        g_prev[ok] = g_new[ok]
+        h_step = h
+        h = h_next
+        done = np.zeros(len(idx), dtype=bool)
+        
+        if len(hit) > 0:
+            ys[hit], t[hit], ev = _edl_ensemble_locate(y_old[hit], f_old[hit], y_new[hit], f_new[hit],
+                                                       g_old[hit], g_new[hit], t_old[hit], h_step[hit], crossed[hit])
+            
+            # event actions (update_edl_state)
+            for flag, event in [('heat_shield_ejected', 0), ('parachute_ejected', 1), ('rocket_on', 2)]:
+                mode[flag][hit[ev == event]] = True
+            
+            sel = hit[ev == 3]
+            mode['sky_crane'][sel] = mode['sky_crane'][sel] | mode['position_control'][sel]
+            ys[sel, 5] = p['crane_velocity'][sel]
+            
+            sel = hit[(ev == 4) & mode['rocket_on'][hit]]
+            mode['rocket_on'][sel] = False
+            ys[sel, 2] = 0.0
+            out_of_fuel[idx[sel]] = True
+            done[sel] = True
+            
+            sel = hit[ev == 5]
+            crashed[idx[sel]] = True
+            done[sel] = True
+            
+            sel = hit[ev == 6]
+            mode['speed_control'][sel] = True
+            ys[sel, 3] = 0.0
+            ys[sel, 4] = 0.0
+            
+            sel = hit[ev == 7]
+            switch = mode['speed_control'][sel] & ~mode['position_control'][sel]
+            mode['speed_control'][sel[switch]] = False
+            mode['position_control'][sel[switch]] = True
+            control_failure[idx[sel[~switch]]] = True
+            done[sel[~switch]] = True
+            
+            sel = hit[ev == 8]
+            speed = ys[sel, 0] + ys[sel, 5]
+            touchdown_speed[idx[sel]] = speed
+            on_ground[idx[sel]] = True
+            success[idx[sel]] = (ys[sel, 1] >= p['danger_altitude'][sel]) & (np.abs(speed) <= np.abs(p['danger_speed'][sel]))
+            done[sel] = True
+            
+            # restart the members that carry on from the event state
+            f[hit] = _edl_ensemble_rhs(ys[hit], {field : p[field][hit] for field in p},
+                                       {flag : mode[flag][hit] for flag in mode}, planet)
+            g_prev[hit] = _edl_ensemble_events(ys[hit], {'target_velocity' : p['target_velocity'][hit]},
+                                               {flag : mode[flag][hit] for flag in mode}, mission_events)
+        
+        # members that reached tmax run out of time like simulate_edl does
+        done = done | (t >= tmax)
+        if np.any(done):
+            y_end[idx[done]] = ys[done]
+            t_end[idx[done]] = t[done]
+            keep = ~done
+            idx = idx[keep]
+            ys = ys[keep]
+            f = f[keep]
+            t = t[keep]
+            h = h[keep]
+            g_prev = g_prev[keep]
+            mode = {flag : mode[flag][keep] for flag in mode}
+            p = _edl_ensemble_members(batch, idx)
+    
+    outcome = {'time_edl' : t_end,
+               'state' : y_end,
+               'velocity' : y_end[:, 0],
+               'altitude' : y_end[:, 1],
+               'fuel_mass' : y_end[:, 2],
+               'rover_touchdown_speed' : touchdown_speed,
+               'on_ground' : on_ground,
+               'landing_success' : success,
+               'crashed' : crashed,
+               'out_of_fuel' : out_of_fuel,
+               'control_failure' : control_failure}
+    
+    return outcome
+    
+# design vector layout shared by the objective, the constraints and the
+# evaluation cache (see opt_edl_sys.py)
+#   x[0] parachute diameter [m]
+#   x[1] wheel radius [m]
+#   x[2] chassis mass [kg]
+#   x[3] speed reducer gear diameter (d2) [m]
+#   x[4] rocket fuel mass [kg]
 
-    
-    # *****************
-    # RUNNING THE ROVER SIMULATION
+# Paths into the edl_system dict that either hold design variables or
+# simulation state. They are left out of the configuration fingerprint so
+# that two calls differing only in x (or in leftover state from an earlier
+# run) map to the same fixed configuration.
+_FINGERPRINT_SKIP = {('altitude',), ('velocity',), ('rover_touchdown_speed',),
+                     ('team_name',), ('team_number',),
+                     ('parachute', 'diameter'), ('parachute', 'deployed'),
+                     ('parachute', 'ejected'),
+                     ('heat_shield', 'ejected'),
+                     ('rocket', 'on'), ('rocket', 'fuel_mass'),
+                     ('rocket', 'initial_fuel_mass'), ('rocket', 'control'),
+                     ('speed_control', 'on'), ('position_control', 'on'),
+                     ('sky_crane', 'on'),
+                     ('rover', 'on_ground'), ('rover', 'telemetry'),
+                     ('rover', 'velocity'), ('rover', 'position'),
+                     ('rover', 'wheel_assembly', 'wheel', 'radius'),
+                     ('rover', 'wheel_assembly', 'speed_reducer', 'diam_gear'),
+                     ('rover', 'chassis', 'mass'),
+                     ('rover', 'chassis', 'strength')}
+
+def _config_repr(obj, path=(), skip=frozenset()):
+
+    # Builds a canonical (sorted, type-stable) string describing a nested
+    # dict of parameters. Used only to fingerprint the fixed configuration.
+
+    if isinstance(obj, dict):
+        items = []
+        for key in sorted(obj.keys(), key=str):
+            if path + (key,) in skip:
+                continue
+            items.append('{}:{}'.format(key, _config_repr(obj[key], path + (key,), skip)))
+        return '{' + ','.join(items) + '}'
+    elif isinstance(obj, np.ndarray):
+        return 'a' + repr(np.asarray(obj, dtype=float).ravel().tolist())
+    elif isinstance(obj, (list, tuple)):
+        return '[' + ','.join(_config_repr(v, path, skip) for v in obj) + ']'
+    elif isinstance(obj, (bool, np.bool_)):
+        return repr(bool(obj))
+    elif isinstance(obj, (int, float, np.integer, np.floating)):
+        return repr(float(obj))
+    elif callable(obj):
+        return getattr(obj, '__qualname__', 'callable')
+    else:
+        return repr(obj)
+
+# Bumped whenever the mission model itself changes (so results stored by an
+# older model are not reused). 2: rover battery energy integrated as a state.
+# 3: rover mission stops when the battery is depleted. 4: battery power
+# from the tabulated efficiency map. 5: per-phase EDL and rover step 
+# policies. 6: analytic Jacobian in the default rover step policy.
+_MISSION_MODEL_VERSION = 6
+
+def get_config_fingerprint(edl_system, planet, mission_events, tmax, experiment, end_event):
+
+    # get_config_fingerprint
     #
-    edl_system['rover'] = simulate_rover(edl_system['rover'],planet,experiment,end_event)
-    time_rover = edl_system['rover']['telemetry']['completion_time']
+    # Returns a short hex string identifying everything a mission evaluation
+    # depends on EXCEPT the design vector: motor, battery and chassis
+    # choices, the remaining edl_system constants, the planet, the mission
+    # events, tmax and the rover experiment/end_event definitions.
     #
-    # ****************
-    
-    
-    # ******************
-    # CALCULATE TOTAL TIME
-    # **
-    total_time = time_edl + time_rover
-    
-    return total_time  
-        
-def constraints_edl_system(x,edl_system,planet,mission_events,tmax,experiment,end_event,min_strength,max_rover_velocity,max_cost,max_batt_energy_per_meter):
-    # constraints_edl_system
+    # The planet dict holds functions (atmosphere model), so it is
+    # fingerprinted through its constants plus the atmosphere it produces at
+    # a handful of sample altitudes.
+
+    atm = [get_local_atm_properties(planet, h) for h in (0.0, 2500.0, 5000.0, 7000.0, 9000.0, 11000.0)]
+    planet_repr = _config_repr({'g' : planet['g'],
+                                'altitude_threshold' : planet['altitude_threshold'],
+                                'atmosphere' : [[float(v) for v in row] for row in atm]})
+
+    text = '|'.join([repr(_MISSION_MODEL_VERSION),
+                     _config_repr(edl_system, skip=_FINGERPRINT_SKIP),
+                     planet_repr,
+                     _config_repr(mission_events),
+                     repr(float(tmax)),
+                     _config_repr(experiment),
+                     _config_repr(end_event)])
+
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+# scalar mission outcomes kept by the evaluation cache and the on-disk store
+_RESULT_FIELDS = ['time_edl', 'time_rover', 'total_time', 'edl_velocity',
+                  'rover_touchdown_speed', 'distance_traveled', 'battery_energy',
+                  'energy_per_distance', 'chassis_strength', 'cost', 'wall_time']
+
+# Same idea as _FINGERPRINT_SKIP, but relative to the rover dict.
+_ROVER_FINGERPRINT_SKIP = {('on_ground',), ('telemetry',), ('velocity',), ('position',),
+                           ('wheel_assembly', 'wheel', 'radius'),
+                           ('wheel_assembly', 'speed_reducer', 'diam_gear'),
+                           ('chassis', 'mass'), ('chassis', 'strength')}
+
+def get_rover_fingerprint(rover, planet, experiment, end_event):
+
+    # get_rover_fingerprint
     #
-    # This function evaluates the nonlinear constraints for the optimization
-    # problem to maximize speed (minimize time)
+    # Like get_config_fingerprint, but only for what simulate_rover depends
+    # on: the rover (minus the rover design variables), the planet gravity
+    # and the experiment/end_event definitions. Parachute diameter and
+    # rocket fuel mass do not enter the rover mission.
+
+    text = '|'.join([repr(_MISSION_MODEL_VERSION),
+                     _config_repr(rover, skip=_ROVER_FINGERPRINT_SKIP),
+                     repr(float(planet['g'])),
+                     _config_repr(experiment),
+                     _config_repr(end_event)])
+
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def define_eval_store(path):
+
+    # define_eval_store
     #
-    # To evaluate the constraints entails simulating both the edl system and the
-    # rover. Thus, this function calls simulate_edl and simulate_rover.
+    # Opens (creating if needed) an SQLite file that records every evaluated
+    # design together with its mission outcomes, so repeated and multi-start
+    # optimizer runs can reuse earlier simulations. Returns a dict holding the
+    # path; a connection is opened per access so the dict stays picklable.
     #
+    # Each row stores the configuration fingerprint, the design vector x, the
+    # motor/battery/chassis choices (for browsing the file by hand) and the
+    # fields in _RESULT_FIELDS.
 
-    edl_system = redefine_edl_system(edl_system)
-    
-    # CONSTRAINTS_EDL_SYSTEM
-    # 
-    
-    # edl_system=define_chassis(edl_system,'steel');
-    # edl_system=define_motor(edl_system,'speed');
-    # edl_system=define_batt_pack(edl_system,'LiFePO4',10);
-    
-    
-    # ****************
-    # RUNNING THE EDL SIMULATION
-    # **
+    if type(path) != str or len(path) == 0:
+        raise Exception('define_eval_store: path must be a non-empty string')
+
+    columns = ', '.join('{} REAL'.format(field) for field in _RESULT_FIELDS)
+    with sqlite3.connect(path, timeout=30) as con:
+        con.execute('CREATE TABLE IF NOT EXISTS evaluations ('
+                    'fingerprint TEXT, x0 REAL, x1 REAL, x2 REAL, x3 REAL, x4 REAL, '
+                    'motor_type TEXT, battery_type TEXT, num_modules INTEGER, chassis_type TEXT, '
+                    + columns + ', created REAL, '
+                    'PRIMARY KEY (fingerprint, x0, x1, x2, x3, x4))')
+    con.close()
+
+    store = {'path' : os.path.abspath(path)}
+
+    return store
+
+def store_lookup(store, fingerprint, x):
+
+    # Returns the stored results dict for (fingerprint, x) or None.
+
+    con = sqlite3.connect(store['path'], timeout=30)
+    try:
+        row = con.execute('SELECT ' + ', '.join(_RESULT_FIELDS) + ' FROM evaluations '
+                          'WHERE fingerprint=? AND x0=? AND x1=? AND x2=? AND x3=? AND x4=?',
+                          (fingerprint,) + tuple(x)).fetchone()
+    finally:
+        con.close()
+
+    if row is None:
+        return None
+
+    # SQLite keeps NaN as NULL
+    results = {field : (np.nan if value is None else float(value)) for field, value in zip(_RESULT_FIELDS, row)}
+
+    return results
+
+def store_insert(store, fingerprint, x, edl_system, results):
+
+    # Records one evaluated design in the store (replacing any earlier row
+    # for the same fingerprint and x).
+
+    rover = edl_system['rover']
+    battery = rover['power_subsys'].get('battery', {})
+    row = ((fingerprint,) + tuple(x) +
+           (rover['wheel_assembly']['motor'].get('type'),
+            battery.get('battery_type'),
+            battery.get('num_modules'),
+            rover['chassis'].get('type')) +
+           tuple(results[field] for field in _RESULT_FIELDS) +
+           (time.time(),))
+
+    con = sqlite3.connect(store['path'], timeout=30)
+    try:
+        with con:
+            con.execute('INSERT OR REPLACE INTO evaluations VALUES (' + ', '.join(['?']*len(row)) + ')', row)
+    finally:
+        con.close()
+
+    return store
+
+def define_eval_cache(maxsize=256, store_path=None):
+
+    # define_eval_cache
     #
-    # Unpack the edl-related design variables and update the struct
+    # Returns a dict used as a bounded LRU cache of mission evaluations. One
+    # cache is meant to be shared by obj_fun_time and constraints_edl_system
+    # so that the coupled EDL + rover mission runs once per distinct design.
+    # If store_path is given, the cache is backed by an on-disk store (see
+    # define_eval_store) that is consulted on a miss and updated after every
+    # simulation, so results survive between optimizer runs.
+    #
+    # Fields:
+    #   entries       OrderedDict of (fingerprint, x) -> results dict
+    #   maxsize       max number of entries kept (least recently used dropped)
+    #   store         on-disk store dict, or None
+    #   hits          number of evaluations served from memory
+    #   store_hits    number of evaluations served from the on-disk store
+    #   misses        number of evaluations that had to be simulated
+    #   sim_time      wall time spent simulating misses [s]
+    #   saved_time    wall time the hits would have cost to simulate [s]
+    #
+    # Rover sub-results (keyed on the rover fingerprint and x[1:4] only, so
+    # moves in parachute diameter or fuel mass reuse the rover mission):
+    #   rover_entries     OrderedDict of (fingerprint, x[1:4]) -> rover results
+    #   rover_hits        rover missions served from memory
+    #   rover_misses      rover missions that had to be simulated
+    #   rover_saved_time  wall time the rover hits would have cost [s]
+
+    if maxsize % 1 != 0 or maxsize <= 0:
+        raise Exception('define_eval_cache: maxsize must be a positive integer')
+
+    if store_path is None:
+        store = None
+    else:
+        store = define_eval_store(store_path)
+
+    cache = {'entries' : OrderedDict(),
+             'maxsize' : int(maxsize),
+             'store' : store,
+             'hits' : 0,
+             'store_hits' : 0,
+             'misses' : 0,
+             'sim_time' : 0.0,
+             'saved_time' : 0.0,
+             'rover_entries' : OrderedDict(),
+             'rover_hits' : 0,
+             'rover_misses' : 0,
+             'rover_saved_time' : 0.0}
+
+    return cache
+
+# cache used by obj_fun_time/constraints_edl_system when none is passed in
+_default_eval_cache = define_eval_cache()
+
+def get_eval_cache_stats(cache=None):
+
+    # Returns a summary of the cache counters (hits, misses, size, hit rate
+    # and wall time spent/saved) for reporting after an optimizer run.
+
+    if cache is None:
+        cache = _default_eval_cache
+
+    calls = cache['hits'] + cache['store_hits'] + cache['misses']
+    stats = {'hits' : cache['hits'],
+             'store_hits' : cache['store_hits'],
+             'misses' : cache['misses'],
+             'size' : len(cache['entries']),
+             'maxsize' : cache['maxsize'],
+             'hit_rate' : (cache['hits'] + cache['store_hits'])/calls if calls > 0 else 0.0,
+             'sim_time' : cache['sim_time'],
+             'saved_time' : cache['saved_time'],
+             'rover_hits' : cache['rover_hits'],
+             'rover_misses' : cache['rover_misses'],
+             'rover_saved_time' : cache['rover_saved_time']}
+
+    return stats
+
+def clear_eval_cache(cache=None):
+
+    # Empties the in-memory cache and resets its counters. The on-disk store
+    # (if any) is left untouched.
+
+    if cache is None:
+        cache = _default_eval_cache
+
+    cache['entries'].clear()
+    cache['hits'] = 0
+    cache['store_hits'] = 0
+    cache['misses'] = 0
+    cache['sim_time'] = 0.0
+    cache['saved_time'] = 0.0
+    cache['rover_entries'].clear()
+    cache['rover_hits'] = 0
+    cache['rover_misses'] = 0
+    cache['rover_saved_time'] = 0.0
+
+    return cache
+
+def evaluate_rover(rover,planet,experiment,end_event,cache=None):
+
+    # evaluate_rover
+    #
+    # Runs (or fetches from the cache's rover sub-cache) the rover mission
+    # and returns its scalar outcomes: completion_time, distance_traveled,
+    # battery_energy, energy_per_distance and wall_time. The key only holds
+    # the rover-relevant design variables (wheel radius, chassis mass, gear
+    # diameter) plus the rover fingerprint.
+    #
+    # With cache=None the rover is always simulated.
+
+    rover_key = None
+    if cache is not None:
+        rover_key = (get_rover_fingerprint(rover,planet,experiment,end_event),
+                     (float(rover['wheel_assembly']['wheel']['radius']),
+                      float(rover['chassis']['mass']),
+                      float(rover['wheel_assembly']['speed_reducer']['diam_gear'])))
+        entries = cache['rover_entries']
+        if rover_key in entries:
+            entries.move_to_end(rover_key)
+            rover_results = entries[rover_key]
+            cache['rover_hits'] += 1
+            cache['rover_saved_time'] += rover_results['wall_time']
+            return rover_results
+
+    tic = time.perf_counter()
+    rover = simulate_rover(rover,planet,experiment,end_event,summary=True)
+    telemetry = rover['telemetry']
+    rover_results = {'completion_time' : float(telemetry['completion_time']),
+                     'distance_traveled' : float(telemetry['distance_traveled']),
+                     'battery_energy' : float(telemetry['battery_energy']),
+                     'energy_per_distance' : float(telemetry['energy_per_distance']),
+                     'wall_time' : time.perf_counter() - tic}
+
+    if cache is not None:
+        cache['rover_misses'] += 1
+        entries[rover_key] = rover_results
+        while len(entries) > cache['maxsize']:
+            entries.popitem(last=False)
+
+    return rover_results
+
+def simulate_mission(x,edl_system,planet,mission_events,tmax,experiment,end_event,cache=None):
+
+    # simulate_mission
+    #
+    # Runs the coupled mission (EDL followed by the rover traverse) for the
+    # design vector x and returns the scalar outcomes needed by the
+    # objective and the constraints. Whole-mission caching is done by
+    # evaluate_design; if a cache is passed here it is only used for the
+    # rover sub-results (see evaluate_rover), since the rover mission does
+    # not depend on x[0] or x[4].
+    #
+    # Note: edl_system is reset with redefine_edl_system and then modified
+    # in place, exactly as obj_fun_time always did.
+
+    edl_system = redefine_edl_system(edl_system)
+
+    # Unpack the design variables and update the struct
     edl_system['parachute']['diameter'] = x[0]
     edl_system['rocket']['fuel_mass'] = x[4]
     edl_system['rocket']['initial_fuel_mass'] = x[4]
     edl_system['rover']['wheel_assembly']['wheel']['radius'] = x[1]
     edl_system['rover']['chassis']['mass'] = x[2]
     edl_system['rover']['wheel_assembly']['speed_reducer']['diam_gear'] = x[3]
-    
 
+    # run the edl simulation (only the final time is needed, so no dense
+    # trajectory is produced)
+    [time_edl_run,_,edl_system] = simulate_edl(edl_system,planet,mission_events,tmax,False,summary=True)
+    time_edl = time_edl_run[-1]
+
+    # run the rover simulation (or reuse it)
+    rover_results = evaluate_rover(edl_system['rover'],planet,experiment,end_event,cache)
+
+    results = {'time_edl' : float(time_edl),
+               'time_rover' : rover_results['completion_time'],
+               'total_time' : float(time_edl + rover_results['completion_time']),
+               'edl_velocity' : float(edl_system['velocity']),
+               'rover_touchdown_speed' : float(edl_system.get('rover_touchdown_speed', np.nan)),
+               'distance_traveled' : rover_results['distance_traveled'],
+               'battery_energy' : rover_results['battery_energy'],
+               'energy_per_distance' : rover_results['energy_per_distance'],
+               'chassis_strength' : float(edl_system['rover']['chassis']['mass']*edl_system['rover']['chassis']['specific_strength']),
+               'cost' : float(get_cost_edl(edl_system))}
+
+    return results
+
+def evaluate_design(x,edl_system,planet,mission_events,tmax,experiment,end_event,cache=None):
+
+    # evaluate_design
     #
-    # run the edl simulation
-    _, _, edl_system = simulate_edl(edl_system,planet,mission_events,tmax,False)
-    # time_edl = time_edl_run(end);
+    # Memoized front end to simulate_mission. Results are looked up in (and
+    # stored to) the LRU cache under the key (configuration fingerprint,
+    # design vector), so the objective and the constraints evaluated at the
+    # same x share a single simulation. On a memory miss the cache's on-disk
+    # store (if any) is consulted before simulating.
+    #
+    # Returns the results dict from simulate_mission. Treat it as read-only;
+    # it is the object held in the cache.
+
+    if cache is None:
+        cache = _default_eval_cache
+
+    x = np.asarray(x, dtype=float).ravel()
+    if len(x) != 5:
+        raise Exception('evaluate_design: design vector must have 5 elements')
+
+    key = (get_config_fingerprint(edl_system,planet,mission_events,tmax,experiment,end_event),
+           tuple(float(v) for v in x))
+
+    entries = cache['entries']
+    if key in entries:
+        entries.move_to_end(key)
+        results = entries[key]
+        cache['hits'] += 1
+        cache['saved_time'] += results['wall_time']
+        return results
+
+    store = cache['store']
+    results = None
+    if store is not None:
+        results = store_lookup(store, key[0], key[1])
+
+    if results is not None:
+        cache['store_hits'] += 1
+        cache['saved_time'] += results['wall_time']
+    else:
+        tic = time.perf_counter()
+        results = simulate_mission(x,edl_system,planet,mission_events,tmax,experiment,end_event,cache)
+        results['wall_time'] = time.perf_counter() - tic
+
+        cache['misses'] += 1
+        cache['sim_time'] += results['wall_time']
+        if store is not None:
+            store_insert(store, key[0], key[1], edl_system, results)
+
+    entries[key] = results
+    while len(entries) > cache['maxsize']:
+        entries.popitem(last=False)
+
+    return results
+
+def define_eval_executor(max_workers=None):
+
+    # define_eval_executor
+    #
+    # Returns a process pool for evaluate_designs, or None (meaning "evaluate
+    # serially") when only one worker is requested or when the platform
+    # cannot fork. Forking is required because the optimizer scripts are not
+    # wrapped in  if __name__ == '__main__':  and would be re-run by every
+    # spawned worker.
+    #
+    # Remember to call executor.shutdown() when done.
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if max_workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork'))
+
+    return executor
+
+def _evaluate_design_worker(x,edl_system,planet,mission_events,tmax,experiment,end_event,rover_cache):
+
+    # Runs in a worker process: simulates one design and hands back the
+    # results together with the (possibly pre-seeded) rover sub-cache so the
+    # parent can merge it into its own cache.
+
+    tic = time.perf_counter()
+    results = simulate_mission(x,edl_system,planet,mission_events,tmax,experiment,end_event,rover_cache)
+    results['wall_time'] = time.perf_counter() - tic
+
+    return results, rover_cache
+
+def evaluate_designs(X,edl_system,planet,mission_events,tmax,experiment,end_event,cache=None,executor=None):
+
+    # evaluate_designs
+    #
+    # Evaluates a batch of design vectors (rows of X) and returns a list of
+    # results dicts in the same order. Designs already in the cache (or its
+    # on-disk store) are not simulated, duplicates within the batch are
+    # simulated once, and the remaining designs are simulated concurrently
+    # on executor (see define_eval_executor). Everything simulated by the
+    # workers is merged back into the cache.
+    #
+    # With executor=None this is just evaluate_design called row by row.
+
+    if cache is None:
+        cache = _default_eval_cache
+
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    if X.ndim != 2 or X.shape[1] != 5:
+        raise Exception('evaluate_designs: X must be an (M,5) array of design vectors')
+
+    if executor is None:
+        return [evaluate_design(x,edl_system,planet,mission_events,tmax,experiment,end_event,cache) for x in X]
+
+    fingerprint = get_config_fingerprint(edl_system,planet,mission_events,tmax,experiment,end_event)
+    rover_fingerprint = get_rover_fingerprint(edl_system['rover'],planet,experiment,end_event)
+
+    # sort the batch into cached designs and designs that need simulating
+    entries = cache['entries']
+    results = [None]*len(X)
+    pending = OrderedDict()
+    for i, x in enumerate(X):
+        key = (fingerprint, tuple(float(v) for v in x))
+        if key in pending:
+            pending[key].append(i)
+        elif key in entries:
+            entries.move_to_end(key)
+            results[i] = entries[key]
+            cache['hits'] += 1
+            cache['saved_time'] += results[i]['wall_time']
+        else:
+            stored = None
+            if cache['store'] is not None:
+                stored = store_lookup(cache['store'], key[0], key[1])
+            if stored is not None:
+                results[i] = stored
+                entries[key] = stored
+                cache['store_hits'] += 1
+                cache['saved_time'] += stored['wall_time']
+            else:
+                pending[key] = [i]
+
+    # hand the misses to the workers, passing along any rover sub-result we
+    # already have for the design
+    futures = OrderedDict()
+    for key in pending:
+        rover_cache = define_eval_cache(1)
+        rover_key = (rover_fingerprint, key[1][1:4])
+        if rover_key in cache['rover_entries']:
+            rover_cache['rover_entries'][rover_key] = cache['rover_entries'][rover_key]
+        futures[key] = executor.submit(_evaluate_design_worker, np.array(key[1]), edl_system, planet,
+                                       mission_events, tmax, experiment, end_event, rover_cache)
+
+    # collect and merge
+    for key, future in futures.items():
+        result, rover_cache = future.result()
+
+        cache['misses'] += 1
+        cache['sim_time'] += result['wall_time']
+        if cache['store'] is not None:
+            store_insert(cache['store'], key[0], key[1], edl_system, result)
+        entries[key] = result
+
+        cache['rover_hits'] += rover_cache['rover_hits']
+        cache['rover_misses'] += rover_cache['rover_misses']
+        cache['rover_saved_time'] += rover_cache['rover_saved_time']
+        for rover_key, rover_results in rover_cache['rover_entries'].items():
+            cache['rover_entries'][rover_key] = rover_results
+
+        indices = pending[key]
+        results[indices[0]] = result
+        for i in indices[1:]:
+            results[i] = result
+            cache['hits'] += 1
+            cache['saved_time'] += result['wall_time']
+
+    while len(entries) > cache['maxsize']:
+        entries.popitem(last=False)
+    while len(cache['rover_entries']) > cache['maxsize']:
+        cache['rover_entries'].popitem(last=False)
+
+    return results
+
+def fd_stencil(x, bounds=None, rel_step=None):
+
+    # fd_stencil
+    #
+    # Builds the forward-difference stencil for a design vector x: returns
+    # X, an (n+1,n) array whose first row is x and whose row i+1 is x with
+    # component i perturbed by h[i], and the step array h. Steps follow
+    # scipy's '2-point' rule (sqrt(eps)*max(1,|x_i|)); a step that would
+    # leave the upper bound of a scipy Bounds object is taken backwards.
+
+    x = np.asarray(x, dtype=float).ravel()
+
+    if rel_step is None:
+        rel_step = np.sqrt(np.finfo(float).eps)
+
+    sign_x = np.where(x >= 0, 1.0, -1.0)
+    h = rel_step*sign_x*np.maximum(1.0, np.abs(x))
+
+    if bounds is not None:
+        ub = np.broadcast_to(np.asarray(bounds.ub, dtype=float), x.shape)
+        h = np.where(x + h > ub, -h, h)
+
+    # use the step that is actually representable
+    h = (x + h) - x
+
+    X = np.vstack([x, x + np.diag(h)])
+
+    return X, h
+
+def obj_fun_time_grad(x,edl_system,planet,mission_events,tmax,experiment,end_event,cache=None,executor=None,bounds=None):
+
+    # obj_fun_time_grad
+    #
+    # Forward-difference gradient of obj_fun_time. All perturbed designs are
+    # evaluated at once through evaluate_designs, so with a process pool the
+    # n+1 missions run concurrently. The stencil stays in the cache, which
+    # makes the matching call to constraints_edl_system_jac free.
+
+    X, h = fd_stencil(x, bounds)
+    results = evaluate_designs(X,edl_system,planet,mission_events,tmax,experiment,end_event,cache,executor)
+
+    f = np.array([r['total_time'] for r in results])
+    grad = (f[1:] - f[0])/h
+
+    return grad
+
+def constraints_edl_system_jac(x,edl_system,planet,mission_events,tmax,experiment,end_event,min_strength,max_rover_velocity,max_cost,max_batt_energy_per_meter,cache=None,executor=None,bounds=None):
+
+    # constraints_edl_system_jac
+    #
+    # Forward-difference Jacobian of constraints_edl_system, shape
+    # (number of constraints, number of design variables). Uses the same
+    # stencil as obj_fun_time_grad.
+
+    X, h = fd_stencil(x, bounds)
+    results = evaluate_designs(X,edl_system,planet,mission_events,tmax,experiment,end_event,cache,executor)
+
+    C = np.array([constraints_from_results(r,end_event,min_strength,max_rover_velocity,max_cost,max_batt_energy_per_meter) for r in results])
+    jac = ((C[1:] - C[0])/h[:, None]).T
+
+    return jac
+
+def obj_fun_time_population(X,edl_system,planet,mission_events,tmax,experiment,end_event,cache=None,executor=None):
+
+    # obj_fun_time_population
+    #
+    # Vectorized objective for differential_evolution(..., vectorized=True).
+    # X has scipy's vectorized layout, shape (5, S) with one design per
+    # column (a plain design vector of shape (5,) is also accepted). Returns
+    # the S total mission times. The population is evaluated through
+    # evaluate_designs, so members are simulated concurrently on executor
+    # and the results are shared with constraints_edl_system_population.
+
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        return obj_fun_time(X,edl_system,planet,mission_events,tmax,experiment,end_event,cache)
+
+    results = evaluate_designs(X.T,edl_system,planet,mission_events,tmax,experiment,end_event,cache,executor)
+    f = np.array([r['total_time'] for r in results])
+
+    return f
+
+def constraints_edl_system_population(X,edl_system,planet,mission_events,tmax,experiment,end_event,min_strength,max_rover_velocity,max_cost,max_batt_energy_per_meter,cache=None,executor=None):
+
+    # constraints_edl_system_population
+    #
+    # Vectorized counterpart of constraints_edl_system for
+    # differential_evolution(..., vectorized=True): X has shape (5, S) and
+    # the return value has shape (number of constraints, S). A single design
+    # vector of shape (5,) gives the usual constraint vector.
+
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        return constraints_edl_system(X,edl_system,planet,mission_events,tmax,experiment,end_event,min_strength,max_rover_velocity,max_cost,max_batt_energy_per_meter,cache)
+
+    results = evaluate_designs(X.T,edl_system,planet,mission_events,tmax,experiment,end_event,cache,executor)
+    C = np.array([constraints_from_results(r,end_event,min_strength,max_rover_velocity,max_cost,max_batt_energy_per_meter) for r in results])
+
+    return C.T
+
+def obj_fun_time(x,edl_system,planet,mission_events,tmax,experiment,end_event,cache=None):
+    # OBJ_FUN_TIME
+    # 
+    # This function runs both simulations -- edl and rover -- to get a total
+    # time to land and travel the specified terrain. 
+    #
+    # The simulations go through evaluate_design, so a design that has
+    # already been evaluated (e.g., by constraints_edl_system at the same x)
+    # is served from the evaluation cache instead of being simulated again.
     #
-    # *****************
     
     
-    # *****************
-    # RUNNING THE ROVER SIMULATION
-    # **
-    #
-    # run the rover simulation
-    edl_system['rover'] = simulate_rover(edl_system['rover'],planet,experiment,end_event)
-    # time_rover = edl_system.rover.telemetry.completion_time;
+    # Note: Although edl_system is modified in this function, the modifications
+    # are lost after the function terminates because the struct is not a
+    # returned argument and is not a global variable. Thus, we only ever are
+    # modifying a local copy.
     #
     
-    # *****************
-    # EVALUATE THE CONSTRAINT FUNCTIONS
+    results = evaluate_design(x,edl_system,planet,mission_events,tmax,experiment,end_event,cache)
+    
+    # ******************
+    # CALCULATE TOTAL TIME
     # **
+    total_time = results['total_time']
+    
+    return total_time  
+
+def constraints_from_results(results,end_event,min_strength,max_rover_velocity,max_cost,max_batt_energy_per_meter):
+    # constraints_from_results
+    #
+    # Evaluates the (normalized) constraint vector from a results dict
+    # produced by evaluate_design/simulate_mission.
+    #
     # Note: some of the following simply normalizes the constraints to be on
     # similar orders of magnitude.
     #
     #
     # The rover must travel the complete distance
-    constraint_distance = (end_event['max_distance']-edl_system['rover']['telemetry']['distance_traveled'])/end_event['max_distance']
+    constraint_distance = (end_event['max_distance']-results['distance_traveled'])/end_event['max_distance']
     #
     # The chassis must be strong enough to survive the landing
-    chassis_strength = edl_system['rover']['chassis']['mass']*edl_system['rover']['chassis']['specific_strength']
-    constraint_strength = -(chassis_strength-min_strength)/min_strength
+    constraint_strength = -(results['chassis_strength']-min_strength)/min_strength
     #
     # The battery must not run out of charge
-    constraint_battery  = (edl_system['rover']['telemetry']['energy_per_distance']- max_batt_energy_per_meter)/max_batt_energy_per_meter
+    constraint_battery  = (results['energy_per_distance']- max_batt_energy_per_meter)/max_batt_energy_per_meter
     #
     # The touchdown speed of the rover must not be too much (or else damage may occur) 
-    constraint_velocity = (abs(edl_system['velocity'])-abs(max_rover_velocity))/abs(max_rover_velocity)
+    constraint_velocity = (abs(results['edl_velocity'])-abs(max_rover_velocity))/abs(max_rover_velocity)
     #
     # The total cost cannot exceed our budget
-    constraint_cost = (get_cost_edl(edl_system)-max_cost)/max_cost
+    constraint_cost = (results['cost']-max_cost)/max_cost
     
     
     # *****************
@@ -1788,6 +4395,21 @@ def constraints_edl_system(x,edl_system,planet,mission_events,tmax,experiment,en
     c=[constraint_distance, constraint_strength, constraint_velocity, constraint_cost, constraint_battery]
     
     return np.array(c)
+        
+def constraints_edl_system(x,edl_system,planet,mission_events,tmax,experiment,end_event,min_strength,max_rover_velocity,max_cost,max_batt_energy_per_meter,cache=None):
+    # constraints_edl_system
+    #
+    # This function evaluates the nonlinear constraints for the optimization
+    # problem to maximize speed (minimize time)
+    #
+    # To evaluate the constraints entails simulating both the edl system and the
+    # rover. Thus, this function calls simulate_edl and simulate_rover (through
+    # evaluate_design, which shares its results with obj_fun_time).
+    #
+
+    results = evaluate_design(x,edl_system,planet,mission_events,tmax,experiment,end_event,cache)
+    
+    return constraints_from_results(results,end_event,min_strength,max_rover_velocity,max_cost,max_batt_energy_per_meter)
 
 def redefine_edl_system(edl_system):
     